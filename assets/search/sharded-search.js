@@ -0,0 +1,259 @@
+// Client for the sharded static search index written by
+// scripts/shard_search_index.py. Only the small manifest is fetched up front;
+// term shards are fetched for the prefixes a query touches, and document
+// shards only for the episodes of the top results.
+//
+// Usage:
+//   ChistaSearch.search('ذهن آگاهی', 10).then(function(response) { ... });
+// The response has the same shape as serve.py's /api/search:
+//   { query, total, results: [{ href, title, section, crumbs, score, snippet }] }
+// Snippets come from the start of each document (the shards keep a short
+// excerpt, not the whole text), so a match further in is not highlighted.
+//
+// The site's search box calls ChistaSearch.quartoItems(), which returns the
+// items Quarto's quarto-search.js renders.
+(function() {
+  const SHARD_FORMAT_VERSION = 2;
+
+  // Prefix expansions considered for the last query term
+  const MAX_PREFIX_TERMS = 64;
+
+  // Characters of context shown on each side of the first match
+  const SNIPPET_CONTEXT = 80;
+
+  // Same folding as scripts/persian_text.py
+  const FOLD = {
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک',
+    'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا', 'آ': 'ا',
+    'ۀ': 'ه', 'ة': 'ه',
+  };
+  '۰۱۲۳۴۵۶۷۸۹'.split('').forEach(function(digit, i) { FOLD[digit] = String(i); });
+  '٠١٢٣٤٥٦٧٨٩'.split('').forEach(function(digit, i) { FOLD[digit] = String(i); });
+  // Tatweel, Arabic diacritics, superscript alef, zero-width and bidi marks, BOM
+  const DROPPED = /[\u0640\u064B-\u0652\u0670\u200B-\u200F\uFEFF]/;
+  const TOKEN_PATTERN = /[\p{L}\p{N}_]+/gu;
+  const WORD_CHAR = /[\p{L}\p{N}_]/u;
+
+  function normalize(text) {
+    let result = '';
+    for (const char of text) {
+      if (DROPPED.test(char)) continue;
+      result += FOLD[char] || char;
+    }
+    return result.toLowerCase();
+  }
+
+  // Normalized text plus, for every character of it, the index of the
+  // original character it came from (for snippet highlighting)
+  function normalizeWithOffsets(text) {
+    let normalized = '';
+    const offsets = [];
+    for (let i = 0; i < text.length; i++) {
+      const folded = normalize(text[i]);
+      normalized += folded;
+      for (let j = 0; j < folded.length; j++) offsets.push(i);
+    }
+    return { normalized: normalized, offsets: offsets };
+  }
+
+  function tokenize(text) {
+    return normalize(text).match(TOKEN_PATTERN) || [];
+  }
+
+  function escapeHtml(text) {
+    return text.replace(/[&<>"']/g, function(char) {
+      return { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;' }[char];
+    });
+  }
+
+  // Resolve the index directory from this script's own URL, so the client
+  // works from any page depth
+  const scriptUrl = document.currentScript ? document.currentScript.src : window.location.href;
+  const baseUrl = new URL('.', scriptUrl);
+
+  const fetches = {};
+  function fetchJson(name) {
+    if (!fetches[name]) {
+      fetches[name] = fetch(new URL(name, baseUrl)).then(function(response) {
+        if (!response.ok) throw new Error('Failed to fetch ' + name + ': ' + response.status);
+        return response.json();
+      }).catch(function(error) {
+        delete fetches[name];
+        throw error;
+      });
+    }
+    return fetches[name];
+  }
+
+  function loadManifest() {
+    return fetchJson('manifest.json').then(function(manifest) {
+      if (manifest.version !== SHARD_FORMAT_VERSION) {
+        throw new Error('Unsupported search index version ' + manifest.version);
+      }
+      return manifest;
+    });
+  }
+
+  // Term shards that may hold a term (or, for a prefix query, any term
+  // starting with it): the longest shard prefix of the term, plus every
+  // shard whose prefix extends the term
+  function shardsFor(manifest, term, prefix) {
+    let longest = null;
+    const names = [];
+    manifest.terms.forEach(function(entry) {
+      const shardPrefix = entry[0];
+      if (term.startsWith(shardPrefix)) {
+        if (longest === null || shardPrefix.length > longest[0].length) longest = entry;
+      } else if (prefix && shardPrefix.startsWith(term)) {
+        names.push(entry[1]);
+      }
+    });
+    if (longest !== null) names.push(longest[1]);
+    return names;
+  }
+
+  function expand(shards, term, prefix) {
+    if (!prefix) {
+      for (const shard of shards) {
+        if (Object.prototype.hasOwnProperty.call(shard.terms, term)) return [[term, shard.terms[term]]];
+      }
+      return [];
+    }
+    const matches = [];
+    shards.forEach(function(shard) {
+      Object.keys(shard.terms).forEach(function(candidate) {
+        if (candidate.startsWith(term)) matches.push(candidate);
+      });
+    });
+    matches.sort();
+    return matches.slice(0, MAX_PREFIX_TERMS).map(function(candidate) {
+      for (const shard of shards) {
+        if (Object.prototype.hasOwnProperty.call(shard.terms, candidate)) return [candidate, shard.terms[candidate]];
+      }
+    });
+  }
+
+  function loadDoc(manifest, docId) {
+    for (const entry of manifest.docs) {
+      if (docId >= entry[0] && docId < entry[0] + entry[1]) {
+        return fetchJson(entry[2]).then(function(shard) { return shard.docs[docId - entry[0]]; });
+      }
+    }
+    return Promise.reject(new Error('Unknown document ' + docId));
+  }
+
+  function snippet(text, terms) {
+    const mapped = normalizeWithOffsets(text);
+    const normalized = mapped.normalized;
+    const offsets = mapped.offsets;
+    const spans = [];
+    new Set(terms).forEach(function(term) {
+      let index = normalized.indexOf(term);
+      while (index !== -1) {
+        if (index === 0 || !WORD_CHAR.test(normalized[index - 1])) spans.push([index, index + term.length]);
+        index = normalized.indexOf(term, index + 1);
+      }
+    });
+    if (spans.length === 0) return escapeHtml(text.slice(0, 2 * SNIPPET_CONTEXT));
+    spans.sort(function(a, b) { return a[0] - b[0] || a[1] - b[1]; });
+
+    const first = offsets[spans[0][0]];
+    const start = Math.max(0, first - SNIPPET_CONTEXT);
+    const end = Math.min(text.length, first + SNIPPET_CONTEXT);
+    const parts = [start > 0 ? '…' : ''];
+    let cursor = start;
+    spans.forEach(function(span) {
+      const originalStart = offsets[span[0]];
+      const originalEnd = offsets[span[1] - 1] + 1;
+      if (originalStart < cursor || originalStart >= end) return;
+      parts.push(escapeHtml(text.slice(cursor, originalStart)));
+      parts.push('<mark>' + escapeHtml(text.slice(originalStart, originalEnd)) + '</mark>');
+      cursor = originalEnd;
+    });
+    parts.push(escapeHtml(text.slice(cursor, Math.max(cursor, end))));
+    parts.push(end < text.length ? '…' : '');
+    return parts.join('').trim();
+  }
+
+  // Rank with BM25 like serve.py: every query term must match, the last one
+  // as a prefix. Postings already carry length-normalized term frequencies.
+  function search(query, limit) {
+    limit = limit || 10;
+    const queryTerms = tokenize(query);
+    if (queryTerms.length === 0) return Promise.resolve({ query: query, total: 0, results: [] });
+
+    return loadManifest().then(function(manifest) {
+      return Promise.all(queryTerms.map(function(term, position) {
+        const prefix = position === queryTerms.length - 1;
+        return Promise.all(shardsFor(manifest, term, prefix).map(fetchJson)).then(function(shards) {
+          return expand(shards, term, prefix);
+        });
+      })).then(function(expansions) {
+        const docCount = manifest.doc_count;
+        let scores = null;
+        const matchedTerms = [];
+        for (const expansion of expansions) {
+          const termScores = new Map();
+          expansion.forEach(function(match) {
+            const postings = match[1];
+            const df = postings.length / 2;
+            const idf = Math.log(1 + (docCount - df + 0.5) / (df + 0.5));
+            for (let i = 0; i < postings.length; i += 2) {
+              const score = idf * postings[i + 1];
+              if (score > (termScores.get(postings[i]) || 0)) termScores.set(postings[i], score);
+            }
+            matchedTerms.push(match[0]);
+          });
+          if (scores === null) {
+            scores = termScores;
+          } else {
+            const combined = new Map();
+            scores.forEach(function(score, docId) {
+              if (termScores.has(docId)) combined.set(docId, score + termScores.get(docId));
+            });
+            scores = combined;
+          }
+          if (scores.size === 0) return { query: query, total: 0, results: [] };
+        }
+
+        const ranked = Array.from(scores.entries()).sort(function(a, b) {
+          return b[1] - a[1] || a[0] - b[0];
+        }).slice(0, limit);
+        return Promise.all(ranked.map(function(item) {
+          return loadDoc(manifest, item[0]).then(function(doc) {
+            return {
+              href: doc.href,
+              title: doc.title,
+              section: doc.section,
+              crumbs: doc.crumbs,
+              score: Math.round(item[1] * 10000) / 10000,
+              snippet: snippet(doc.excerpt, matchedTerms),
+            };
+          });
+        })).then(function(results) {
+          return { query: query, total: scores.size, results: results };
+        });
+      });
+    });
+  }
+
+  // Results as quarto-search.js items: the href carries the query (so the
+  // target page highlights it) and the snippet uses Quarto's mark class
+  function quartoItems(query, limit, queryArg) {
+    return search(query, limit).then(function(response) {
+      return response.results.map(function(result) {
+        const parts = result.href.split('#');
+        parts[0] += (parts[0].indexOf('?') >= 0 ? '&' : '?') + queryArg + '=' + encodeURIComponent(query);
+        return {
+          title: result.title,
+          section: result.section,
+          href: parts.join('#'),
+          text: result.snippet.replace(/<mark>/g, "<mark class='search-match'>"),
+          crumbs: result.crumbs,
+        };
+      });
+    });
+  }
+
+  window.ChistaSearch = { search: search, quartoItems: quartoItems, normalize: normalize, tokenize: tokenize };
+})();
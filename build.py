@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental build of the book (output/Chista.pdf) and the website (output/site).
+
+The build is a graph of stages, each running one of the scripts/build_*.sh
+steps. A stage declares the files it reads and writes; before running it
+the inputs are fingerprinted (content hashes, with size/mtime used to avoid
+rehashing unchanged files). A stage whose fingerprint matches an earlier
+run is skipped when its outputs are still in place, or restored from the
+content-addressed cache under .cache/build/ when they are not.
+
+Stages pass results on through files, so a stage that re-runs but produces
+identical output does not invalidate the stages after it. A transcript
+edit re-renders the website only: transcripts are left out of the book, so
+neither the merged markdown nor the XeLaTeX build runs again.
+
+    python3 build.py              # build everything that is out of date
+    python3 build.py book         # just the PDF (and what it depends on)
+    python3 build.py --dry-run    # show what would run
+    python3 build.py --jobs 8     # render episodes in parallel (scripts/build_parallel.py)
+    python3 build.py --profile    # timing summary + Chrome trace (scripts/build_profile.py)
+"""
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+sys.path.insert(0, str(ROOT / 'scripts'))
+import build_profile
+from episode_metadata import file_signature
+
+# Changes whenever this file changes, so editing a stage definition re-runs it
+BUILD_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+CACHE_DIR = ROOT / '.cache' / 'build'
+OBJECTS_DIR = CACHE_DIR / 'objects'
+STAGES_FILE = CACHE_DIR / 'stages.json'
+FINGERPRINTS_FILE = CACHE_DIR / 'fingerprints.json'
+PROFILE_DIR = CACHE_DIR / 'profile'
+TRACE_FILE = CACHE_DIR / 'trace.json'
+
+# Earlier results kept per stage, so reverting an edit restores from cache
+RECORDS_PER_STAGE = 3
+
+# Generated README.md files are build intermediates, removed after the build
+README_PATTERNS = ('source/README.md', 'source/*/README.md')
+
+IMAGE_PATTERNS = ('source/**/*.png', 'source/**/*.jpg', 'source/**/*.jpeg', 'source/**/*.svg')
+
+
+class Stage:
+    """
+    A build step.
+    - inputs/outputs: glob patterns relative to the repository root ("**"
+      matches nested directories); an output ending in "/" is a directory
+      whose whole content is produced by the stage
+    - exclude: patterns removed from the inputs
+    - presence: patterns whose matching files count by existence only, for
+      inputs the stage checks for but does not read
+    - clean: files deleted before the command runs
+    - parallel_command: the per-episode variant used with --jobs (the job
+      count is appended to it)
+    """
+
+    def __init__(self, name, command, inputs, outputs, deps=(), exclude=(), presence=(), clean=(),
+                 parallel_command=None):
+        self.name = name
+        self.command = list(command)
+        self.parallel_command = list(parallel_command) if parallel_command else None
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.exclude = list(exclude)
+        self.presence = list(presence)
+        self.clean = list(clean)
+
+
+STAGES = [
+    # source/*/README.md: each episode's pages merged into callouts, for the site
+    Stage('meta', ['bash', 'scripts/build_meta_markdowns.sh'],
+          inputs=['scripts/build_meta_markdowns.sh', 'source/*/metadata.yml',
+                  'source/*/*.md', 'source/*/*.qmd',
+                  'source/*/mindmap_auto.html', 'source/*/infographic.png'],
+          exclude=list(README_PATTERNS),
+          outputs=list(README_PATTERNS)),
+    # output/Chista.md: every episode without subjects and transcripts, for the book
+    Stage('merged', ['bash', 'scripts/build_merged_markdown.sh'],
+          inputs=['scripts/build_merged_markdown.sh', 'scripts/build_parallel.py',
+                  'scripts/fix_bidi_parentheses.py',
+                  'assets/website/_quarto.yml', 'source/*/metadata.yml',
+                  'source/**/*.md', 'source/**/*.qmd', 'source/*/infographic.png',
+                  'source/*/slides.pdf', 'source/*/mindmap_auto.html'],
+          exclude=[*README_PATTERNS, 'source/**/README.md', 'source/**/*-subjects.md',
+                   'source/**/*-transcript.md'],
+          # Transcript contents stay out of the book, but each chapter links
+          # to its transcript page when 4-transcript.md exists
+          presence=['source/*/4-transcript.md'],
+          # The script appends to its output
+          clean=['output/Chista.md'],
+          parallel_command=['python3', 'scripts/build_parallel.py', 'book'],
+          outputs=['output/Chista.md']),
+    # output/Chista.pdf: Quarto + XeLaTeX
+    Stage('book', ['bash', 'scripts/build_book.sh'],
+          inputs=['scripts/build_book.sh', 'scripts/get_persian_date.py', 'scripts/jalali.py',
+                  'output/Chista.md', 'assets/book/**', 'assets/images/**', *IMAGE_PATTERNS],
+          exclude=['assets/book/_book/**', 'assets/book/.quarto/**', 'assets/book/output/**',
+                   'assets/book/persian-date.tex'],
+          deps=['merged'],
+          outputs=['output/Chista.pdf']),
+    # output/site: Quarto website plus the Python post-processing steps
+    Stage('site', ['bash', 'scripts/build_site.sh'],
+          inputs=['scripts/build_site.sh', 'scripts/*.py', 'convert.py', 'source/**',
+                  'assets/website/**', 'assets/images/**', 'assets/search/**', 'output/Chista.pdf'],
+          exclude=['assets/website/_site/**', 'assets/website/.quarto/**',
+                   'assets/website/site_libs/**', 'source/**/__pycache__/**'],
+          deps=['meta', 'book'],
+          parallel_command=['python3', 'scripts/build_parallel.py', 'site'],
+          outputs=['output/site/']),
+]
+
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def read_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class Fingerprints:
+    """Content hashes of repository files, cached by size and mtime between builds."""
+
+    def __init__(self, path=FINGERPRINTS_FILE):
+        self.path = path
+        self.signatures = read_json(path, {})
+        self.dirty = False
+
+    def hash(self, relpath):
+        """SHA-256 of a file relative to ROOT, or None if it does not exist."""
+        previous = self.signatures.get(relpath)
+        signature = file_signature(ROOT / relpath, previous)
+        if signature is None:
+            if previous is not None:
+                del self.signatures[relpath]
+                self.dirty = True
+            return None
+        if signature != previous:
+            self.signatures[relpath] = signature
+            self.dirty = True
+        return signature[2]
+
+    def save(self):
+        if self.dirty:
+            write_json(self.path, self.signatures)
+            self.dirty = False
+
+
+def expand(patterns, exclude=()):
+    """Sorted relative paths of the files matching patterns, minus excluded ones."""
+    paths = set()
+    for pattern in patterns:
+        if pattern.endswith('/'):
+            pattern += '**'
+        for match in glob.iglob(str(ROOT / pattern), recursive=True):
+            if os.path.isfile(match):
+                paths.add(Path(match).relative_to(ROOT).as_posix())
+    # fnmatch's "*" also matches "/", so "dir/**" excludes everything below dir
+    return sorted(path for path in paths
+                  if not any(fnmatch.fnmatch(path, pattern) for pattern in exclude))
+
+
+def hash_files(paths, fingerprints):
+    """Map each path to its content hash (paths that vanished are left out)."""
+    hashes = {}
+    for path in paths:
+        digest = fingerprints.hash(path)
+        if digest is not None:
+            hashes[path] = digest
+    return hashes
+
+
+def stage_inputs(stage, fingerprints):
+    """Map each input of a stage to its content hash, or to "present" for presence-only inputs."""
+    input_hashes = hash_files(expand(stage.inputs, stage.exclude), fingerprints)
+    input_hashes.update((path, 'present') for path in expand(stage.presence))
+    return input_hashes
+
+
+def stage_command(stage, jobs=None, force=False):
+    """The command a stage runs: its per-episode variant when building with --jobs."""
+    if jobs is not None and stage.parallel_command is not None:
+        # --force also bypasses the per-episode results cached by the variant
+        return stage.parallel_command + ['--jobs', str(jobs)] + (['--force'] if force else [])
+    return stage.command
+
+
+def stage_key(stage, input_hashes, jobs=None):
+    """
+    Content address of a stage run: its definition plus the hashes of its
+    inputs. The job count is left out; it does not change the result.
+    """
+    command = stage.parallel_command if jobs is not None and stage.parallel_command else stage.command
+    payload = json.dumps([BUILD_VERSION, stage.name, command, sorted(input_hashes.items())])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def object_path(digest):
+    return OBJECTS_DIR / digest[:2] / digest
+
+
+def store_outputs(outputs):
+    """Copy output files into the object store (once per distinct content)."""
+    for path, digest in outputs.items():
+        target = object_path(digest)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(target.name + '.tmp')
+            shutil.copyfile(ROOT / path, tmp_path)
+            os.replace(tmp_path, target)
+
+
+def restore_outputs(stage, outputs):
+    """
+    Put a cached result back in place. Files in the stage's output
+    directories that are not part of the result are removed.
+    """
+    for path in expand(stage.outputs):
+        if path not in outputs:
+            (ROOT / path).unlink()
+    for path, digest in outputs.items():
+        target = ROOT / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + '.tmp')
+        shutil.copyfile(object_path(digest), tmp_path)
+        os.replace(tmp_path, target)
+
+
+def describe_changes(previous_inputs, input_hashes, limit=5):
+    """Short description of which inputs differ from the previous run."""
+    if previous_inputs is None:
+        return 'no previous run'
+    changed = sorted(path for path in set(previous_inputs) | set(input_hashes)
+                     if previous_inputs.get(path) != input_hashes.get(path))
+    if not changed:
+        return 'stage definition changed'
+    more = f" and {len(changed) - limit} more" if len(changed) > limit else ''
+    return 'changed: ' + ', '.join(changed[:limit]) + more
+
+
+def resolve_order(names):
+    """The requested stages and everything they depend on, dependencies first."""
+    order = []
+
+    def visit(name, path):
+        if name in path:
+            raise ValueError(f"dependency cycle: {' -> '.join(path + [name])}")
+        if name in order:
+            return
+        for dep in STAGES_BY_NAME[name].deps:
+            visit(dep, path + [name])
+        order.append(name)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+def run_stage(stage, jobs=None, force=False):
+    for pattern in stage.clean:
+        for path in expand([pattern]):
+            (ROOT / path).unlink()
+    command = stage_command(stage, jobs, force)
+    print(f"[{stage.name}] $ {' '.join(command)}", flush=True)
+    return subprocess.run(command, cwd=ROOT).returncode == 0
+
+
+def build(names, force=False, dry_run=False, jobs=None):
+    """
+    Bring the given stages up to date. Returns True on success.
+    """
+    fingerprints = Fingerprints()
+    records = read_json(STAGES_FILE, {})
+    pending = set()  # dry run: stages that would run, so their outputs may change
+    ok = True
+
+    for name in resolve_order(names):
+        stage = STAGES_BY_NAME[name]
+        input_hashes = stage_inputs(stage, fingerprints)
+        key = stage_key(stage, input_hashes, jobs)
+        history = records.get(name, [])
+        record = next((entry for entry in history if entry['key'] == key), None)
+
+        if record is not None and not force and not pending.intersection(stage.deps):
+            current = hash_files(expand(stage.outputs), fingerprints)
+            if current == record['outputs']:
+                print(f"[{name}] up to date")
+                build_profile.cache('stage', hit=True)
+                continue
+            if all(object_path(digest).exists() for digest in record['outputs'].values()):
+                if not dry_run:
+                    with build_profile.span(name, category='stage', status='restored'):
+                        restore_outputs(stage, record['outputs'])
+                    build_profile.cache('stage', hit=True)
+                    fingerprints.dirty = True
+                print(f"[{name}] restored {len(record['outputs'])} file(s) from cache")
+                continue
+
+        reason = 'forced' if force else describe_changes(history[0]['inputs'] if history else None,
+                                                         input_hashes)
+        if dry_run:
+            waiting = pending.intersection(stage.deps)
+            if waiting:
+                reason = f"after {', '.join(sorted(waiting))}"
+            print(f"[{name}] would run ({reason})")
+            pending.add(name)
+            continue
+
+        print(f"[{name}] running ({reason})", flush=True)
+        build_profile.cache('stage', hit=False)
+        with build_profile.span(name, category='stage', status='ran', reason=reason) as info:
+            succeeded = run_stage(stage, jobs, force)
+            outputs = hash_files(expand(stage.outputs), fingerprints) if succeeded else {}
+            if build_profile.enabled():
+                info['bytes_read'] = total_size(input_hashes)
+                info['bytes_written'] = total_size(outputs)
+        if not succeeded:
+            print(f"[{name}] failed", file=sys.stderr)
+            ok = False
+            break
+        store_outputs(outputs)
+        # Inputs are only kept for the latest run, to explain the next rebuild
+        history = [{'key': key, 'inputs': input_hashes, 'outputs': outputs}] + [
+            {'key': entry['key'], 'outputs': entry['outputs']} for entry in history if entry['key'] != key
+        ]
+        records[name] = history[:RECORDS_PER_STAGE]
+        write_json(STAGES_FILE, records)
+
+    if not dry_run:
+        fingerprints.save()
+        collect_garbage(records)
+    return ok
+
+
+def total_size(paths):
+    return sum(build_profile.file_size(ROOT / path) for path in paths)
+
+
+def collect_garbage(records):
+    """Delete objects no longer referenced by any kept stage result."""
+    referenced = {digest for history in records.values() for entry in history
+                  for digest in entry['outputs'].values()}
+    if not OBJECTS_DIR.exists():
+        return
+    for path in OBJECTS_DIR.glob('*/*'):
+        if path.name not in referenced:
+            path.unlink()
+
+
+def remove_readmes():
+    """Remove the README.md files build_meta_markdowns.sh generated in source/."""
+    for path in expand(README_PATTERNS):
+        (ROOT / path).unlink()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Build the book and the website, re-running only the stages whose inputs changed.')
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"Stages to build (default: all). One of: {', '.join(STAGES_BY_NAME)}")
+    parser.add_argument('--force', action='store_true',
+                        help='Run the stages even if they are up to date')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='Only show which stages would run')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Build the site and the merged markdown one episode per task with this '
+                             'many worker processes')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record every stage and script into a Chrome trace and print a timing summary')
+    parser.add_argument('--trace', default=str(TRACE_FILE),
+                        help=f'Where --profile writes the trace (default: {TRACE_FILE.relative_to(ROOT)})')
+    parser.add_argument('--keep-readmes', action='store_true',
+                        help='Keep the generated source/**/README.md files')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    unknown = [name for name in args.stages if name not in STAGES_BY_NAME]
+    if unknown:
+        print(f"Error: Unknown stage(s): {', '.join(unknown)}", file=sys.stderr)
+        sys.exit(1)
+
+    profiling = args.profile and not args.dry_run
+    if profiling:
+        # Inherited by every stage, script and worker process
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+        os.environ[build_profile.ENV_VAR] = str(PROFILE_DIR)
+
+    names = args.stages or [stage.name for stage in STAGES]
+    with build_profile.span('build', category='build', stages=' '.join(names)):
+        ok = build(names, args.force, args.dry_run, args.jobs)
+    if not args.dry_run and not args.keep_readmes:
+        print("Cleaning up README.md files from source directory...")
+        remove_readmes()
+    if profiling:
+        build_profile.report(PROFILE_DIR, args.trace)
+    sys.exit(0 if ok else 1)
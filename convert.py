@@ -4,40 +4,47 @@ Convert mindmap.html to mindmap_auto.html with:
 1. Font-family changed to Vazirmatn
 2. Auto-fit functionality on node expand/collapse
 3. Automatic Quarto theme detection (light/dark mode)
+
+Run without arguments to convert every source/*/mindmap.html. Episodes are
+converted in parallel, and an episode is skipped when its input hash and the
+converter version match the manifest entry from the previous run.
+
+With --shared-runtime <site_dir>, the pages are written into the built site
+instead, sharing one content-hashed runtime bundle under
+site_libs/markmap-runtime/. Each page then keeps only its own mindmap data.
 """
 
+import argparse
+import hashlib
+import html
+import json
+import os
 import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent / 'scripts'))
+import build_profile
+from episode_metadata import load_index
+from html_rewrite import Diagnostic, Rewriter, Rule
 
-def convert_mindmap_to_auto_fit(input_file: str, output_file: str):
-    """
-    Convert mindmap.html to mindmap_auto.html with:
-    - Font-family changed to Vazirmatn
-    - Auto-fit on expand/collapse
-    - Automatic Quarto theme detection
-    
-    Args:
-        input_file: Path to input mindmap.html file
-        output_file: Path to output mindmap_auto.html file
-    """
-    # Read the input file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Replace font-family with Vazirmatn
-    font_family_pattern = r'html \{\s+font-family:[^;]+;\s+\}'
-    vazirmatn_font = '''html {
+
+# Hash of this file; any change to the conversion invalidates earlier outputs
+CONVERTER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+# Where the batch mode remembers what it converted
+DEFAULT_MANIFEST = Path(__file__).parent / '.cache' / 'convert-manifest.json'
+
+
+# Vazirmatn replaces the default markmap font
+VAZIRMATN_FONT = '''html {
   font-family: 'Vazirmatn', ui-sans-serif, system-ui, sans-serif;
 }'''
-    content = re.sub(font_family_pattern, vazirmatn_font, content, flags=re.DOTALL)
-    
-    # Replace the original dark mode check with Quarto theme detection
-    # Original: if (window.matchMedia("(prefers-color-scheme: dark)").matches) { ... }
-    dark_mode_pattern = r'if \(window\.matchMedia\("\(prefers-color-scheme: dark\)"\)\.matches\) \{[^}]+\}'
-    
-    # New theme detection code that works with Quarto sites
-    quarto_theme_code = '''// Quarto theme detection - automatically match parent site's theme
+
+# Theme detection code that makes the mindmap follow the Quarto site's light/dark mode
+QUARTO_THEME_CODE = '''// Quarto theme detection - automatically match parent site's theme
               const detectQuartoTheme = () => {
                 // Get the target document (parent if in iframe, otherwise current)
                 let targetDoc = document;
@@ -138,9 +145,9 @@ def convert_mindmap_to_auto_fit(input_file: str, output_file: str):
               window.matchMedia('(prefers-color-scheme: dark)').addEventListener('change', () => {
                 applyTheme(detectQuartoTheme());
               });'''
-    
-    # Auto-fit code to insert
-    auto_fit_code = '''
+
+# Auto-fit code that re-fits the mindmap whenever a node is expanded or collapsed
+AUTO_FIT_CODE = '''
               // Auto-fit functionality on node expand/collapse - fast and responsive
               setTimeout(() => {
                 if (!window.mm) return;
@@ -186,47 +193,410 @@ def convert_mindmap_to_auto_fit(input_file: str, output_file: str):
                   });
                 }
               }, 50);'''
+
+
+# Theme detection and auto-fit, inserted together
+FULL_REPLACEMENT = QUARTO_THEME_CODE + '\n' + AUTO_FIT_CODE
+
+# All edits of the self-contained conversion, applied in one scan.
+# The "insertion" group lists the insertion points in order of preference:
+# 1. Replace the original dark mode check:
+#    if (window.matchMedia("(prefers-color-scheme: dark)").matches) { ... }
+# 2. Insert before the markmap call: })(() => window.markmap,null,{...})
+# 3. Insert before the last </script>
+MINDMAP_REWRITER = Rewriter([
+    Rule('font-family', r'html \{\s+font-family:[^;]+;\s+\}', VAZIRMATN_FONT, flags=re.DOTALL),
+    Rule('replace-dark-mode-check',
+         r'if \(window\.matchMedia\("\(prefers-color-scheme: dark\)"\)\.matches\) \{[^}]+\}',
+         FULL_REPLACEMENT, flags=re.DOTALL, group='insertion'),
+    Rule('before-markmap-call', r'\}\)\(\(\) => window\.markmap,null,\{',
+         lambda match, context: FULL_REPLACEMENT + '\n            ' + match.group(0),
+         group='insertion'),
+    Rule('before-last-script', r'</script>',
+         lambda match, context: FULL_REPLACEMENT + '\n            ' + match.group(0),
+         group='insertion', occurrence='last'),
+], required_groups=['insertion'])
+
+
+def convert_mindmap_to_auto_fit(input_file: str, output_file: str, verbose: bool = True):
+    """
+    Convert mindmap.html to mindmap_auto.html with:
+    - Font-family changed to Vazirmatn
+    - Auto-fit on expand/collapse
+    - Automatic Quarto theme detection
     
-    # Combined replacement code
-    full_replacement = quarto_theme_code + '\n' + auto_fit_code
-    
-    # Replace the dark mode check with our Quarto theme detection + auto-fit
-    modified_content = re.sub(dark_mode_pattern, full_replacement, content, flags=re.DOTALL)
+    Args:
+        input_file: Path to input mindmap.html file
+        output_file: Path to output mindmap_auto.html file
+        verbose: Print a confirmation once the file is written
     
-    # If pattern wasn't found, try alternative insertion
-    if modified_content == content:
-        # Find the pattern: })(() => window.markmap,null,{...})
-        pattern2 = r'(\}\)\(\(\) => window\.markmap,null,\{)'
-        modified_content = re.sub(pattern2, full_replacement + r'\n            \1', content, flags=re.DOTALL)
+    Returns:
+        The rewrite diagnostics: which insertion strategy was used, and a
+        warning if no insertion point was found
+    """
+    # Read the input file
+    with open(input_file, 'r', encoding='utf-8') as f:
+        content = f.read()
     
-    # If still no match, insert before the last </script>
-    if modified_content == content:
-        last_script_pos = content.rfind('</script>')
-        if last_script_pos != -1:
-            modified_content = content[:last_script_pos] + full_replacement + '\n            ' + content[last_script_pos:]
-        else:
-            print("Warning: Could not find insertion point. Output may be incorrect.")
-            modified_content = content
+    # Font replacement and theme/auto-fit insertion in a single scan
+    result = MINDMAP_REWRITER.rewrite(content)
+    modified_content = result.text
     
     # Write the output file
     output_path = Path(output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
+    # Write to a temporary file first so an interrupted run never leaves a truncated output
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         f.write(modified_content)
+    os.replace(tmp_path, output_path)
     
-    print(f"Successfully converted {input_file} to {output_file}")
-    print("Font-family has been changed to Vazirmatn.")
-    print("Auto-fit functionality has been added for node expand/collapse events.")
+    if verbose:
+        print(f"Successfully converted {input_file} to {output_file}")
+        print("Font-family has been changed to Vazirmatn.")
+        print("Auto-fit functionality has been added for node expand/collapse events.")
+    return result.diagnostics
+
+
+# Shared-runtime mode: directory under <site>/site_libs holding the bundle
+RUNTIME_DIRNAME = 'markmap-runtime'
+
+# Page styles of the markmap template, with the Vazirmatn font
+RUNTIME_CSS = '''* {
+  margin: 0;
+  padding: 0;
+}
+''' + VAZIRMATN_FONT + '''
+#mindmap {
+  display: block;
+  width: 100vw;
+  height: 100vh;
+}
+.markmap-dark {
+  background: #27272a;
+  color: white;
+}
+'''
+
+# Markmap bootstrapping, toolbar, theme detection and auto-fit for every page.
+# A page calls renderMarkmap(root, options) with its own data.
+RUNTIME_JS = '''window.renderMarkmap = (root2, jsonOptions) => {
+              const markmap = window.markmap;
+              window.mm = markmap.Markmap.create(
+                "svg#mindmap",
+                markmap.deriveOptions(jsonOptions),
+                root2
+              );
+              if (markmap.Toolbar) {
+                setTimeout(() => {
+                  const { el } = markmap.Toolbar.create(window.mm);
+                  el.setAttribute('style', 'position:absolute;bottom:20px;right:20px');
+                  document.body.append(el);
+                });
+              }
+              ''' + QUARTO_THEME_CODE + '\n' + AUTO_FIT_CODE + '''
+            };
+'''
+
+# The markmap data call at the end of mindmap.html: ...})(() => window.markmap,null,<root>,<options>)
+MARKMAP_CALL_PATTERN = re.compile(r'\}\)\(\(\) => window\.markmap,\s*null,\s*')
+TITLE_PATTERN = re.compile(r'<title>(.*?)</title>', re.DOTALL)
+STYLESHEET_PATTERN = re.compile(r'<link rel="stylesheet" href="[^"]+">')
+SCRIPT_SRC_PATTERN = re.compile(r'<script src="[^"]+"></script>')
+
+
+def write_runtime_bundle(site_dir):
+    """
+    Write the shared runtime as content-hashed .js/.css files under
+    <site_dir>/site_libs/markmap-runtime/ and remove bundles from older builds.
+    Returns the paths of the (js, css) files.
+    """
+    runtime_dir = Path(site_dir) / 'site_libs' / RUNTIME_DIRNAME
+    runtime_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for content, suffix in ((RUNTIME_JS, '.js'), (RUNTIME_CSS, '.css')):
+        data = content.encode('utf-8')
+        path = runtime_dir / f'markmap-runtime.{hashlib.sha256(data).hexdigest()[:16]}{suffix}'
+        if not path.exists():
+            path.write_bytes(data)
+        written.append(path)
+    for path in runtime_dir.iterdir():
+        if path not in written and path.name.split('.')[0] == 'markmap-runtime':
+            path.unlink()
+    return tuple(written)
+
+
+def extract_markmap_data(content):
+    """
+    Return the (root, options) JSON source of a markmap page, or None if the
+    page does not have the layout markmap-cli generates.
+    """
+    match = MARKMAP_CALL_PATTERN.search(content)
+    if not match:
+        return None
+    decoder = json.JSONDecoder()
+    try:
+        _, root_end = decoder.raw_decode(content, match.end())
+        if content[root_end] != ',':
+            return None
+        _, options_end = decoder.raw_decode(content, root_end + 1)
+    except (ValueError, IndexError):
+        return None
+    if not content.startswith(')</script>', options_end):
+        return None
+    return content[match.end():root_end], content[root_end + 1:options_end]
+
+
+def convert_mindmap_to_shared_runtime(input_file, output_file, runtime_js, runtime_css, verbose=True, title=None):
+    """
+    Convert mindmap.html to a page that loads the shared runtime bundle and
+    keeps only its own mindmap data. Falls back to the self-contained
+    conversion if the page layout is not recognized.
+    
+    Args:
+        input_file: Path to input mindmap.html file
+        output_file: Path to output mindmap_auto.html file
+        runtime_js: Path to the runtime .js bundle
+        runtime_css: Path to the runtime .css bundle
+        verbose: Print a confirmation once the file is written
+        title: Page title (e.g. the episode title); defaults to the input's <title>
+    
+    Returns:
+        The conversion diagnostics, as for convert_mindmap_to_auto_fit
+    """
+    with open(input_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    data = extract_markmap_data(content)
+    if data is None:
+        return [Diagnostic('warning', 'unrecognized-layout',
+                           'unrecognized markmap layout, wrote a self-contained page')
+                ] + convert_mindmap_to_auto_fit(input_file, output_file, verbose)
+    root, options = data
+    
+    output_path = Path(output_file)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    js_href = Path(os.path.relpath(runtime_js, output_path.parent)).as_posix()
+    css_href = Path(os.path.relpath(runtime_css, output_path.parent)).as_posix()
+    if title:
+        title = html.escape(title)
+    else:
+        title_match = TITLE_PATTERN.search(content)
+        title = title_match.group(1) if title_match else 'Markmap'
+    
+    # Keep the page's own CDN dependencies (d3, markmap-view, toolbar) in order
+    page = '\n'.join([
+        '<!doctype html>',
+        '<html>',
+        '<head>',
+        '<meta charset="UTF-8" />',
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0" />',
+        f'<title>{title}</title>',
+        *STYLESHEET_PATTERN.findall(content),
+        f'<link rel="stylesheet" href="{css_href}">',
+        '</head>',
+        '<body>',
+        '<svg id="mindmap"></svg>',
+        ''.join(SCRIPT_SRC_PATTERN.findall(content))
+        + f'<script src="{js_href}"></script>'
+        + f'<script>renderMarkmap({root},{options})</script>',
+        '</body>',
+        '</html>',
+        '',
+    ])
+    
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(page)
+    os.replace(tmp_path, output_path)
+    
+    if verbose:
+        print(f"Successfully converted {input_file} to {output_file} (shared runtime)")
+    return [Diagnostic('info', 'strategy', 'shared runtime')]
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents, or None if it does not exist."""
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(manifest_path, manifest):
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def is_up_to_date(entry, input_hash, output_file):
+    """
+    An episode is up to date when the manifest recorded the same input hash
+    and converter version, and the output it wrote is still unchanged.
+    """
+    return (
+        entry is not None
+        and entry.get('input_hash') == input_hash
+        and entry.get('converter_version') == CONVERTER_VERSION
+        and entry.get('output_hash') == file_hash(output_file)
+    )
+
+
+def convert_episode(input_file, output_file, runtime=None, title=None):
+    """Pool worker: convert one episode and return (output hash, diagnostics)."""
+    start = time.perf_counter()
+    if runtime is None:
+        diagnostics = convert_mindmap_to_auto_fit(str(input_file), str(output_file), verbose=False)
+    else:
+        diagnostics = convert_mindmap_to_shared_runtime(str(input_file), str(output_file), *runtime,
+                                                        verbose=False, title=title)
+    build_profile.file_done('convert', input_file, time.perf_counter() - start,
+                            bytes_read=build_profile.file_size(input_file),
+                            bytes_written=build_profile.file_size(output_file))
+    return file_hash(output_file), diagnostics
+
+
+def report(input_file, output_file, diagnostics):
+    """Print one line per converted episode, plus any warnings."""
+    strategies = [diagnostic.message for diagnostic in diagnostics if diagnostic.code == 'strategy']
+    print(f"Converted {input_file} -> {output_file.name} ({'; '.join(strategies) or 'no insertion'})")
+    for diagnostic in diagnostics:
+        if diagnostic.level == 'warning':
+            print(f"  Warning [{diagnostic.code}]: {diagnostic.message}")
+
+
+def convert_all(source_dir, manifest_path=DEFAULT_MANIFEST, jobs=None, force=False, site_dir=None):
+    """
+    Convert every <source_dir>/*/mindmap.html that changed since the last run.
+    Without site_dir, mindmap_auto.html is written self-contained next to its
+    input. With site_dir, it is written to <site_dir>/<episode>/ and loads the
+    shared runtime bundle.
+    Returns a tuple of (converted, skipped, failed) counts.
+    """
+    manifest = load_manifest(manifest_path)
+    # The runtime is generated from this file, so CONVERTER_VERSION covers it too
+    runtime = write_runtime_bundle(site_dir) if site_dir is not None else None
+    key_prefix = 'site:' if site_dir is not None else ''
+    # Episodes come from the metadata index, which also provides the page titles
+    episodes = [episode for episode in load_index(source_dir) if episode.file('mindmap.html').exists()]
+    pending = []
+    skipped = 0
+    for episode in episodes:
+        input_file = episode.file('mindmap.html')
+        if site_dir is None:
+            output_file = input_file.with_name('mindmap_auto.html')
+        else:
+            output_file = Path(site_dir) / episode.folder / 'mindmap_auto.html'
+        key = key_prefix + episode.folder
+        input_hash = file_hash(input_file)
+        if not force and is_up_to_date(manifest.get(key), input_hash, output_file):
+            skipped += 1
+            continue
+        pending.append((key, input_file, output_file, input_hash, episode.title or None))
+    build_profile.cache('convert', hit=True, count=skipped)
+    build_profile.cache('convert', hit=False, count=len(pending))
+    
+    converted = 0
+    failed = 0
+    
+    def record(key, input_hash, output_hash):
+        manifest[key] = {
+            'input_hash': input_hash,
+            'converter_version': CONVERTER_VERSION,
+            'output_hash': output_hash,
+        }
+    
+    if len(pending) <= 1 or jobs == 1:
+        # Not worth starting a pool for a single episode
+        for key, input_file, output_file, input_hash, title in pending:
+            try:
+                output_hash, diagnostics = convert_episode(input_file, output_file, runtime, title)
+                record(key, input_hash, output_hash)
+                converted += 1
+                report(input_file, output_file, diagnostics)
+            except Exception as e:
+                failed += 1
+                print(f"Error converting {input_file}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(convert_episode, input_file, output_file, runtime, title):
+                    (key, input_file, output_file, input_hash)
+                for key, input_file, output_file, input_hash, title in pending
+            }
+            for future in as_completed(futures):
+                key, input_file, output_file, input_hash = futures[future]
+                try:
+                    output_hash, diagnostics = future.result()
+                    record(key, input_hash, output_hash)
+                    converted += 1
+                    report(input_file, output_file, diagnostics)
+                except Exception as e:
+                    failed += 1
+                    print(f"Error converting {input_file}: {e}")
+    
+    # Forget episodes that no longer exist
+    existing = {key_prefix + episode.folder for episode in episodes}
+    removed = [key for key in manifest if key.startswith(key_prefix) and key not in existing]
+    for key in removed:
+        del manifest[key]
+    
+    if converted or removed:
+        save_manifest(manifest_path, manifest)
+    return converted, skipped, failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Convert source/*/mindmap.html to mindmap_auto.html, skipping unchanged episodes.')
+    parser.add_argument('inputs', nargs='*',
+                        help='Convert just these mindmap.html files (output next to each input)')
+    parser.add_argument('--source', default=str(Path(__file__).parent / 'source'),
+                        help='Directory containing the episode folders (default: source)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='Convert every episode even if it is up to date')
+    parser.add_argument('--shared-runtime', metavar='SITE_DIR',
+                        help='Write the pages into the built site, sharing one runtime bundle under site_libs')
+    parser.add_argument('--manifest', default=str(DEFAULT_MANIFEST),
+                        help='Manifest file used to skip unchanged episodes')
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    # Get the script directory
-    script_dir = Path(__file__).parent
+    args = parse_args()
+    
+    if args.inputs:
+        for input_file in args.inputs:
+            output_file = Path(input_file).with_name('mindmap_auto.html')
+            for diagnostic in convert_mindmap_to_auto_fit(input_file, str(output_file)):
+                if diagnostic.level == 'warning':
+                    print(f"Warning [{diagnostic.code}]: {diagnostic.message}")
+        sys.exit(0)
     
-    # Define input and output paths
-    input_file = script_dir / "source" / "Episode-02" / "mindmap.html"
-    output_file = script_dir / "source" / "Episode-02" / "mindmap_auto.html"
+    if not os.path.isdir(args.source):
+        print(f"Error: Source directory {args.source} does not exist")
+        sys.exit(1)
+    if args.shared_runtime and not os.path.isdir(args.shared_runtime):
+        print(f"Error: Site directory {args.shared_runtime} does not exist")
+        sys.exit(1)
     
-    # Convert the file
-    convert_mindmap_to_auto_fit(str(input_file), str(output_file))
\ No newline at end of file
+    with build_profile.span('convert_all', category='convert'):
+        converted, skipped, failed = convert_all(args.source, args.manifest, args.jobs, args.force,
+                                                 site_dir=args.shared_runtime)
+    print(f"Converted {converted} mindmap(s), {skipped} up to date, {failed} failed")
+    sys.exit(1 if failed else 0)
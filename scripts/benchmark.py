@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the build scripts and serve.py on a synthetic Persian corpus.
+
+Episodes are generated in the shape of source/001-Mind-Body-Unity: a
+metadata.yml, one to four markdown files (always including a long transcript
+of mixed Persian/English text full of parenthesized English terms) and a
+markmap mindmap.html. For each corpus size the suite measures throughput and
+peak memory (tracemalloc) of:
+
+- fix_parentheses               on every markdown file
+- convert_html_dates            on a rendered page per episode and the site index
+- read_metadata_dates           cold (no metadata index cache) and warm
+- convert_mindmap_to_auto_fit   on every mindmap.html
+
+It then serves the generated pages with serve.py and measures requests per
+second and latency percentiles with a keep-alive load generator. Results are
+written as JSON (default .cache/benchmarks/<commit>.json) so runs on two
+commits can be compared with --compare.
+
+    python3 scripts/benchmark.py                          # 1, 10 and 100 episodes
+    python3 scripts/benchmark.py --episodes 1 1000 --repeat 5
+    python3 scripts/benchmark.py --compare .cache/benchmarks/<old commit>.json
+    python3 scripts/benchmark.py --generate /tmp/corpus --episodes 50   # corpus only
+"""
+import argparse
+import html
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import convert
+from convert_dates_to_jalali import convert_html_dates, read_metadata_dates
+from fix_bidi_parentheses import fix_parentheses
+
+SERVE_SCRIPT = ROOT / 'serve.py'
+RESULTS_DIR = ROOT / '.cache' / 'benchmarks'
+
+# Bump when the results layout changes
+RESULTS_VERSION = 1
+
+# Changes worse than this are flagged by --compare
+REGRESSION_THRESHOLD = 0.10
+
+PERSIAN_WORDS = (
+    'ذهن', 'بدن', 'سلامت', 'پژوهش', 'دانشگاه', 'آزمایش', 'نتیجه', 'مطالعه', 'افراد',
+    'زندگی', 'روزمره', 'علم', 'ابزار', 'تأثیر', 'احساس', 'تجربه', 'توجه', 'ذهن‌آگاهی',
+    'استرس', 'خواب', 'حافظه', 'یادگیری', 'رفتار', 'انگیزه', 'عادت', 'تمرین', 'بیماری',
+    'درمان', 'دارو', 'پزشک', 'بیمار', 'سالمندان', 'جوانی', 'انتظار', 'باور', 'واقعیت',
+    'می‌کنیم', 'می‌شود', 'است', 'بود', 'هستند', 'داشته', 'کرد', 'گفت', 'می‌دانیم',
+    'اما', 'و', 'که', 'در', 'به', 'از', 'با', 'برای', 'این', 'آن', 'یک', 'هر', 'چگونه',
+    'بسیار', 'مهم', 'جالب', 'شگفت‌انگیز', 'ساده', 'دقیق', 'سیستماتیک', 'واقعاً',
+)
+
+ENGLISH_TERMS = (
+    'Huberman Lab', 'Dr. Ellen Langer', 'placebo effect', 'mindfulness', 'Harvard University',
+    'counterclockwise study', 'cortisol', 'blood pressure', 'HbA1c', 'type 2 diabetes',
+    'attention', 'mind-body unity', 'psychological age', 'self-fulfilling prophecy',
+    'Stanford School of Medicine', 'randomized controlled trial', 'nocebo', 'dopamine',
+    'neuroplasticity', 'perceived exertion', 'hotel maids study', 'vision chart', 'Descartes',
+    'Journal of Personality and Social Psychology', 'well-being', 'stress hormones',
+)
+
+PERSIAN_ASIDES = ('یعنی همان', 'مثلاً', 'به قول معروف', 'در واقع', 'به طور خاص')
+
+SPEAKERS = ('اندرو هیوبرمن', 'الن لنگر')
+
+MARKDOWN_FILES = ('1-subjects.md', '2-references.md', '3-summary.md', '4-transcript.md')
+
+# markmap autoloader output, as in source/*/mindmap.html
+MINDMAP_HEAD = '''<!doctype html>
+<html>
+<head>
+<meta charset="UTF-8" />
+<meta name="viewport" content="width=device-width, initial-scale=1.0" />
+<meta http-equiv="X-UA-Compatible" content="ie=edge" />
+<title>Markmap</title>
+<style>
+* {
+  margin: 0;
+  padding: 0;
+}
+html {
+  font-family: ui-sans-serif, system-ui, sans-serif, 'Apple Color Emoji',
+    'Segoe UI Emoji', 'Segoe UI Symbol', 'Noto Color Emoji';
+}
+#mindmap {
+  display: block;
+  width: 100vw;
+  height: 100vh;
+}
+.markmap-dark {
+  background: #27272a;
+  color: white;
+}
+</style>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.12/dist/style.css">
+</head>
+<body>
+<svg id="mindmap"></svg>
+<script src="https://cdn.jsdelivr.net/npm/d3@7.9.0/dist/d3.min.js"></script><script src="https://cdn.jsdelivr.net/npm/markmap-view@0.18.12/dist/browser/index.js"></script><script src="https://cdn.jsdelivr.net/npm/markmap-toolbar@0.18.12/dist/index.js"></script><script>(r => {
+              setTimeout(r);
+            })(function renderToolbar() {
+  const {
+    markmap,
+    mm
+  } = window;
+  const {
+    el
+  } = markmap.Toolbar.create(mm);
+  el.setAttribute('style', 'position:absolute;bottom:20px;right:20px');
+  document.body.append(el);
+})</script><script>((getMarkmap, getOptions, root2, jsonOptions) => {
+              const markmap = getMarkmap();
+              window.mm = markmap.Markmap.create(
+                "svg#mindmap",
+                (getOptions || markmap.deriveOptions)(jsonOptions),
+                root2
+              );
+              if (window.matchMedia("(prefers-color-scheme: dark)").matches) {
+                document.documentElement.classList.add("markmap-dark");
+              }
+            })(() => window.markmap,null,'''
+
+MINDMAP_TAIL = ''',{"spacingHorizontal":100,"spacingVertical":5,"initialExpandLevel":3})</script>
+</body>
+</html>
+'''
+
+
+# --- Corpus -----------------------------------------------------------------
+
+def sentence(rng):
+    """A Persian sentence, often with a parenthesized English term."""
+    words = rng.choices(PERSIAN_WORDS, k=rng.randint(8, 24))
+    roll = rng.random()
+    if roll < 0.45:
+        words.insert(rng.randrange(len(words)), f'({rng.choice(ENGLISH_TERMS)})')
+    elif roll < 0.55:
+        # English mixed with Persian inside the parentheses
+        words.insert(rng.randrange(len(words)), f'({rng.choice(PERSIAN_ASIDES)} {rng.choice(ENGLISH_TERMS)})')
+    elif roll < 0.65:
+        words.insert(rng.randrange(len(words)), f'({rng.choice(PERSIAN_ASIDES)} {rng.choice(PERSIAN_WORDS)})')
+    elif roll < 0.68:
+        term = rng.choice(ENGLISH_TERMS)
+        words.append(f'[{term}](https://example.com/{term.replace(" ", "-").lower()})')
+    return ' '.join(words) + rng.choice(('.', '.', '.', '؟', '!'))
+
+
+def paragraph(rng, sentences):
+    return ' '.join(sentence(rng) for _ in range(sentences))
+
+
+def transcript_markdown(rng, size):
+    """Speaker-labelled paragraphs until the transcript reaches size bytes."""
+    parts = ['# ترانسکریپت\n\n']
+    total = 0
+    while total < size:
+        text = f'**{rng.choice(SPEAKERS)}:** {paragraph(rng, rng.randint(3, 12))}\n\n'
+        parts.append(text)
+        total += len(text.encode('utf-8'))
+    return ''.join(parts)
+
+
+def subject_tree(rng):
+    """(title, children) nodes shared by 1-subjects.md and mindmap.html."""
+    return [(' '.join(rng.choices(PERSIAN_WORDS, k=3)),
+             [(sentence(rng).rstrip('.؟!'), [(sentence(rng).rstrip('.؟!'), []) for _ in range(rng.randint(0, 3))])
+              for _ in range(rng.randint(2, 6))])
+            for _ in range(rng.randint(3, 8))]
+
+
+def subjects_markdown(tree):
+    lines = ['---', 'markmap:', '  spacingHorizontal: 100', '  spacingVertical: 5',
+             '  maxWidth: 100%', '  initialExpandLevel: 3', '---', '', '# فهرست موضوعات', '']
+    for heading, items in tree:
+        lines.append(f'## {heading}')
+        for item, children in items:
+            lines.append(f'- {item}')
+            lines.extend(f'  - {child}' for child, _ in children)
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def references_markdown(rng):
+    lines = ['# منابع', '', '## مقالات', '']
+    for _ in range(rng.randint(3, 12)):
+        term = rng.choice(ENGLISH_TERMS)
+        lines.append(f'- [{sentence(rng).rstrip(".؟!")}](https://doi.org/10.1000/{rng.randint(1000, 99999)}) '
+                     f'(*{term}*)')
+    return '\n'.join(lines) + '\n'
+
+
+def summary_markdown(rng):
+    parts = ['# خلاصه\n']
+    for _ in range(rng.randint(4, 10)):
+        parts.append(f'\n## {" ".join(rng.choices(PERSIAN_WORDS, k=3))}\n\n{paragraph(rng, rng.randint(2, 6))}\n')
+    return ''.join(parts)
+
+
+def markmap_content(text):
+    """Non-ASCII characters as hex entities, the way markmap writes them."""
+    return ''.join(f'&#x{ord(c):x};' if ord(c) > 127 else html.escape(c, quote=False) for c in text)
+
+
+def mindmap_html(tree):
+    def node(text, children, tag, line):
+        return {'content': markmap_content(text), 'children': children,
+                'payload': {'tag': tag, 'lines': f'{line},{line + 1}'}}
+    line = 8
+    sections = []
+    for heading, items in tree:
+        items_json = []
+        for item, children in items:
+            items_json.append(node(item, [node(child, [], 'li', line) for child, _ in children], 'li', line))
+            line += 1 + len(children)
+        sections.append(node(heading, items_json, 'h2', line))
+        line += 2
+    root = node('فهرست موضوعات', sections, 'h1', 8)
+    return MINDMAP_HEAD + json.dumps(root, ensure_ascii=False, separators=(',', ':')) + MINDMAP_TAIL
+
+
+def generate_episode(source_dir, number, rng, transcript_bytes):
+    """Write one synthetic episode folder. Returns its name."""
+    folder = f'{number:03d}-Synthetic-Episode-{number}'
+    episode_dir = Path(source_dir) / folder
+    episode_dir.mkdir(parents=True, exist_ok=True)
+    day = date(2025, 1, 1) + timedelta(days=7 * number)
+    title = ' '.join(rng.choices(PERSIAN_WORDS, k=3))
+    (episode_dir / 'metadata.yml').write_text(
+        f'title: {title}\n'
+        f'date: {day.isoformat()}\n'
+        f'image: infographic.png\n'
+        f'original_link: https://www.hubermanlab.com/episode/synthetic-{number}\n'
+        f'video: https://www.youtube.com/embed/synthetic{number}\n', encoding='utf-8')
+
+    tree = subject_tree(rng)
+    # The transcript is always there; the other pages come and go
+    files = list(MARKDOWN_FILES[4 - rng.randint(1, 4):])
+    for name in files:
+        if name == '1-subjects.md':
+            text = subjects_markdown(tree)
+        elif name == '2-references.md':
+            text = references_markdown(rng)
+        elif name == '3-summary.md':
+            text = summary_markdown(rng)
+        else:
+            # Transcript lengths vary around the requested size
+            text = transcript_markdown(rng, int(transcript_bytes * rng.uniform(0.5, 1.5)))
+        (episode_dir / name).write_text(text, encoding='utf-8')
+    (episode_dir / 'mindmap.html').write_text(mindmap_html(tree), encoding='utf-8')
+    return folder
+
+
+def generate_corpus(source_dir, episodes, seed=0, transcript_bytes=256 * 1024):
+    """Write episodes synthetic episodes under source_dir. Returns the folder names."""
+    rng = random.Random(seed)
+    return [generate_episode(source_dir, number, rng, transcript_bytes) for number in range(1, episodes + 1)]
+
+
+def generate_site(source_dir, site_dir, folders):
+    """
+    Quarto-like pages for the corpus: <site_dir>/<folder>/index.html with the
+    episode's dates and transcript text, and a site index listing every episode.
+    """
+    site_dir = Path(site_dir)
+    listing = []
+    for folder in folders:
+        episode_dir = Path(source_dir) / folder
+        body = html.escape((episode_dir / '4-transcript.md').read_text(encoding='utf-8'))
+        page_dir = site_dir / folder
+        page_dir.mkdir(parents=True, exist_ok=True)
+        day = datetime(2025, 1, 1) + timedelta(days=7 * int(folder[:3]))
+        gregorian = day.strftime('%b %d, %Y').replace(' 0', ' ')
+        (page_dir / 'index.html').write_text(
+            f'<!DOCTYPE html>\n<html lang="fa" dir="rtl"><head><meta charset="utf-8"><title>{folder}</title></head>\n'
+            f'<body><header><h1 class="title">{folder}</h1><p class="date">{gregorian}</p></header>\n'
+            f'<main><div class="listing-date">{gregorian}</div>\n<p>{body}</p></main></body></html>\n',
+            encoding='utf-8')
+        listing.append(f'<div class="quarto-post"><a href="./{folder}/index.html">{folder}</a>\n'
+                       f'<div class="listing-date">{gregorian}</div></div>\n')
+    (site_dir / 'index.html').write_text(
+        '<!DOCTYPE html>\n<html lang="fa" dir="rtl"><head><meta charset="utf-8"><title>Nevisa</title></head>\n'
+        f'<body><main>{"".join(listing)}</main></body></html>\n', encoding='utf-8')
+
+
+# --- Measurement ------------------------------------------------------------
+
+def measure(name, episodes, work, items, total_bytes, repeat, setup=None):
+    """
+    Time work(item) over all items (best of repeat), then run once more
+    under tracemalloc for the peak memory. setup() runs before every pass.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for item in items:
+            work(item)
+        times.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        for item in items:
+            work(item)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    result = {
+        'name': name,
+        'episodes': episodes,
+        'items': len(items),
+        'bytes': total_bytes,
+        'seconds': best,
+        'mean_seconds': sum(times) / len(times),
+        'items_per_second': len(items) / best if best else None,
+        'mb_per_second': total_bytes / best / 1e6 if best else None,
+        'peak_memory_bytes': peak,
+    }
+    print(f"  {name:<32} {len(items):>6} item(s) {best * 1000:>10.1f} ms "
+          f"{result['mb_per_second'] or 0:>8.1f} MB/s  peak {peak / 1e6:.1f} MB")
+    return result
+
+
+def benchmark_scripts(source_dir, site_dir, folders, repeat, work_dir):
+    episodes = len(folders)
+    results = []
+
+    texts = [path.read_text(encoding='utf-8') for path in sorted(Path(source_dir).glob('*/*.md'))]
+    results.append(measure('fix_parentheses', episodes, fix_parentheses, texts,
+                           sum(len(text.encode('utf-8')) for text in texts), repeat))
+
+    date_map = read_metadata_dates(source_dir, work_dir / 'metadata-index.json')
+    pages = [(str(path), path.read_text(encoding='utf-8')) for path in sorted(Path(site_dir).rglob('*.html'))]
+    results.append(measure('convert_html_dates', episodes,
+                           lambda page: convert_html_dates(page[1], date_map, page[0], site_dir), pages,
+                           sum(len(text.encode('utf-8')) for _, text in pages), repeat))
+
+    metadata_bytes = sum(path.stat().st_size for path in Path(source_dir).glob('*/metadata.yml'))
+    cache_path = work_dir / 'metadata-index.json'
+    results.append(measure('read_metadata_dates (cold)', episodes,
+                           lambda source: read_metadata_dates(source, cache_path), [source_dir],
+                           metadata_bytes, repeat, setup=lambda: cache_path.unlink(missing_ok=True)))
+    read_metadata_dates(source_dir, cache_path)
+    results.append(measure('read_metadata_dates (warm)', episodes,
+                           lambda source: read_metadata_dates(source, cache_path), [source_dir],
+                           metadata_bytes, repeat))
+
+    # Written into the site, so the server benchmark serves them too
+    mindmaps = [(str(Path(source_dir) / folder / 'mindmap.html'), str(Path(site_dir) / folder / 'mindmap_auto.html'))
+                for folder in folders]
+    results.append(measure('convert_mindmap_to_auto_fit', episodes,
+                           lambda paths: convert.convert_mindmap_to_auto_fit(*paths, verbose=False), mindmaps,
+                           sum(os.path.getsize(input_file) for input_file, _ in mindmaps), repeat))
+    return results
+
+
+# --- Server -----------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"serve.py did not start listening on port {port}")
+
+
+def peak_rss(pid):
+    """Peak resident set size of a process in bytes (Linux only), or None."""
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def load_client(port, urls, offset, deadline, latencies, counters, lock):
+    """One keep-alive connection requesting urls in turn until the deadline."""
+    local = []
+    errors = 0
+    received = 0
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    n = offset
+    while time.perf_counter() < deadline:
+        url = urls[n % len(urls)]
+        n += 1
+        start = time.perf_counter()
+        try:
+            conn.request('GET', url, headers={'Accept-Encoding': 'gzip, br'})
+            response = conn.getresponse()
+            received += len(response.read())
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            continue
+        local.append(time.perf_counter() - start)
+    conn.close()
+    with lock:
+        latencies.extend(local)
+        counters['errors'] += errors
+        counters['bytes'] += received
+
+
+def benchmark_server(site_dir, folders, engine, concurrency, duration):
+    """Serve site_dir with serve.py and hammer it from concurrency connections."""
+    urls = ['/', '/index.html']
+    for folder in folders:
+        urls += [f'/{folder}/', f'/{folder}/index.html', f'/{folder}/mindmap_auto.html']
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, str(SERVE_SCRIPT), '--engine', engine, '--port', str(port), '--bind', '127.0.0.1',
+         '--directory', str(site_dir), '--access-log', 'off'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        # Warm-up: fill the server's caches once
+        warm = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        for url in urls:
+            warm.request('GET', url, headers={'Accept-Encoding': 'gzip, br'})
+            warm.getresponse().read()
+        warm.close()
+
+        latencies = []
+        counters = {'errors': 0, 'bytes': 0}
+        lock = threading.Lock()
+        start = time.perf_counter()
+        deadline = start + duration
+        threads = [threading.Thread(target=load_client,
+                                    args=(port, urls, i * len(urls) // concurrency, deadline,
+                                          latencies, counters, lock))
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        memory = peak_rss(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    latencies.sort()
+    ms = lambda seconds: seconds * 1000 if seconds is not None else None
+    result = {
+        'name': f'serve.py ({engine})',
+        'engine': engine,
+        'episodes': len(folders),
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests': len(latencies),
+        'errors': counters['errors'],
+        'bytes': counters['bytes'],
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 50)),
+            'p90': ms(percentile(latencies, 90)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+        'peak_memory_bytes': memory,
+    }
+    print(f"  {result['name']:<32} {result['requests_per_second']:>8.0f} req/s  "
+          f"p50 {result['latency_ms']['p50'] or 0:.2f} ms  p99 {result['latency_ms']['p99'] or 0:.2f} ms  "
+          f"{result['errors']} error(s)")
+    return result
+
+
+# --- Results ----------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def compare(old, new):
+    """
+    Print the change of every metric against an earlier results file.
+    Returns the number of regressions beyond REGRESSION_THRESHOLD.
+    """
+    def metrics(results):
+        values = {}
+        for entry in results.get('scripts', []):
+            values[(entry['name'], entry['episodes'], 'seconds')] = (entry['seconds'], False)
+            values[(entry['name'], entry['episodes'], 'peak memory')] = (entry['peak_memory_bytes'], False)
+        for entry in results.get('server', []):
+            values[(entry['name'], entry['episodes'], 'req/s')] = (entry['requests_per_second'], True)
+            values[(entry['name'], entry['episodes'], 'p99 ms')] = (entry['latency_ms']['p99'], False)
+        return values
+
+    before = metrics(old)
+    after = metrics(new)
+    regressions = 0
+    print(f"\nCompared with {old.get('commit') or 'previous run'}:")
+    if old.get('settings') != new.get('settings') or old.get('cpus') != new.get('cpus'):
+        print("  Note: the runs used different settings or machines")
+    for key in sorted(after, key=lambda key: (key[1], key[0], key[2])):
+        if key not in before or not before[key][0] or after[key][0] is None:
+            continue
+        (old_value, higher_is_better), (new_value, _) = before[key], after[key]
+        change = (new_value - old_value) / old_value
+        regressed = -change > REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+        regressions += regressed
+        name, episodes, metric = key
+        print(f"  {name:<32} {episodes:>5} ep  {metric:<12} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the build scripts and serve.py on synthetic Persian episodes.')
+    parser.add_argument('--episodes', type=int, nargs='+', default=[1, 10, 100],
+                        help='Corpus sizes to benchmark (default: 1 10 100; up to 1000)')
+    parser.add_argument('--transcript-kb', type=int, default=256,
+                        help='Average transcript size per episode in KB (default: 256, like episode 001)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed of the corpus generator (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timed passes per benchmark; the best is reported (default: 3)')
+    parser.add_argument('--engines', nargs='*', default=['threading', 'asyncio'],
+                        help='serve.py engines to load test; none to skip the server (default: threading asyncio)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Concurrent keep-alive connections of the load generator (default: 8)')
+    parser.add_argument('--duration', type=float, default=3.0,
+                        help='Seconds of load per server run (default: 3)')
+    parser.add_argument('-o', '--output',
+                        help='Results file (default: .cache/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='Earlier results file to compare against; exits 1 on a regression')
+    parser.add_argument('--generate', metavar='DIR',
+                        help='Only write a corpus (the largest --episodes) to DIR and exit')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if any(n < 1 for n in args.episodes):
+        print("Error: --episodes must be at least 1")
+        sys.exit(1)
+
+    if args.generate:
+        folders = generate_corpus(args.generate, max(args.episodes), args.seed, args.transcript_kb * 1024)
+        print(f"Wrote {len(folders)} episode(s) to {args.generate}")
+        sys.exit(0)
+
+    commit = git_commit()
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {key: getattr(args, key) for key in
+                     ('episodes', 'transcript_kb', 'seed', 'repeat', 'engines', 'concurrency', 'duration')},
+        'scripts': [],
+        'server': [],
+    }
+    with tempfile.TemporaryDirectory(prefix='nevisa-bench-') as tmp:
+        for episodes in sorted(set(args.episodes)):
+            work_dir = Path(tmp) / str(episodes)
+            source_dir = work_dir / 'source'
+            site_dir = work_dir / 'site'
+            folders = generate_corpus(source_dir, episodes, args.seed, args.transcript_kb * 1024)
+            generate_site(source_dir, site_dir, folders)
+            print(f"{episodes} episode(s):")
+            results['scripts'] += benchmark_scripts(source_dir, site_dir, folders, args.repeat, work_dir)
+            for engine in args.engines:
+                results['server'].append(benchmark_server(site_dir, folders, engine, args.concurrency,
+                                                          args.duration))
+            shutil.rmtree(work_dir)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit or 'results'}.json"
+    write_results(results, output)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare(previous, results):
+            sys.exit(1)
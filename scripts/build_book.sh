@@ -3,7 +3,8 @@ cd assets/book
 cd ../..
 uv run python scripts/get_persian_date.py > assets/book/persian-date.tex
 cd assets/book
-quarto render --to pdf
+# Pandoc + XeLaTeX; timed into the build profile when BUILD_PROFILE is set (scripts/build_profile.py)
+uv run python3 ../../scripts/build_profile.py run quarto-pdf quarto render --to pdf
 # Find the PDF file (it may have a Persian filename) and copy it
 PDF_FILE=$(find _book -name "*.pdf" -type f | head -1)
 if [ -n "$PDF_FILE" ]; then
@@ -0,0 +1,619 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-episode parallel build of the website and of the book's merged markdown.
+
+Episodes under source/ are independent until the site-wide pages, so each
+one is a task in a process pool:
+- site: render the episode's pages with Quarto in a private project (the
+  other episodes are present as title-only stubs, so the sidebar still lists
+  everything), convert its mindmap to the shared runtime and its dates to
+  Jalali. A reduce step renders the root pages (index.html with the episode
+  listing, about.html, listings.json) and assembles output/site with a
+  merged search.json and sitemap.xml, then builds the search indexes and
+  precompressed siblings.
+- book: assemble the episode's chapter the way build_merged_markdown.sh
+  does and run the bidi parentheses fix on it; the chapters are then joined
+  into output/Chista.md.
+
+Every task's result is kept under .cache/build/episodes/ with a key over its
+inputs, so after editing one episode only that episode is rendered again.
+
+    build_parallel.py site --jobs 8
+    build_parallel.py book --jobs 8
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+import build_profile
+import convert
+from build_search_index import build_index_file
+from convert_dates_to_jalali import CONVERTER_VERSION as DATES_VERSION
+from convert_dates_to_jalali import EXCLUDED_NAMES, date_map_hash, process_html_file
+from episode_metadata import file_signature, load_index
+from fix_bidi_parentheses import FIXER_VERSION, fix_lines
+from optimize_site import optimize_site, site_url
+from shard_search_index import shard_site_index
+
+SOURCE_DIR = ROOT / 'source'
+WEBSITE_DIR = ROOT / 'assets' / 'website'
+IMAGES_DIR = ROOT / 'assets' / 'images'
+BOOK_PDF = ROOT / 'output' / 'Chista.pdf'
+WORK_DIR = ROOT / '.cache' / 'build' / 'episodes'
+FINGERPRINTS_FILE = WORK_DIR / 'fingerprints.json'
+
+# Task results are invalidated when this script or the post-processing changes
+BUILD_VERSION = hashlib.sha256(json.dumps([
+    hashlib.sha256(Path(__file__).read_bytes()).hexdigest(),
+    convert.CONVERTER_VERSION, DATES_VERSION, FIXER_VERSION,
+]).encode('utf-8')).hexdigest()[:16]
+
+# Folders build_site.sh and build_merged_markdown.sh never treat as episodes
+SKIPPED_FOLDERS = ('_build', 'node_modules', '_site')
+
+# Name of the task that renders the root pages (not a valid episode folder)
+ROOT_TASK = '_root'
+
+# Files copied into the site next to the rendered pages, as build_site.sh does
+MEDIA_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.m4a', '.pdf')
+
+SITEMAP_URL_PATTERN = re.compile(r'<url>\s*<loc>(.*?)</loc>\s*(?:<lastmod>(.*?)</lastmod>\s*)?</url>', re.DOTALL)
+
+
+def episode_folders():
+    """Episode folder names, in the order of the merged book."""
+    return sorted(path.name for path in SOURCE_DIR.iterdir()
+                  if path.is_dir() and not path.name.startswith('.')
+                  and not any(path.name.startswith(skipped) for skipped in SKIPPED_FOLDERS))
+
+
+class Fingerprints:
+    """Content hashes of files, cached by size and mtime between builds."""
+
+    def __init__(self, path=FINGERPRINTS_FILE):
+        self.path = Path(path)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.signatures = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.signatures = {}
+        self.used = {}
+
+    def hash(self, path):
+        key = str(path)
+        signature = file_signature(path, self.signatures.get(key))
+        if signature is None:
+            return None
+        self.used[key] = signature
+        return signature[2]
+
+    def tree(self, directory):
+        """Sorted (relative path, hash) pairs of every file below directory."""
+        directory = Path(directory)
+        if not directory.is_dir():
+            return []
+        return [(path.relative_to(directory).as_posix(), self.hash(path))
+                for path in sorted(directory.rglob('*')) if path.is_file()]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.used, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+def digest(data):
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def read_key(task_dir):
+    try:
+        return (Path(task_dir) / 'key').read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return None
+
+
+def write_key(task_dir, key):
+    tmp_path = Path(task_dir) / 'key.tmp'
+    tmp_path.write_text(key, encoding='utf-8')
+    os.replace(tmp_path, Path(task_dir) / 'key')
+
+
+# --- Book -----------------------------------------------------------------
+
+def markdown_order(path):
+    """The number before the first hyphen of a page's file name; 999 if there is none."""
+    match = re.match(r'\d+', Path(path).name)
+    return int(match.group(0)) if match else 999
+
+
+def metadata_lines(folder, key):
+    """Values of "key:" lines in an episode's metadata.yml, as grep would list them."""
+    try:
+        content = (SOURCE_DIR / folder / 'metadata.yml').read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return []
+    return [line[len(key) + 1:].strip() for line in content.split('\n') if line.startswith(key + ':')]
+
+
+def chapter_pages(folder):
+    """The pages build_merged_markdown.sh puts in the book, in its order."""
+    episode_dir = SOURCE_DIR / folder
+    pages = []
+    for suffix in ('*.md', '*.qmd'):
+        for path in episode_dir.rglob(suffix):
+            relative = path.relative_to(SOURCE_DIR).as_posix()
+            if not path.is_file() or '/.' in '/' + relative:
+                continue
+            if any(f'/{skipped}' in '/' + relative for skipped in SKIPPED_FOLDERS):
+                continue
+            if (path.name == 'README.md' or path.name.endswith('-subjects.md')
+                    or path.name.endswith('-transcript.md')):
+                continue
+            order = markdown_order(path)
+            pages.append((order, f'{order}|source/{relative}', path))
+    return [path for _, _, path in sorted(pages)]
+
+
+def page_markdown(path):
+    """A page without its YAML front matter and with every heading one level deeper."""
+    text = path.read_text(encoding='utf-8')
+    lines = text.split('\n')
+    if text.endswith('\n'):
+        lines.pop()
+    output = []
+    separators = 0
+    in_frontmatter = False
+    for line in lines:
+        if line == '---' and separators < 2:
+            separators += 1
+            in_frontmatter = separators == 1
+            continue
+        if not in_frontmatter:
+            output.append(re.sub(r'^(#{1,5}) ', r'#\1 ', line) + '\n')
+    return ''.join(output)
+
+
+def chapter_markdown(folder, url):
+    """One episode's chapter of output/Chista.md, as build_merged_markdown.sh writes it."""
+    episode_dir = SOURCE_DIR / folder
+    titles = [re.sub(r'^["\']|["\']$', '', value).strip() for value in metadata_lines(folder, 'title')]
+    title = '\n'.join(titles) if any(titles) else folder.replace('-', ' ')
+    parts = [f'# {title}\n\n', '## لینک ها\n\n']
+    if url:
+        for name, label, target in (('4-transcript.md', 'ترانسکریپت', '4-transcript.html'),
+                                    ('slides.pdf', 'اسلاید ها', 'slides.pdf'),
+                                    ('mindmap_auto.html', 'نقشه ذهنی', 'mindmap_auto.html')):
+            if (episode_dir / name).is_file():
+                parts.append(f'- [{label}]({url}/{folder}/{target})\n')
+    for key, label in (('original_audio', 'پادکست با هوش مصنوعی'), ('original_video', 'ویدِئو با هوش مصنوعی')):
+        value = '\n'.join(metadata_lines(folder, key))
+        if value:
+            parts.append(f'- [{label}]({value})\n')
+    parts.append('\n```{=latex}\n\\vspace{1.5em}\n```\n\n')
+    if (episode_dir / 'infographic.png').is_file():
+        parts.append(f"![](../source/{folder}/infographic.png){{.infographic fig-cap=''}}\n\n")
+    elif (SOURCE_DIR / 'Episode-02' / 'infographic.png').is_file():
+        parts.append("![](../source/Episode-02/infographic.png){.infographic fig-cap=''}\n\n")
+    for path in chapter_pages(folder):
+        parts.append(page_markdown(path) + '\n\n')
+    parts.append('\n')
+    return ''.join(parts)
+
+
+def fix_chapter(folder, text, key):
+    """Pool worker: run the bidi fix on a chapter and cache the result."""
+    start = time.perf_counter()
+    counts = {}
+    fixed = ''.join(fix_lines(io.StringIO(text), counts))
+    task_dir = WORK_DIR / folder
+    task_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = task_dir / 'chapter.md.tmp'
+    tmp_path.write_text(fixed, encoding='utf-8')
+    os.replace(tmp_path, task_dir / 'chapter.md')
+    (task_dir / 'chapter.key').write_text(key, encoding='utf-8')
+    seconds = time.perf_counter() - start
+    build_profile.file_done('bidi', folder, seconds, bytes_read=len(text.encode('utf-8')),
+                            bytes_written=len(fixed.encode('utf-8')), wrapped=counts.get('wrapped', 0))
+    return counts.get('wrapped', 0), seconds
+
+
+def build_book_markdown(output_file, jobs=None, force=False):
+    """
+    Write output/Chista.md from per-episode chapters, fixing only the
+    chapters that changed. Returns a tuple of (fixed, reused) chapter counts.
+    """
+    url = site_url()
+    folders = episode_folders()
+    pending = []
+    for folder in folders:
+        text = chapter_markdown(folder, url)
+        key = digest([BUILD_VERSION, text])
+        task_dir = WORK_DIR / folder
+        try:
+            cached = (task_dir / 'chapter.key').read_text(encoding='utf-8')
+        except FileNotFoundError:
+            cached = None
+        if force or cached != key or not (task_dir / 'chapter.md').exists():
+            pending.append((folder, text, key))
+    build_profile.cache('chapter', hit=True, count=len(folders) - len(pending))
+    build_profile.cache('chapter', hit=False, count=len(pending))
+
+    run_tasks(fix_chapter, pending, jobs,
+              lambda folder, result: print(f"Chapter {folder}: {result[0]} parenthes(es) wrapped "
+                                           f"in {result[1] * 1000:.1f} ms"))
+
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_file.with_name(output_file.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as output:
+        for folder in folders:
+            with open(WORK_DIR / folder / 'chapter.md', 'r', encoding='utf-8') as chapter:
+                shutil.copyfileobj(chapter, output)
+    os.replace(tmp_path, output_file)
+    return len(pending), len(folders) - len(pending)
+
+
+# --- Site -----------------------------------------------------------------
+
+def stub_markdown(path):
+    """A page reduced to its front matter and first heading: enough for Quarto's navigation."""
+    lines = path.read_text(encoding='utf-8').split('\n')
+    kept = []
+    index = 0
+    if lines and lines[0] == '---':
+        end = next((i for i in range(1, len(lines)) if lines[i] == '---'), None)
+        if end is not None:
+            kept = lines[:end + 1]
+            index = end + 1
+    heading = next((line for line in lines[index:] if line.startswith('#')), None)
+    if heading is not None:
+        kept.append(heading)
+    return '\n'.join(kept) + '\n'
+
+
+def page_name(name):
+    """build_site.sh renames README.md to index.md so Quarto renders it as the index page."""
+    return 'index.md' if name == 'README.md' else name
+
+
+def write_project(project_dir, episodes, full_episode=None, listing_images=False):
+    """
+    Lay out a Quarto website project: the site configuration, the root pages,
+    the full content of full_episode and title-only stubs of the others.
+    """
+    if project_dir.exists():
+        shutil.rmtree(project_dir)
+    project_dir.mkdir(parents=True)
+    for path in WEBSITE_DIR.iterdir():
+        if path.is_file():
+            shutil.copy2(path, project_dir / path.name)
+    for path in SOURCE_DIR.iterdir():
+        if path.is_file():
+            shutil.copy2(path, project_dir / page_name(path.name))
+
+    for episode in episodes:
+        episode_dir = SOURCE_DIR / episode.folder
+        target_dir = project_dir / episode.folder
+        if episode.folder == full_episode:
+            shutil.copytree(episode_dir, target_dir)
+            for readme in target_dir.rglob('README.md'):
+                readme.rename(readme.with_name('index.md'))
+            continue
+        for path in sorted(episode_dir.rglob('*')):
+            if not path.is_file():
+                continue
+            target = target_dir / path.relative_to(episode_dir)
+            if path.suffix in ('.md', '.qmd'):
+                target = target.with_name(page_name(path.name))
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(stub_markdown(path), encoding='utf-8')
+            elif path.name in ('_metadata.yml', 'metadata.yml') or (
+                    listing_images and episode.image and path == episode.file(episode.image)):
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(path, target)
+
+
+def render(project_dir, target):
+    """Run quarto render on one file or folder of a project."""
+    with build_profile.span(f'quarto render {target}', category='quarto'):
+        result = subprocess.run(['quarto', 'render', target, '--to', 'html'], cwd=project_dir,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"quarto render {target} failed:\n{result.stdout[-2000:]}")
+
+
+def read_search_entries(site_dir, keep):
+    try:
+        with open(site_dir / 'search.json', 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return []
+    return [entry for entry in entries if keep(entry.get('href', ''))]
+
+
+def read_sitemap_urls(site_dir, keep):
+    try:
+        content = (site_dir / 'sitemap.xml').read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return []
+    return [[loc, lastmod] for loc, lastmod in SITEMAP_URL_PATTERN.findall(content) if keep(loc)]
+
+
+def finish_task(task_dir, project_dir, search_entries, sitemap_urls):
+    """Keep a task's rendered site, search entries and sitemap URLs; drop its project."""
+    site_dir = task_dir / 'site'
+    with open(task_dir / 'search.json', 'w', encoding='utf-8') as f:
+        json.dump(search_entries, f, ensure_ascii=False)
+    with open(task_dir / 'sitemap.json', 'w', encoding='utf-8') as f:
+        json.dump(sitemap_urls, f, ensure_ascii=False)
+    shutil.rmtree(project_dir)
+    return site_dir
+
+
+def render_episode(folder, key, date_map):
+    """
+    Pool worker: render one episode's pages and post-process them.
+    Returns (pages, seconds).
+    """
+    start = time.perf_counter()
+    index = load_index(SOURCE_DIR)
+    episode = index.get(folder)
+    task_dir = WORK_DIR / folder
+    project_dir = task_dir / 'project'
+    write_project(project_dir, index, full_episode=folder)
+    render(project_dir, folder)
+
+    rendered = project_dir / '_site'
+    site_dir = task_dir / 'site'
+    if site_dir.exists():
+        shutil.rmtree(site_dir)
+    shutil.copytree(rendered / folder, site_dir / folder)
+    prefix = folder + '/'
+    search_entries = read_search_entries(rendered, lambda href: href.startswith(prefix))
+    sitemap_urls = read_sitemap_urls(rendered, lambda loc: f'/{prefix}' in loc)
+
+    # Audio and PDF files are copied as they are
+    for path in (SOURCE_DIR / folder).rglob('*'):
+        if path.is_file() and path.suffix.lower() in MEDIA_EXTENSIONS:
+            target = site_dir / folder / path.relative_to(SOURCE_DIR / folder)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, target)
+
+    # The mindmap page, sharing the runtime bundle under site_libs
+    if episode.file('mindmap.html').exists():
+        convert.convert_episode(episode.file('mindmap.html'), site_dir / folder / 'mindmap_auto.html',
+                                convert.write_runtime_bundle(site_dir), episode.title or None)
+
+    # Jalali dates
+    map_hash = date_map_hash(date_map)
+    pages = 0
+    for path in sorted((site_dir / folder).rglob('*.html')):
+        pages += 1
+        if path.name not in EXCLUDED_NAMES:
+            process_html_file(str(path), date_map, map_hash, site_dir)
+
+    finish_task(task_dir, project_dir, search_entries, sitemap_urls)
+    write_key(task_dir, key)
+    return pages, time.perf_counter() - start
+
+
+def is_root_url(loc):
+    """Whether a sitemap URL points at a page in the site root."""
+    return '/' not in loc.split('://', 1)[-1].split('/', 1)[-1]
+
+
+def render_root(key, date_map):
+    """
+    Pool worker: render the root pages (the episode listing, about, ...)
+    with stubs of every episode. Returns (pages, seconds).
+    """
+    start = time.perf_counter()
+    index = load_index(SOURCE_DIR)
+    task_dir = WORK_DIR / ROOT_TASK
+    project_dir = task_dir / 'project'
+    write_project(project_dir, index, listing_images=True)
+    pages = sorted(path.name for path in project_dir.iterdir()
+                   if path.is_file() and path.suffix in ('.md', '.qmd'))
+    rendered = project_dir / '_site'
+    search_entries = {}
+    sitemap_urls = {}
+    for page in pages:
+        render(project_dir, page)
+        # Collected after every render, in case a render only lists its own page
+        for entry in read_search_entries(rendered, lambda href: '/' not in href.split('#', 1)[0]):
+            search_entries[entry.get('objectID', entry['href'])] = entry
+        for loc, lastmod in read_sitemap_urls(rendered, is_root_url):
+            sitemap_urls[loc] = lastmod
+
+    site_dir = task_dir / 'site'
+    if site_dir.exists():
+        shutil.rmtree(site_dir)
+    shutil.copytree(rendered, site_dir, ignore=shutil.ignore_patterns('search.json', 'sitemap.xml'))
+    search_entries = list(search_entries.values())
+    sitemap_urls = [[loc, lastmod] for loc, lastmod in sitemap_urls.items()]
+
+    finish_task(task_dir, project_dir, search_entries, sitemap_urls)
+    write_key(task_dir, key)
+    return len(pages), time.perf_counter() - start
+
+
+def run_tasks(worker, tasks, jobs, report):
+    """
+    Run worker(*task) for every task, across a process pool when there is
+    more than one. report(name, result) is called as tasks finish; failures
+    raise once every task is done.
+    """
+    errors = []
+    if len(tasks) <= 1 or jobs == 1:
+        # Not worth starting a pool for a single task
+        for task in tasks:
+            try:
+                report(task[0], worker(*task))
+            except Exception as e:
+                errors.append(f"{task[0]}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(worker, *task): task[0] for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    report(futures[future], future.result())
+                except Exception as e:
+                    errors.append(f"{futures[future]}: {e}")
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+
+
+def write_sitemap(path, urls):
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for loc, lastmod in urls:
+        parts.append(f'  <url>\n    <loc>{loc}</loc>\n')
+        if lastmod:
+            parts.append(f'    <lastmod>{lastmod}</lastmod>\n')
+        parts.append('  </url>\n')
+    parts.append('</urlset>\n')
+    Path(path).write_text(''.join(parts), encoding='utf-8')
+
+
+def build_site(site_dir, jobs=None, force=False):
+    """
+    Render every changed episode in parallel, then assemble <site_dir>.
+    Returns a tuple of (rendered, reused) task counts.
+    """
+    fingerprints = Fingerprints()
+    index = load_index(SOURCE_DIR)
+    date_map = index.date_map()
+    folders = episode_folders()
+
+    # Every page's sidebar lists every episode, so a title change anywhere re-renders all of them
+    config = [(path.name, fingerprints.hash(path)) for path in sorted(WEBSITE_DIR.iterdir()) if path.is_file()]
+    root_files = [(path.name, fingerprints.hash(path)) for path in sorted(SOURCE_DIR.iterdir()) if path.is_file()]
+    stubs = {folder: [(path.relative_to(SOURCE_DIR).as_posix(), stub_markdown(path))
+                      for path in sorted((SOURCE_DIR / folder).rglob('*')) if path.suffix in ('.md', '.qmd')]
+             for folder in folders}
+    navigation = [BUILD_VERSION, config, root_files, sorted(stubs.items()), date_map]
+
+    tasks = []
+    reused = 0
+    for folder in folders:
+        key = digest([navigation, fingerprints.tree(SOURCE_DIR / folder)])
+        if force or read_key(WORK_DIR / folder) != key:
+            tasks.append((folder, key, date_map))
+        else:
+            reused += 1
+    images = [fingerprints.hash(episode.file(episode.image)) for episode in index if episode.image]
+    root_key = digest([navigation, [asdict(episode) for episode in index], images])
+    fingerprints.save()
+
+    def report(name, result):
+        pages, seconds = result
+        print(f"Rendered {name}: {pages} page(s) in {seconds:.1f} s")
+
+    if force or read_key(WORK_DIR / ROOT_TASK) != root_key:
+        tasks.insert(0, (ROOT_TASK, root_key, date_map))
+    else:
+        reused += 1
+    build_profile.cache('episode', hit=True, count=reused)
+    build_profile.cache('episode', hit=False, count=len(tasks))
+    with build_profile.span('render episodes', category='site', tasks=len(tasks)):
+        run_tasks(render_task, tasks, jobs, report)
+
+    # Reduce: assemble the site from the task results
+    site_dir = Path(site_dir)
+    with build_profile.span('assemble site', category='site'):
+        site_dir.mkdir(parents=True, exist_ok=True)
+        for path in site_dir.iterdir():
+            shutil.rmtree(path) if path.is_dir() and not path.is_symlink() else path.unlink()
+        search_entries = []
+        sitemap_urls = []
+        for name in [ROOT_TASK] + folders:
+            task_dir = WORK_DIR / name
+            shutil.copytree(task_dir / 'site', site_dir, dirs_exist_ok=True)
+            with open(task_dir / 'search.json', 'r', encoding='utf-8') as f:
+                search_entries.extend(json.load(f))
+            with open(task_dir / 'sitemap.json', 'r', encoding='utf-8') as f:
+                sitemap_urls.extend(json.load(f))
+        with open(site_dir / 'search.json', 'w', encoding='utf-8') as f:
+            json.dump(search_entries, f, ensure_ascii=False, indent=2)
+        write_sitemap(site_dir / 'sitemap.xml', sitemap_urls)
+
+        if IMAGES_DIR.is_dir():
+            shutil.copytree(IMAGES_DIR, site_dir / 'assets' / 'images', dirs_exist_ok=True)
+        if BOOK_PDF.exists():
+            shutil.copy2(BOOK_PDF, site_dir / BOOK_PDF.name)
+
+    # The listing dates of the root pages (episode pages were done by their tasks)
+    map_hash = date_map_hash(date_map)
+    for path in sorted(site_dir.glob('*.html')):
+        process_html_file(str(path), date_map, map_hash, site_dir)
+
+    with build_profile.span('build_search_index', category='site'):
+        build_index_file(site_dir)
+    with build_profile.span('shard_search_index', category='site'):
+        shard_site_index(site_dir)
+    # Minify, fingerprint and precompress; must run after every step that edits the site
+    if optimize_site(site_dir, jobs=jobs):
+        raise RuntimeError("optimizing the site failed (see the errors above)")
+    return len(tasks), reused
+
+
+def render_task(name, key, date_map):
+    """Pool worker: render the root pages or one episode."""
+    with build_profile.span(name, category='episode'):
+        if name == ROOT_TASK:
+            return render_root(key, date_map)
+        return render_episode(name, key, date_map)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Build the website or the merged book markdown one episode per task, in parallel.')
+    parser.add_argument('target', choices=('site', 'book'),
+                        help='site: output/site; book: output/Chista.md')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild every episode even if it is up to date')
+    parser.add_argument('--output',
+                        help='Output directory (site) or file (book); default: output/site or output/Chista.md')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not SOURCE_DIR.is_dir():
+        print(f"Error: Source directory {SOURCE_DIR} does not exist")
+        sys.exit(1)
+
+    try:
+        if args.target == 'book':
+            output = args.output or ROOT / 'output' / 'Chista.md'
+            fixed, reused = build_book_markdown(output, args.jobs, args.force)
+            print(f"Wrote {output}: {fixed} chapter(s) fixed, {reused} reused")
+        else:
+            if shutil.which('quarto') is None:
+                print("Error: quarto not found on PATH")
+                sys.exit(1)
+            output = args.output or ROOT / 'output' / 'site'
+            rendered, reused = build_site(output, args.jobs, args.force)
+            print(f"Built {output}: {rendered} task(s) rendered, {reused} reused")
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build profiler: span timings, per-file durations, bytes read/written and
+cache hits/misses from every build script, merged into one Chrome trace.
+
+Profiling is switched on by the BUILD_PROFILE environment variable, which
+names an event directory; `build.py --profile` sets it for the whole build,
+so the shell stages, the scripts they launch and their pool workers all
+inherit it. Each process appends its events to its own events-<pid>.jsonl
+there (no locking needed), and the report merges them. When BUILD_PROFILE is
+unset every call below is a cheap no-op.
+
+    with build_profile.span('render', category='quarto') as info:
+        ...
+        info['bytes_written'] = size
+    build_profile.file_done('convert', path, seconds, bytes_read=n, bytes_written=m)
+    build_profile.cache('convert', hit=True)
+
+    build_profile.py report <event_dir> [trace.json]   # Chrome trace + summary
+    build_profile.py run <name> <command> [args...]    # time a shell command
+
+Open the trace in chrome://tracing or https://ui.perfetto.dev.
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ENV_VAR = 'BUILD_PROFILE'
+
+# Rows shown per table in the summary
+SUMMARY_ROWS = 15
+
+# Per-process event file; reopened after a fork so pool workers get their own
+_events = None
+_events_pid = None
+
+
+def enabled():
+    return bool(os.environ.get(ENV_VAR))
+
+
+def now_us():
+    """Wall-clock microseconds, comparable across processes."""
+    return time.time_ns() // 1000
+
+
+def _emit(event):
+    global _events, _events_pid
+    directory = os.environ.get(ENV_VAR)
+    if not directory:
+        return
+    pid = os.getpid()
+    if _events is None or _events_pid != pid:
+        os.makedirs(directory, exist_ok=True)
+        # Line buffered, so a crashing script still leaves its events behind
+        _events = open(os.path.join(directory, f'events-{pid}.jsonl'), 'a',
+                       encoding='utf-8', buffering=1)
+        _events_pid = pid
+        name = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+        _events.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                                  'args': {'name': f'{name} ({pid})'}}) + '\n')
+    event['pid'] = pid
+    event['tid'] = threading.get_ident() % 2**31
+    _events.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+@contextmanager
+def span(name, category='build', **args):
+    """
+    Time a block as a complete ('X') trace event. Yields the args dict, so
+    the block can attach bytes_read/bytes_written or anything else.
+    """
+    if not enabled():
+        yield args
+        return
+    start = now_us()
+    try:
+        yield args
+    finally:
+        _emit({'name': name, 'cat': category, 'ph': 'X', 'ts': start,
+               'dur': now_us() - start, 'args': args})
+
+
+def file_done(category, path, seconds, bytes_read=0, bytes_written=0, **args):
+    """Record one file's processing time (ending now) and its I/O."""
+    if not enabled():
+        return
+    duration = int(seconds * 1e6)
+    args.update(file=True, bytes_read=bytes_read, bytes_written=bytes_written)
+    _emit({'name': str(path), 'cat': category, 'ph': 'X', 'ts': now_us() - duration,
+           'dur': duration, 'args': args})
+
+
+def cache(category, hit, count=1):
+    """Record count cache hits (or misses) for a category."""
+    if not enabled() or count <= 0:
+        return
+    _emit({'name': 'cache hit' if hit else 'cache miss', 'cat': category, 'ph': 'i',
+           's': 't', 'ts': now_us(), 'args': {'hit': bool(hit), 'count': count}})
+
+
+def file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def run(name, command, category='command'):
+    """Run a command inside a span and return its exit code."""
+    with span(name, category=category, command=' '.join(command)) as info:
+        info['returncode'] = subprocess.run(command).returncode
+    return info['returncode']
+
+
+def load_events(directory):
+    events = []
+    for path in sorted(Path(directory).glob('events-*.jsonl')):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass  # Torn last line from a killed process
+    return events
+
+
+def write_trace(events, trace_path):
+    trace_path = Path(trace_path)
+    trace_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = trace_path.with_name(trace_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    os.replace(tmp_path, trace_path)
+
+
+def format_ms(micros):
+    """A duration in microseconds as milliseconds with one decimal."""
+    return f"{micros / 1000:.1f}"
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def short_name(name):
+    """Paths under the working directory are shown relative to it."""
+    if os.path.isabs(name):
+        relative = os.path.relpath(name)
+        if not relative.startswith('..'):
+            return relative
+    return name
+
+
+def print_table(title, headers, rows, out):
+    if not rows:
+        return
+    cells = [headers] + [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    print(f"\n{title}", file=out)
+    for n, row in enumerate(cells):
+        # First column left-aligned, numbers right-aligned
+        print('  '.join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+                        for i, cell in enumerate(row)), file=out)
+        if n == 0:
+            print('  '.join('-' * width for width in widths), file=out)
+
+
+def summarize(events, out=sys.stdout):
+    """Print span, per-category file, slowest-file and cache tables."""
+    spans = {}
+    files = {}
+    slowest = []
+    caches = {}
+    for event in events:
+        category = event.get('cat', '')
+        args = event.get('args', {})
+        if event.get('ph') == 'X' and args.get('file'):
+            entry = files.setdefault(category, [0, 0, 0, 0, 0])
+            entry[0] += 1
+            entry[1] += event['dur']
+            entry[2] = max(entry[2], event['dur'])
+            entry[3] += args.get('bytes_read', 0)
+            entry[4] += args.get('bytes_written', 0)
+            slowest.append((event['dur'], category, short_name(event['name'])))
+        elif event.get('ph') == 'X':
+            entry = spans.setdefault((category, event['name']), [0, 0, 0, 0, 0])
+            entry[0] += 1
+            entry[1] += event['dur']
+            entry[2] = max(entry[2], event['dur'])
+            entry[3] += args.get('bytes_read', 0)
+            entry[4] += args.get('bytes_written', 0)
+        elif event.get('ph') == 'i' and 'hit' in args:
+            entry = caches.setdefault(category, [0, 0])
+            entry[0 if args['hit'] else 1] += args.get('count', 1)
+
+    rows = sorted(spans.items(), key=lambda item: -item[1][1])[:SUMMARY_ROWS]
+    print_table('Spans (by total time)', ['span', 'category', 'count', 'total ms', 'max ms', 'read', 'written'],
+                [[name, category, n, format_ms(total), format_ms(longest),
+                  format_bytes(read), format_bytes(written)]
+                 for (category, name), (n, total, longest, read, written) in rows], out)
+    rows = sorted(files.items(), key=lambda item: -item[1][1])
+    print_table('Files (by category)', ['category', 'files', 'total ms', 'max ms', 'read', 'written'],
+                [[category, n, format_ms(total), format_ms(longest),
+                  format_bytes(read), format_bytes(written)]
+                 for category, (n, total, longest, read, written) in rows], out)
+    slowest.sort(reverse=True)
+    print_table('Slowest files', ['file', 'category', 'ms'],
+                [[name, category, format_ms(duration)]
+                 for duration, category, name in slowest[:SUMMARY_ROWS]], out)
+    print_table('Caches', ['category', 'hits', 'misses', 'hit rate'],
+                [[category, hits, misses, f"{100 * hits / (hits + misses):.0f}%"]
+                 for category, (hits, misses) in sorted(caches.items())], out)
+
+
+def report(directory, trace_path, out=sys.stdout):
+    """Merge a build's events into trace_path and print the summary."""
+    events = load_events(directory)
+    write_trace(events, trace_path)
+    summarize(events, out)
+    print(f"\nTrace: {trace_path} ({len(events)} events)", file=out)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == 'run':
+        # Without a profile to report into, just become the command
+        if not enabled():
+            try:
+                os.execvp(sys.argv[3], sys.argv[3:])
+            except OSError as e:
+                print(f"Error: cannot run {sys.argv[3]}: {e}", file=sys.stderr)
+                sys.exit(127)
+        sys.exit(run(sys.argv[2], sys.argv[3:]))
+
+    if len(sys.argv) in (3, 4) and sys.argv[1] == 'report':
+        directory = sys.argv[2]
+        if not os.path.isdir(directory):
+            print(f"Error: Event directory {directory} does not exist")
+            sys.exit(1)
+        report(directory, sys.argv[3] if len(sys.argv) == 4 else os.path.join(directory, 'trace.json'))
+        sys.exit(0)
+
+    print("Usage: build_profile.py report <event_dir> [trace.json]")
+    print("       build_profile.py run <name> <command> [args...]")
+    print("Example: BUILD_PROFILE=/tmp/prof build_profile.py run quarto-html quarto render --to html")
+    sys.exit(1)
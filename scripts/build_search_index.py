@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to build a compact inverted index from Quarto's search.json.
+serve.py loads the index into memory and answers /api/search?q= from it,
+so clients no longer have to download the whole search.json to search.
+Terms are normalized with persian_text (ی/ي, ک/ك, ZWNJ, Persian/Arabic digits).
+"""
+import json
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+
+import build_profile
+from persian_text import index_terms
+
+# Bump when the index layout changes so serve.py can reject stale files
+INDEX_VERSION = 1
+
+# Occurrences in a title or section heading count this many times as much
+TITLE_WEIGHT = 3
+
+INDEX_FILENAME = 'search-index.json'
+
+
+def build_index(entries):
+    """
+    Build the inverted index from search.json entries.
+    Returns a dict with:
+    - docs: href, title, section, crumbs, text and token count of each entry
+    - terms: normalized term -> flat [doc id, weight, doc id, weight, ...] list
+    """
+    docs = []
+    postings = {}
+    for doc_id, entry in enumerate(entries):
+        text = entry.get('text', '')
+        heading = ' '.join(filter(None, [entry.get('title', ''), entry.get('section', '')]))
+        weights = Counter(index_terms(text))
+        for term, count in Counter(index_terms(heading)).items():
+            weights[term] += count * TITLE_WEIGHT
+        docs.append({
+            'href': entry.get('href', ''),
+            'title': entry.get('title', ''),
+            'section': entry.get('section', ''),
+            'crumbs': entry.get('crumbs', []),
+            'text': text,
+            'length': sum(weights.values()),
+        })
+        for term, weight in weights.items():
+            postings.setdefault(term, []).extend((doc_id, weight))
+    return {
+        'version': INDEX_VERSION,
+        'docs': docs,
+        'terms': dict(sorted(postings.items())),
+    }
+
+
+def build_index_file(site_dir):
+    """
+    Read <site_dir>/search.json and write <site_dir>/search-index.json.
+    Returns a tuple of (documents, distinct terms), or None if there is no search.json.
+    """
+    search_json = Path(site_dir) / 'search.json'
+    if not search_json.exists():
+        return None
+    with open(search_json, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    index = build_index(entries)
+    output_path = Path(site_dir) / INDEX_FILENAME
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, output_path)
+    return len(index['docs']), len(index['terms'])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: build_search_index.py <site_directory>")
+        print("Example: build_search_index.py output/site")
+        sys.exit(1)
+
+    site_dir = sys.argv[1]
+    if not os.path.isdir(site_dir):
+        print(f"Error: Site directory {site_dir} does not exist")
+        sys.exit(1)
+
+    with build_profile.span('build_search_index', category='site'):
+        result = build_index_file(site_dir)
+    if result is None:
+        print(f"Warning: No search.json found in {site_dir}")
+        sys.exit(0)
+
+    doc_count, term_count = result
+    print(f"Built search index with {doc_count} document(s) and {term_count} term(s)")
@@ -6,7 +6,8 @@ find . -type f -name "README.md" -not -path "./README.md" | while read -r readme
     dir=$(dirname "$readme_file")
     mv "$readme_file" "$dir/index.md"
 done
-quarto render --to html
+# Timed into the build profile when BUILD_PROFILE is set (scripts/build_profile.py)
+uv run python3 ../../scripts/build_profile.py run quarto-html quarto render --to html
 # Remove all copied source files, but keep _quarto.yml, _site/, site_libs/, and the PDF
 find . -mindepth 1 -maxdepth 1 ! -name 'about.png' ! -name 'about.md' ! -name _metadata.yml ! -name 'header.html' ! -name 'prompts.txt' ! -name 'logo.svg' ! -name 'icon.png' ! -name '_quarto.yml' ! -name '_site' ! -name 'site_libs' ! -name '.quarto' ! -name 'index.qmd' ! -name 'about.qmd' ! -name 'theme.scss' ! -name 'theme-dark.scss' ! -exec rm -rf {} +
 rm -rf ../../output/site/*
@@ -32,9 +33,24 @@ done
 if [ -f "../../output/Chista.pdf" ]; then
   cp "../../output/Chista.pdf" "../../output/site/Chista.pdf"
 fi
+# Rewrite the site's mindmap pages to share one cached markmap runtime under site_libs
+if [ -d "../../output/site" ]; then
+  uv run python3 ../../convert.py --source ../../source --shared-runtime ../../output/site
+fi
 # Convert dates in HTML files to Jalali (Persian) format
 if [ -d "../../output/site" ] && [ -d "../../source" ]; then
   uv run python3 ../../scripts/convert_dates_to_jalali.py ../../source ../../output/site
 fi
+# Build the inverted index that serve.py answers /api/search from
+if [ -f "../../output/site/search.json" ]; then
+  uv run python3 ../../scripts/build_search_index.py ../../output/site
+  # Sharded copy of the index for the search box and static hosting without serve.py
+  uv run python3 ../../scripts/shard_search_index.py ../../output/site
+fi
+# Minify the pages, fingerprint project assets and write precompressed .gz/.br siblings
+# (must run after every step that edits the HTML)
+if [ -d "../../output/site" ]; then
+  uv run python3 ../../scripts/optimize_site.py ../../output/site
+fi
 rm -rf .quarto
 rm -rf _site
@@ -2,261 +2,372 @@
 # -*- coding: utf-8 -*-
 """
 Script to convert Gregorian dates in HTML files to Jalali (Persian) dates.
-Reads dates from metadata.yml files in source directory and updates corresponding HTML files.
+Reads dates from metadata.yml (or, failing that, _metadata.yml) files in source directory and updates corresponding HTML files.
+Pages unchanged since the last run (per a manifest of size, mtime, content
+hash and metadata dates) are skipped, and the rest are processed in parallel.
 """
+import argparse
+import functools
+import hashlib
+import json
 import sys
 import re
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
-try:
-    from khayyam import JalaliDatetime
+import build_profile
+from episode_metadata import DEFAULT_CACHE, load_index
+from html_rewrite import Rewriter, Rule
+from jalali import format_jalali
+
+
+@functools.lru_cache(maxsize=None)
+def convert_to_jalali(gregorian_date_str):
+    """
+    Convert a Gregorian date string to Jalali format.
+    Handles formats like: "Jan 15, 2024", "January 15, 2024", "2024-01-15"
+    Memoized: every listing item and page of an episode asks for the same date.
+    """
+    # Try different date formats
+    date_formats = [
+        "%Y-%m-%d",       # 2024-01-15 (ISO format - most common in metadata.yml)
+        "%b %d, %Y",      # Jan 15, 2024
+        "%B %d, %Y",      # January 15, 2024
+        "%d %b %Y",       # 15 Jan 2024
+        "%d %B %Y",       # 15 January 2024
+    ]
     
-    def convert_to_jalali(gregorian_date_str):
-        """
-        Convert a Gregorian date string to Jalali format.
-        Handles formats like: "Jan 15, 2024", "January 15, 2024", "2024-01-15"
-        """
-        # Try different date formats
-        date_formats = [
-            "%Y-%m-%d",       # 2024-01-15 (ISO format - most common in metadata.yml)
-            "%b %d, %Y",      # Jan 15, 2024
-            "%B %d, %Y",      # January 15, 2024
-            "%d %b %Y",       # 15 Jan 2024
-            "%d %B %Y",       # 15 January 2024
-        ]
-        
-        gregorian_date = None
-        for fmt in date_formats:
-            try:
-                gregorian_date = datetime.strptime(gregorian_date_str.strip(), fmt)
-                break
-            except ValueError:
-                continue
-        
-        if gregorian_date is None:
-            return None  # Return None if can't parse
-        
-        # Convert to Jalali
-        jalali_date = JalaliDatetime(gregorian_date)
-        
-        # Format: Persian date with month name (e.g., "۱۶ دی ۱۴۰۴")
-        persian_date = jalali_date.strftime('%d %B %Y')
-        
-        # Convert English numerals to Persian numerals
-        persian_digits = {
-            '0': '۰', '1': '۱', '2': '۲', '3': '۳', '4': '۴',
-            '5': '۵', '6': '۶', '7': '۷', '8': '۸', '9': '۹'
-        }
-        
-        # Replace each English digit with Persian digit
-        persian_date_converted = ''.join(persian_digits.get(char, char) for char in persian_date)
-        
-        return persian_date_converted
+    gregorian_date = None
+    for fmt in date_formats:
+        try:
+            gregorian_date = datetime.strptime(gregorian_date_str.strip(), fmt)
+            break
+        except ValueError:
+            continue
     
-    def read_metadata_dates(source_dir):
-        """
-        Read dates from all metadata.yml files in source directory.
-        Returns a dict mapping folder names to dates.
-        """
-        date_map = {}
-        source_path = Path(source_dir)
-        
-        if not source_path.exists():
-            return date_map
-        
-        # Find all metadata.yml files
-        for metadata_file in source_path.rglob('metadata.yml'):
-            try:
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    # Parse YAML (handle both YAML and simple key:value format)
-                    metadata = {}
-                    for line in content.split('\n'):
-                        if ':' in line and not line.strip().startswith('#'):
-                            key, value = line.split(':', 1)
-                            key = key.strip()
-                            value = value.strip().strip('"').strip("'")
-                            metadata[key] = value
-                    
-                    if 'date' in metadata:
-                        folder_name = metadata_file.parent.name
-                        date_map[folder_name] = metadata['date']
-            except Exception as e:
-                print(f"Warning: Could not read {metadata_file}: {e}")
-                continue
-        
-        return date_map
+    if gregorian_date is None:
+        return None  # Return None if can't parse
     
-    def update_html_with_jalali_date(html_content, jalali_date):
-        """
-        Update HTML content to replace dates in listing-date divs with Jalali date.
-        """
-        # Pattern to match content inside listing-date divs
-        # This will match any text between <div class="listing-date"> and </div>
-        pattern = r'(<div class="listing-date">\s*)(.*?)(\s*</div>)'
-        
-        def replace_date(match):
-            return match.group(1) + jalali_date + match.group(3)
+    # Persian date with month name and Persian digits (e.g., "۱۶ دی ۱۴۰۴")
+    return format_jalali(gregorian_date)
+
+
+def read_metadata_dates(source_dir, cache_path=DEFAULT_CACHE):
+    """
+    Read dates from the episodes' metadata.yml files (via the metadata index,
+    cached in cache_path). An episode without a date in metadata.yml uses the
+    one in its _metadata.yml, which is the date Quarto renders on its pages.
+    Returns a dict mapping folder names to dates.
+    """
+    if not Path(source_dir).exists():
+        return {}
+    return load_index(source_dir, cache_path).date_map()
+
+
+# Content inside listing-date divs: any text between <div class="listing-date"> and </div>
+LISTING_DATE_PATTERN = re.compile(r'(<div class="listing-date">\s*)(.*?)(\s*</div>)', re.DOTALL)
+
+
+# Content inside <p class="date"> elements at the top of blog posts
+PAGE_DATE_PATTERN = re.compile(r'(<p class="date">)(.*?)(</p>)', re.DOTALL)
+
+
+def replace_date(match, jalali_date):
+    """Keep the opening and closing markup (and whitespace), swap the date in between."""
+    return match.group(1) + jalali_date + match.group(3)
+
+
+# Both date locations of an episode page, rewritten in a single scan
+PAGE_DATES_REWRITER = Rewriter([
+    Rule('listing-date', LISTING_DATE_PATTERN, replace_date),
+    Rule('page-date', PAGE_DATE_PATTERN, replace_date),
+])
+
+
+# Episode links and listing-date divs of the site index, in document order
+LISTING_TOKEN_PATTERN = re.compile(
+    r'<a href="\./(?P<folder>[^/]+)/'
+    r'|(?P<open><div class="listing-date">\s*)(?P<date>.*?)(?P<close>\s*</div>)',
+    re.DOTALL,
+)
+
+
+# A listing-date div belongs to the closest episode link at most this many characters before it
+LISTING_HREF_LOOKBACK = 500
+
+
+def convert_listing_dates(html_content, date_map):
+    """
+    Replace the date in every listing-date div of the site index with the
+    Jalali date of the episode linked just before it.
+    A single forward scan tracks the most recent episode link, and the
+    output is emitted with one join, so the cost is linear in the page size.
+    """
+    parts = []
+    cursor = 0
+    folder_name = None
+    folder_start = 0
+    for match in LISTING_TOKEN_PATTERN.finditer(html_content):
+        if match.group('folder') is not None:
+            folder_name = match.group('folder')
+            folder_start = match.start()
+            continue
         
-        modified_content = re.sub(pattern, replace_date, html_content, flags=re.DOTALL)
+        # Only use a link that is close enough to belong to this listing item
+        if folder_name is None or match.start() - folder_start > LISTING_HREF_LOOKBACK:
+            continue
+        if folder_name not in date_map:
+            continue
+        jalali_date = convert_to_jalali(date_map[folder_name])
+        if not jalali_date or jalali_date == match.group('date').strip():
+            continue
         
-        return modified_content
+        # Replace the date content within the div, preserving whitespace
+        parts.append(html_content[cursor:match.start()])
+        parts.append(match.group('open') + jalali_date + match.group('close'))
+        cursor = match.end()
     
-    def update_html_page_date(html_content, jalali_date):
-        """
-        Update HTML content to replace dates in <p class="date"> elements at the top of blog posts.
-        """
-        # Pattern to match content inside <p class="date"> elements
-        # This will match any text between <p class="date"> and </p>
-        pattern = r'(<p class="date">)(.*?)(</p>)'
-        
-        def replace_date(match):
-            return match.group(1) + jalali_date + match.group(3)
-        
-        modified_content = re.sub(pattern, replace_date, html_content, flags=re.DOTALL)
-        
-        return modified_content
+    if not parts:
+        return html_content
+    parts.append(html_content[cursor:])
+    return ''.join(parts)
+
+
+def convert_html_dates(html_content, date_map, html_file_path, site_root):
+    """
+    Find and convert date strings in HTML content based on metadata dates.
+    site_root is the site directory the page belongs to (e.g. "output/site").
+    """
+    # Extract folder name from HTML file path (e.g., "001-Mind-Body-Unity" from "output/site/001-Mind-Body-Unity/index.html")
+    html_path = Path(html_file_path)
+    in_site_root = os.path.abspath(html_path.parent) == os.path.abspath(site_root)
     
-    def convert_html_dates(html_content, date_map, html_file_path):
-        """
-        Find and convert date strings in HTML content based on metadata dates.
-        """
-        # Extract folder name from HTML file path (e.g., "001-Mind-Body-Unity" from "output/site/001-Mind-Body-Unity/index.html")
-        html_path = Path(html_file_path)
-        
-        # Check if this is the main site index.html (in the site root) vs a blog post index.html (in a subdirectory)
-        # The main site index is directly under the 'site' folder
-        is_main_site_index = html_path.name == 'index.html' and html_path.parent.name == 'site'
-        
-        # If this is the main site index.html, we need to handle listing-date divs
-        if is_main_site_index:
-            # Find all listing-date divs and match them to folder names from nearby hrefs
-            modified_content = html_content
-            
-            # Find all listing-date divs
-            date_div_pattern = r'<div class="listing-date">\s*(.*?)\s*</div>'
-            date_matches = list(re.finditer(date_div_pattern, modified_content, flags=re.DOTALL))
-            
-            # Process each date div
-            replacements = []
-            for date_match in date_matches:
-                date_start = date_match.start()
-                date_end = date_match.end()
-                current_date = date_match.group(1).strip()
-                full_div = date_match.group(0)
-                
-                # Look backwards in the content to find the nearest href with folder name
-                # Search up to 500 characters before the date div
-                search_start = max(0, date_start - 500)
-                context_before = modified_content[search_start:date_start]
-                
-                # Find all hrefs in the context before this date div
-                href_matches = list(re.finditer(r'<a href="\./([^/]+)/', context_before))
-                
-                if href_matches:
-                    # Use the last (closest) href match
-                    folder_name = href_matches[-1].group(1)
-                    
-                    # Check if we have a date for this folder in metadata
-                    if folder_name in date_map:
-                        gregorian_date = date_map[folder_name]
-                        jalali_date = convert_to_jalali(gregorian_date)
-                        if jalali_date and jalali_date != current_date:
-                            # Replace the date content within the div, preserving whitespace
-                            new_div = re.sub(
-                                r'(<div class="listing-date">\s*)(.*?)(\s*</div>)',
-                                r'\1' + jalali_date + r'\3',
-                                full_div,
-                                flags=re.DOTALL
-                            )
-                            replacements.append((date_start, date_end, new_div))
-            
-            # Apply replacements from end to start to preserve indices
-            for start, end, new_div in reversed(replacements):
-                modified_content = modified_content[:start] + new_div + modified_content[end:]
-            
-            return modified_content
-        else:
-            # For other HTML files, find the folder name and update dates
-            folder_name = html_path.parent.name if html_path.parent.name != 'site' else html_path.stem
-            
-            if folder_name in date_map:
-                gregorian_date = date_map[folder_name]
-                jalali_date = convert_to_jalali(gregorian_date)
-                if jalali_date:
-                    # Update listing-date divs
-                    modified_content = update_html_with_jalali_date(html_content, jalali_date)
-                    # Update <p class="date"> elements at the top of blog posts
-                    modified_content = update_html_page_date(modified_content, jalali_date)
-                    return modified_content
-            
-            return html_content
+    # Check if this is the main site index.html (in the site root) vs a blog post index.html (in a subdirectory)
+    is_main_site_index = in_site_root and html_path.name == 'index.html'
     
-    if __name__ == "__main__":
-        import glob
-        
-        if len(sys.argv) < 3:
-            print("Usage: convert_dates_to_jalali.py <source_directory> <html_output_directory>")
-            print("Example: convert_dates_to_jalali.py source output/site")
-            sys.exit(1)
-        
-        source_dir = sys.argv[1]
-        html_output_dir = sys.argv[2]
+    # If this is the main site index.html, we need to handle listing-date divs
+    if is_main_site_index:
+        return convert_listing_dates(html_content, date_map)
+    else:
+        # For other HTML files, find the folder name and update dates
+        folder_name = html_path.stem if in_site_root else html_path.parent.name
         
-        if not os.path.isdir(source_dir):
-            print(f"Error: Source directory {source_dir} does not exist")
-            sys.exit(1)
+        if folder_name in date_map:
+            gregorian_date = date_map[folder_name]
+            jalali_date = convert_to_jalali(gregorian_date)
+            if jalali_date:
+                # Update listing-date divs and <p class="date"> elements in one pass
+                return PAGE_DATES_REWRITER.rewrite(html_content, jalali_date).text
         
-        if not os.path.isdir(html_output_dir):
-            print(f"Error: HTML output directory {html_output_dir} does not exist")
-            sys.exit(1)
-        
-        # Read dates from metadata.yml files
-        print(f"Reading dates from metadata.yml files in {source_dir}...")
-        date_map = read_metadata_dates(source_dir)
-        
-        if not date_map:
-            print("Warning: No dates found in metadata.yml files")
-            sys.exit(0)
-        
-        print(f"Found dates for {len(date_map)} folders:")
-        for folder, date in date_map.items():
-            jalali_date = convert_to_jalali(date)
-            print(f"  {folder}: {date} -> {jalali_date}")
-        
-        # Find all HTML files recursively
-        html_files = glob.glob(os.path.join(html_output_dir, '**/*.html'), recursive=True)
-        
-        if not html_files:
-            print(f"No HTML files found in {html_output_dir}")
-            sys.exit(0)
+        return html_content
+
+
+# Bytes that any page with a date to convert must contain
+DATE_MARKERS = (b'listing-date', b'class="date"')
+
+
+# Generated files that never carry episode dates
+EXCLUDED_DIRS = {'site_libs'}
+
+
+EXCLUDED_NAMES = {'mindmap_auto.html'}
+
+
+# Hash of this script; changing the conversion invalidates the manifest
+CONVERTER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+
+DEFAULT_MANIFEST = Path(__file__).resolve().parent.parent / '.cache' / 'jalali-dates-manifest.json'
+
+
+def date_map_hash(date_map):
+    """Hash of the metadata dates and converter version the pages were processed with."""
+    payload = json.dumps([CONVERTER_VERSION, date_map], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def find_html_files(html_output_dir):
+    """All HTML pages of the site, except site_libs and the mindmap pages."""
+    for root, dirs, files in os.walk(html_output_dir):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+        for name in sorted(files):
+            if name.endswith('.html') and name not in EXCLUDED_NAMES:
+                yield os.path.join(root, name)
+
+
+def manifest_entry(path, data, map_hash):
+    stat = os.stat(path)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': hashlib.sha256(data).hexdigest(),
+        'date_map_hash': map_hash,
+    }
+
+
+def process_html_file(html_file, date_map, map_hash, site_root):
+    """
+    Pool worker: convert the dates of one page, replacing the file
+    atomically if anything changed.
+    Returns (changed, manifest entry).
+    """
+    start = time.perf_counter()
+    with open(html_file, 'rb') as f:
+        data = f.read()
+    bytes_read = len(data)
+    html_content = data.decode('utf-8')
+    converted_content = convert_html_dates(html_content, date_map, html_file, site_root)
+    changed = converted_content != html_content
+    if changed:
+        data = converted_content.encode('utf-8')
+        tmp_path = html_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, html_file)
+    build_profile.file_done('jalali', html_file, time.perf_counter() - start,
+                            bytes_read=bytes_read, bytes_written=len(data) if changed else 0)
+    return changed, manifest_entry(html_file, data, map_hash)
+
+
+def convert_site_dates(html_output_dir, date_map, manifest_path=DEFAULT_MANIFEST, jobs=None, force=False):
+    """
+    Convert the dates of every page that changed since the last run.
+    A page is skipped when its size and mtime (or content hash) and the date map match the
+    manifest, or when it contains none of the date markers. The rest are
+    processed across a process pool.
+    Returns a tuple of (pages examined, pages converted, errors).
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    map_hash = date_map_hash(date_map)
+    new_manifest = {}
+    candidates = []
+    examined = 0
+    hits = 0
+    
+    for html_file in find_html_files(html_output_dir):
+        examined += 1
+        key = os.path.relpath(html_file, html_output_dir)
+        stat = os.stat(html_file)
+        entry = manifest.get(key)
+        if (not force and entry is not None
+                and entry.get('size') == stat.st_size
+                and entry.get('mtime_ns') == stat.st_mtime_ns
+                and entry.get('date_map_hash') == map_hash):
+            new_manifest[key] = entry
+            hits += 1
+            continue
         
-        converted_count = 0
-        for html_file in html_files:
+        with open(html_file, 'rb') as f:
+            data = f.read()
+        # Only touched (e.g. copied again): the content is what we left last time
+        if (not force and entry is not None
+                and entry.get('date_map_hash') == map_hash
+                and entry.get('hash') == hashlib.sha256(data).hexdigest()):
+            new_manifest[key] = manifest_entry(html_file, data, map_hash)
+            hits += 1
+            continue
+        # Cheap byte search before decoding and running the regexes
+        if not any(marker in data for marker in DATE_MARKERS):
+            new_manifest[key] = manifest_entry(html_file, data, map_hash)
+            continue
+        candidates.append((key, html_file))
+    build_profile.cache('jalali', hit=True, count=hits)
+    build_profile.cache('jalali', hit=False, count=examined - hits)
+    
+    converted = 0
+    errors = 0
+    
+    def collect(key, html_file, result):
+        nonlocal converted
+        changed, entry = result
+        new_manifest[key] = entry
+        if changed:
+            converted += 1
+            print(f"Converted dates in {html_file}")
+    
+    if len(candidates) <= 1 or jobs == 1:
+        for key, html_file in candidates:
             try:
-                # Read HTML file
-                with open(html_file, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
-                
-                # Convert dates based on metadata
-                converted_content = convert_html_dates(html_content, date_map, html_file)
-                
-                # Only write if content changed
-                if converted_content != html_content:
-                    # Write back
-                    with open(html_file, 'w', encoding='utf-8') as f:
-                        f.write(converted_content)
-                    converted_count += 1
-                    print(f"Converted dates in {html_file}")
-            
+                collect(key, html_file, process_html_file(html_file, date_map, map_hash, html_output_dir))
             except Exception as e:
+                errors += 1
                 print(f"Error processing {html_file}: {e}")
-        
-        print(f"Successfully converted dates in {converted_count} file(s)")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(process_html_file, html_file, date_map, map_hash, html_output_dir): (key, html_file)
+                for key, html_file in candidates
+            }
+            for future in as_completed(futures):
+                key, html_file = futures[future]
+                try:
+                    collect(key, html_file, future.result())
+                except Exception as e:
+                    errors += 1
+                    print(f"Error processing {html_file}: {e}")
+    
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return examined, converted, errors
 
-except ImportError:
-    print("Error: khayyam library not installed. Install it with: pip install khayyam")
-    sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Convert Gregorian dates in the generated site to Jalali, skipping unchanged pages.')
+    parser.add_argument('source_directory', help='Directory with the episode metadata.yml/_metadata.yml files')
+    parser.add_argument('html_output_directory', help='Generated site directory (e.g. output/site)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='Process every page even if it is unchanged since the last run')
+    parser.add_argument('--manifest', default=str(DEFAULT_MANIFEST),
+                        help='Manifest file used to skip unchanged pages')
+    args = parser.parse_args()
+    
+    source_dir = args.source_directory
+    html_output_dir = args.html_output_directory
+    
+    if not os.path.isdir(source_dir):
+        print(f"Error: Source directory {source_dir} does not exist")
+        sys.exit(1)
+    
+    if not os.path.isdir(html_output_dir):
+        print(f"Error: HTML output directory {html_output_dir} does not exist")
+        sys.exit(1)
+    
+    # Read dates from metadata.yml files (falling back to _metadata.yml)
+    print(f"Reading dates from metadata.yml/_metadata.yml files in {source_dir}...")
+    date_map = read_metadata_dates(source_dir)
+    
+    if not date_map:
+        print("Warning: No dates found in metadata.yml/_metadata.yml files")
+        sys.exit(0)
+    
+    print(f"Found dates for {len(date_map)} folders:")
+    for folder, date in date_map.items():
+        jalali_date = convert_to_jalali(date)
+        print(f"  {folder}: {date} -> {jalali_date}")
+    
+    with build_profile.span('convert_site_dates', category='jalali'):
+        examined, converted_count, errors = convert_site_dates(
+            html_output_dir, date_map, args.manifest, args.jobs, args.force)
+    
+    if not examined:
+        print(f"No HTML files found in {html_output_dir}")
+        sys.exit(0)
+    
+    print(f"Successfully converted dates in {converted_count} file(s) ({examined} examined)")
+    if errors:
+        sys.exit(1)
 
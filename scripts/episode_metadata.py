@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metadata index of the episodes under source/.
+Parses every episode's metadata.yml and _metadata.yml once and keeps the
+result in .cache/metadata-index.json. Cached entries are reused while the
+files' size and mtime (or, failing that, content hash) are unchanged.
+Build scripts query the index instead of walking the tree and re-parsing
+the YAML themselves:
+
+    index = load_index('source')
+    for episode in index.episodes:
+        print(episode.folder, episode.title, episode.date)
+"""
+import hashlib
+import json
+import os
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+# Bump when the cached record layout changes
+INDEX_VERSION = 1
+
+METADATA_FILES = ('metadata.yml', '_metadata.yml')
+
+DEFAULT_CACHE = Path(__file__).resolve().parent.parent / '.cache' / 'metadata-index.json'
+
+
+@dataclass(frozen=True)
+class Episode:
+    """An episode folder and its metadata (metadata.yml, falling back to _metadata.yml)."""
+    folder: str
+    path: str
+    title: str = ''
+    date: str = ''
+    description: str = ''
+    author: str = ''
+    image: str = ''
+    original_link: str = ''
+    audio: str = ''
+    video: str = ''
+    original_audio: str = ''
+    original_video: str = ''
+    # Any other keys, merged the same way
+    extra: dict = field(default_factory=dict)
+
+    def file(self, name):
+        """Path of a file inside the episode folder."""
+        return Path(self.path) / name
+
+
+EPISODE_FIELDS = [name for name in Episode.__dataclass_fields__ if name not in ('folder', 'path', 'extra')]
+
+
+def parse_metadata(content):
+    """
+    Parse a flat metadata file of "key: value" lines.
+    Comments are skipped and surrounding quotes removed; values stay strings
+    (dates are kept as written, e.g. "2026-01-05").
+    """
+    metadata = {}
+    for line in content.split('\n'):
+        if ':' in line and not line.strip().startswith('#'):
+            key, value = line.split(':', 1)
+            key = key.strip()
+            value = value.strip().strip('"').strip("'")
+            metadata[key] = value
+    return metadata
+
+
+def make_episode(folder, path, files):
+    """Build an Episode from the parsed files; metadata.yml wins over _metadata.yml."""
+    merged = {}
+    for name in reversed(METADATA_FILES):
+        merged.update(files.get(name, {}))
+    known = {key: merged.pop(key) for key in EPISODE_FIELDS if key in merged}
+    return Episode(folder=folder, path=str(path), extra=merged, **known)
+
+
+class MetadataIndex:
+    """Episodes of a source directory, sorted by folder name."""
+
+    def __init__(self, episodes):
+        self.episodes = sorted(episodes, key=lambda episode: episode.folder)
+        self._by_folder = {episode.folder: episode for episode in self.episodes}
+
+    def __iter__(self):
+        return iter(self.episodes)
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def get(self, folder):
+        return self._by_folder.get(folder)
+
+    def date_map(self):
+        """
+        Folder name -> date string, for the episodes that have a date.
+        Like every field, the date comes from metadata.yml and falls back to
+        _metadata.yml (the file Quarto takes the page date from); the old
+        metadata.yml-only reader left such episodes' dates unconverted.
+        """
+        return {episode.folder: episode.date for episode in self.episodes if episode.date}
+
+
+def file_signature(path, cached=None):
+    """
+    Return the (size, mtime_ns, sha256) signature of a file, reusing the
+    cached hash when size and mtime are unchanged. None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached
+    return [stat.st_size, stat.st_mtime_ns, hashlib.sha256(Path(path).read_bytes()).hexdigest()]
+
+
+def load_index(source_dir, cache_path=DEFAULT_CACHE):
+    """
+    Return the MetadataIndex of <source_dir>, reparsing only the metadata
+    files that changed since the cache was written.
+    """
+    source_path = Path(source_dir)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') != INDEX_VERSION or cache.get('source') != str(source_path.resolve()):
+            cache = {}
+    except (FileNotFoundError, ValueError):
+        cache = {}
+    cached_folders = cache.get('folders', {})
+
+    folders = {}
+    episodes = []
+    dirty = False
+    for folder_path in sorted(path for path in source_path.iterdir() if path.is_dir()):
+        if folder_path.name.startswith('.'):
+            continue
+        cached = cached_folders.get(folder_path.name, {})
+        signatures = {}
+        parsed = {}
+        for name in METADATA_FILES:
+            previous = cached.get('signatures', {}).get(name)
+            signature = file_signature(folder_path / name, previous)
+            if signature is None:
+                continue
+            signatures[name] = signature
+            if previous is not None and previous[2] == signature[2] and name in cached.get('parsed', {}):
+                parsed[name] = cached['parsed'][name]
+            else:
+                try:
+                    parsed[name] = parse_metadata((folder_path / name).read_text(encoding='utf-8'))
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"Warning: Could not read {folder_path / name}: {e}")
+                    del signatures[name]
+                    continue
+                dirty = True
+            if previous != signature:
+                dirty = True
+        if set(cached.get('signatures', {})) != set(signatures):
+            dirty = True
+        folders[folder_path.name] = {'signatures': signatures, 'parsed': parsed}
+        episodes.append(make_episode(folder_path.name, folder_path, parsed))
+
+    if dirty or set(cached_folders) != set(folders):
+        cache_path = Path(cache_path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'source': str(source_path.resolve()), 'folders': folders},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, cache_path)
+    return MetadataIndex(episodes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: episode_metadata.py <source_directory> [field ...]")
+        print("Example: episode_metadata.py source title date")
+        sys.exit(1)
+
+    source_dir = sys.argv[1]
+    if not os.path.isdir(source_dir):
+        print(f"Error: Source directory {source_dir} does not exist")
+        sys.exit(1)
+
+    # Print one tab-separated line per episode, for use from the shell scripts
+    fields = sys.argv[2:] or ['title', 'date']
+    for episode in load_index(source_dir):
+        record = asdict(episode)
+        values = [str(record.get(name, episode.extra.get(name, ''))) for name in fields]
+        print('\t'.join([episode.folder] + values))
@@ -5,12 +5,44 @@ Fix bidirectional text issues with parentheses containing English text.
 When English text appears in parentheses after Farsi text, LaTeX bidi package
 reverses the parentheses. This script wraps English text in parentheses
 with \LR{} to force LTR direction.
+
+Files are streamed one paragraph at a time, so memory stays bounded by the
+largest paragraph rather than the size of the book. Use "-" for stdin/stdout
+to run it in a pipe:
+
+    cat output/Chista.md | fix_bidi_parentheses.py - > Chista.fixed.md
+
+Several files or globs are fixed in place across a process pool. Files whose
+content hash and fixer version match .cache/bidi-manifest.json are skipped:
+
+    fix_bidi_parentheses.py 'source/*/*.md'
+
+The old "<input> <output>" form still works when the output does not exist
+yet (or is "-"); if it does, use -o <output>, or --in-place to fix both files.
 """
 
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+import build_profile
+
+# Size of the buffered writer used when streaming
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Changes whenever this script changes, invalidating the manifest entries
+FIXER_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+DEFAULT_MANIFEST = Path(__file__).resolve().parent.parent / '.cache' / 'bidi-manifest.json'
+
 
 def contains_english(text):
     """Check if text contains English characters."""
@@ -23,135 +55,404 @@ def contains_farsi(text):
     return bool(re.search(r'[\u0600-\u06FF]', text))
 
 
+# Spans that are never rewritten, in priority order for spans starting at the
+# same position. Images come before links so the "!" stays with its link.
+PROTECTED_PATTERNS = (
+    r'```\{=latex\}.*?```',                                   # LaTeX blocks
+    r'```[^`]*```',                                           # code blocks
+    r'!\[[^\]]*\]\([^)]+\)',                                  # images
+    r'\[[^\]]*\]\([^)]+\)',                                   # links
+    r'`[^`]+`',                                               # inline code
+    r'\\LR\{[^}]*\([^)]*[A-Za-z][^)]*\)[^}]*\}',              # already wrapped
+    r'\\textenglish\{[^}]*\([^)]*[A-Za-z][^)]*\)[^}]*\}',     # already wrapped
+)
+PROTECTED = '(?s:' + '|'.join(PROTECTED_PATTERNS) + ')'
+PROTECTED_PATTERN = re.compile(PROTECTED)
+
+# One token per match: a protected span, or a parenthesized segment whose
+# content may itself contain protected spans (a link inside parentheses is
+# consumed whole, so its ")" does not end the segment). Runs of characters
+# that cannot start a protected span are taken in bulk, and the possessive
+# loop never backtracks, so the scan stays linear. The alternatives are kept
+# at the top level so the regex engine can skip ahead to their first characters.
+TOKEN_PATTERN = re.compile(
+    '(?s)' + '|'.join(PROTECTED_PATTERNS)
+    + rf'|\((?P<content>(?:[^)`!\[\\]++|{PROTECTED}|[`!\[\\])*+)\)'
+)
+
+# Stands in for a protected span when checking a parenthesized segment;
+# protected spans count as English text there
+PROTECTED_MARK = '\x00'
+
+
+def wrap_parentheses(match):
+    """Return the replacement for one parenthesized segment."""
+    content = match.group('content')
+    masked = PROTECTED_PATTERN.sub(PROTECTED_MARK, content)
+    # Skip URLs (containing :// or starting with http)
+    if '://' in masked or masked.strip().startswith('http'):
+        return match.group(0)
+    # Only wrap if it contains English characters (or a protected span)
+    if PROTECTED_MARK in masked or contains_english(masked):
+        # Wrap with \LR{} to force LTR direction - LaTeX will handle the content as-is
+        return r'\LR{(' + content + r')}'
+    return match.group(0)
+
+
 def fix_parentheses(text):
+    """Return text with parentheses containing English wrapped in \\LR{}."""
+    return fix_parentheses_counted(text)[0]
+
+
+def fix_parentheses_counted(text):
     """
     Fix parentheses containing English text that appears after Farsi text.
     
     Pattern: Farsi text followed by (English Text)
     Solution: Wrap with \LR{(English Text)} to force LTR direction
-    """
-    # First, protect markdown syntax and already-wrapped text
-    protected_placeholders = {}
-    placeholder_counter = 0
-    
-    # Protect markdown links: [text](url) or [text](url "title")
-    markdown_link_pattern = r'\[([^\]]*)\]\(([^)]+)\)'
-    for match in re.finditer(markdown_link_pattern, text):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
-    
-    # Protect markdown images: ![alt](url) or ![](url)
-    markdown_image_pattern = r'!\[([^\]]*)\]\(([^)]+)\)'
-    for match in re.finditer(markdown_image_pattern, text):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
-    
-    # Protect code blocks: ```code``` (multiline)
-    code_block_pattern = r'```[^`]*```'
-    for match in re.finditer(code_block_pattern, text, re.DOTALL):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
     
-    # Protect inline code: `code`
-    inline_code_pattern = r'`[^`]+`'
-    for match in re.finditer(inline_code_pattern, text):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
+    Markdown links and images, code, LaTeX blocks and already-wrapped
+    text are left untouched. The text is tokenized in one left-to-right
+    scan and the output is assembled with a single join.
     
-    # Protect LaTeX blocks: ```{=latex}...```
-    latex_block_pattern = r'```\{=latex\}.*?```'
-    for match in re.finditer(latex_block_pattern, text, re.DOTALL):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
-    
-    # Find and protect already-wrapped \LR{...} blocks
-    protected_pattern = r'\\LR\{[^}]*\([^)]*[A-Za-z][^)]*\)[^}]*\}'
-    for match in re.finditer(protected_pattern, text):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
-    
-    # Also protect \textenglish{...} blocks if they exist
-    protected_pattern2 = r'\\textenglish\{[^}]*\([^)]*[A-Za-z][^)]*\)[^}]*\}'
-    for match in re.finditer(protected_pattern2, text):
-        placeholder = f"__PROTECTED_{placeholder_counter}__"
-        protected_placeholders[placeholder] = match.group(0)
-        text = text.replace(match.group(0), placeholder, 1)
-        placeholder_counter += 1
-    
-    # Pattern to match: ( followed by English text, then )
-    # This matches parentheses that contain at least one English letter
-    # Exclude URLs (containing :// or starting with http)
-    pattern = r'\(([^)]*[A-Za-z][^)]*)\)'
-    
-    def replace_func(match):
-        content = match.group(1)
-        # Skip if it's a URL (contains :// or starts with http)
-        if '://' in content or content.strip().startswith('http'):
-            return match.group(0)
-        # Only wrap if it contains English characters
-        if content and contains_english(content):
-            # Wrap with \LR{} to force LTR direction - LaTeX will handle the content as-is
-            return r'\LR{(' + content + r')}'
-        return match.group(0)  # Return unchanged if no English
-    
-    # Replace all occurrences
-    fixed_text = re.sub(pattern, replace_func, text)
+    Returns a tuple of (fixed text, number of parentheses wrapped).
+    """
+    parts = []
+    cursor = 0
+    wrapped = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        if match.group('content') is None:
+            # A protected span: copied through unchanged
+            continue
+        replacement = wrap_parentheses(match)
+        if replacement == match.group(0):
+            continue
+        parts.append(text[cursor:match.start()])
+        parts.append(replacement)
+        cursor = match.end()
+        wrapped += 1
+    parts.append(text[cursor:])
+    return ''.join(parts), wrapped
+
+
+def is_fence(line):
+    """Whether a line opens or closes a fenced block (```, ```{=latex}, ```python, ...)."""
+    stripped = line.strip()
+    # A line like ```code``` opens and closes on the same line: it is plain text
+    return stripped.startswith('```') and stripped.count('```') == 1
+
+
+def fix_lines(lines, counts=None):
+    """
+    Streaming version of fix_parentheses: yield the fixed text of an
+    iterable of lines (with their line endings).
     
-    # Restore protected blocks
-    for placeholder, original in protected_placeholders.items():
-        fixed_text = fixed_text.replace(placeholder, original)
+    Lines are collected into paragraphs, which end at a blank line, and each
+    paragraph is fixed as a whole, so links and parentheses wrapped over
+    several lines are still handled. Fenced code and ```{=latex} blocks are
+    tracked across lines and passed through untouched, however long.
+    Parentheses spanning a blank line are not wrapped.
+    If counts (a dict) is given, counts['wrapped'] is increased by the
+    number of parentheses wrapped.
+    """
+    def fix(paragraph):
+        text, wrapped = fix_parentheses_counted(''.join(paragraph))
+        if counts is not None:
+            counts['wrapped'] = counts.get('wrapped', 0) + wrapped
+        return text
     
-    return fixed_text
+    paragraph = []
+    in_fence = False
+    for line in lines:
+        if in_fence:
+            yield line
+            in_fence = not is_fence(line)
+        elif is_fence(line):
+            if paragraph:
+                yield fix(paragraph)
+                paragraph = []
+            yield line
+            in_fence = True
+        elif line.strip():
+            paragraph.append(line)
+        else:
+            paragraph.append(line)
+            yield fix(paragraph)
+            paragraph = []
+    if paragraph:
+        yield fix(paragraph)
+
+
+def open_input(path):
+    """Open a file (or stdin for "-") for reading as UTF-8 text."""
+    if str(path) == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def open_output(path):
+    """Open a file (or stdout for "-") for buffered writing as UTF-8 text."""
+    if str(path) == '-':
+        return io.TextIOWrapper(io.BufferedWriter(sys.stdout.buffer, WRITE_BUFFER_SIZE),
+                                encoding='utf-8', write_through=False)
+    return open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+
+
+def fix_file(input_file, output_file):
+    """
+    Stream input_file through fix_lines into output_file. Either path may be
+    "-" for stdin/stdout. When both are the same file the result is streamed
+    to a temporary file next to it, which then replaces it.
+    Returns the number of parentheses wrapped.
+    """
+    in_place = str(input_file) != '-' and str(output_file) != '-' and (
+        Path(output_file).exists() and Path(input_file).resolve() == Path(output_file).resolve())
+    target = Path(str(output_file) + '.tmp') if in_place else output_file
+    counts = {}
+    try:
+        with open_input(input_file) as source:
+            output = open_output(target)
+            try:
+                for chunk in fix_lines(source, counts):
+                    output.write(chunk)
+            finally:
+                if str(target) == '-':
+                    # Flush but keep the process's stdout open
+                    output.flush()
+                    output.detach()
+                else:
+                    output.close()
+        if in_place:
+            os.replace(target, output_file)
+    except BaseException:
+        if in_place and target.exists():
+            target.unlink()
+        raise
+    return counts.get('wrapped', 0)
 
 
 def process_file(input_file, output_file):
     """Process a markdown file to fix bidirectional parentheses issues."""
+    # Keep status messages out of the output when it goes to stdout
+    log = sys.stderr if str(output_file) == '-' else sys.stdout
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Fix parentheses issues
-        fixed_content = fix_parentheses(content)
-        
-        # Write the fixed content
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(fixed_content)
-        
-        print(f"Fixed bidirectional parentheses in: {input_file}")
+        wrapped = fix_file(input_file, output_file)
+        print(f"Fixed bidirectional parentheses in: {input_file} ({wrapped} wrapped)", file=log)
         return True
     except Exception as e:
         print(f"Error processing {input_file}: {e}", file=sys.stderr)
         return False
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: fix_bidi_parentheses.py <input_file> [output_file]")
-        print("If output_file is not provided, input_file will be modified in place.")
-        sys.exit(1)
+def file_hash(path):
+    """SHA-256 of a file's contents (read in chunks), or None if it does not exist."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(manifest_path, manifest):
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def is_up_to_date(entry, input_hash, output_file):
+    """
+    A file is up to date when the manifest recorded the same input hash,
+    output path and fixer version, and the output is still unchanged. For
+    files fixed in place the recorded input hash is that of the fixed file.
+    """
+    return (
+        entry is not None
+        and entry.get('input_hash') == input_hash
+        and entry.get('fixer_version') == FIXER_VERSION
+        and entry.get('output') == str(output_file)
+        and entry.get('output_hash') == file_hash(output_file)
+    )
+
+
+def fix_job(input_file, output_file):
+    """Pool worker: fix one file and return (output hash, wrapped count, seconds)."""
+    start = time.perf_counter()
+    bytes_read = build_profile.file_size(input_file)
+    wrapped = fix_file(input_file, output_file)
+    seconds = time.perf_counter() - start
+    build_profile.file_done('bidi', input_file, seconds, bytes_read=bytes_read,
+                            bytes_written=build_profile.file_size(output_file), wrapped=wrapped)
+    return file_hash(output_file), wrapped, seconds
+
+
+def expand_inputs(patterns):
+    """
+    Expand file names and glob patterns into a list of existing files, in
+    order and without duplicates. Raises FileNotFoundError for a plain file
+    name that does not exist.
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        elif os.path.exists(pattern):
+            matches = [pattern]
+        else:
+            raise FileNotFoundError(f"Input file not found: {pattern}")
+        for match in matches:
+            path = Path(match)
+            if path.is_file() and path.resolve() not in seen:
+                seen.add(path.resolve())
+                files.append(path)
+    return files
+
+
+def fix_all(files, output_file=None, manifest_path=DEFAULT_MANIFEST, jobs=None, force=False):
+    """
+    Fix every file that changed since the last run: in place, or into
+    output_file when a single file is given.
+    Prints the time taken and parentheses wrapped per file.
+    Returns a tuple of (fixed, skipped, failed) counts.
+    """
+    manifest = load_manifest(manifest_path)
+    pending = []
+    skipped = 0
+    for input_file in files:
+        target = Path(output_file) if output_file is not None else input_file
+        key = str(input_file.resolve())
+        input_hash = file_hash(input_file)
+        if not force and is_up_to_date(manifest.get(key), input_hash, target.resolve()):
+            skipped += 1
+            continue
+        pending.append((key, input_file, target, input_hash))
+    build_profile.cache('bidi', hit=True, count=skipped)
+    build_profile.cache('bidi', hit=False, count=len(pending))
+    
+    fixed = 0
+    failed = 0
+    
+    def record(key, input_file, target, input_hash, output_hash, wrapped, seconds):
+        manifest[key] = {
+            # Fixed in place: next time the input is the fixed file
+            'input_hash': output_hash if target.resolve() == input_file.resolve() else input_hash,
+            'fixer_version': FIXER_VERSION,
+            'output': str(target.resolve()),
+            'output_hash': output_hash,
+        }
+        print(f"Fixed {input_file}: {wrapped} parenthes{'is' if wrapped == 1 else 'es'} wrapped "
+              f"in {seconds * 1000:.1f} ms")
     
-    input_file = Path(sys.argv[1])
-    if len(sys.argv) >= 3:
-        output_file = Path(sys.argv[2])
+    if len(pending) <= 1 or jobs == 1:
+        # Not worth starting a pool for a single file
+        for key, input_file, target, input_hash in pending:
+            try:
+                record(key, input_file, target, input_hash, *fix_job(input_file, target))
+                fixed += 1
+            except Exception as e:
+                failed += 1
+                print(f"Error processing {input_file}: {e}", file=sys.stderr)
     else:
-        output_file = input_file
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(fix_job, input_file, target): (key, input_file, target, input_hash)
+                for key, input_file, target, input_hash in pending
+            }
+            for future in as_completed(futures):
+                key, input_file, target, input_hash = futures[future]
+                try:
+                    record(key, input_file, target, input_hash, *future.result())
+                    fixed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Error processing {input_file}: {e}", file=sys.stderr)
     
-    if not input_file.exists():
-        print(f"Error: Input file not found: {input_file}", file=sys.stderr)
-        sys.exit(1)
+    # Forget files that no longer exist
+    removed = [key for key in manifest if not os.path.exists(key)]
+    for key in removed:
+        del manifest[key]
     
-    success = process_file(input_file, output_file)
-    sys.exit(0 if success else 1)
+    if fixed or removed:
+        save_manifest(manifest_path, manifest)
+    return fixed, skipped, failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Wrap parentheses containing English text in \\LR{} for the LaTeX bidi package.')
+    parser.add_argument('inputs', nargs='+',
+                        help='Markdown files or glob patterns to fix in place, or - for stdin')
+    parser.add_argument('-o', '--output',
+                        help='Write the result here instead (single input only; - for stdout)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='Fix every file even if it is up to date')
+    parser.add_argument('--manifest', default=str(DEFAULT_MANIFEST),
+                        help='Manifest file used to skip unchanged files')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Fix two existing files in place instead of reading them as <input> <output>')
+    args = parser.parse_args()
+    apply_legacy_output(args, parser)
+    return args
+
+
+def apply_legacy_output(args, parser):
+    """
+    The CLI used to be "<input> [output]". Two plain arguments without -o are
+    still read that way when the second cannot be meant as an input ("-", or
+    a file that does not exist yet). An existing second file is ambiguous, so
+    it is rejected rather than silently fixed in place.
+    """
+    if args.output is not None or args.in_place or len(args.inputs) != 2:
+        return
+    first, second = args.inputs
+    if glob.has_magic(first) or glob.has_magic(second):
+        return
+    if first == '-' or second == '-' or not os.path.exists(second):
+        args.inputs, args.output = [first], second
+        return
+    parser.error(f"ambiguous arguments '{first} {second}': use '-o {second}' to write the fixed "
+                 f"{first} there, or --in-place to fix both files")
+
 
+if __name__ == "__main__":
+    args = parse_args()
+    
+    # Pipes are streamed straight through, without the manifest
+    if args.inputs == ['-'] or args.output == '-':
+        if len(args.inputs) != 1:
+            print("Error: Only one input can be written to stdout", file=sys.stderr)
+            sys.exit(1)
+        if args.inputs[0] != '-' and not os.path.exists(args.inputs[0]):
+            print(f"Error: Input file not found: {args.inputs[0]}", file=sys.stderr)
+            sys.exit(1)
+        with build_profile.span('fix_stream', category='bidi'):
+            success = process_file(args.inputs[0], args.output or '-')
+        sys.exit(0 if success else 1)
+    
+    try:
+        files = expand_inputs(args.inputs)
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.output is not None and len(files) != 1:
+        print("Error: --output needs exactly one input file", file=sys.stderr)
+        sys.exit(1)
+    
+    with build_profile.span('fix_all', category='bidi'):
+        fixed, skipped, failed = fix_all(files, args.output, args.manifest, args.jobs, args.force)
+    print(f"Fixed {fixed} file(s), {skipped} up to date, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-pass rewriting engine for generated HTML.
+A Rewriter combines precompiled rule patterns into one alternation and scans
+the document once, leftmost-first like re.sub, emitting the output with a
+single join. Rules can be grouped into fallback strategies: within a group
+only the first rule (in priority order) that matched anywhere is applied, so
+"replace X, else insert before Y, else before the last Z" costs one scan
+instead of one pass per fallback.
+Every rewrite returns which strategy matched per group and structured
+diagnostics instead of printing warnings.
+"""
+import re
+from collections import Counter, namedtuple
+
+# A diagnostic reported by a rewrite: level is 'warning' or 'info',
+# code a short machine-readable identifier
+Diagnostic = namedtuple('Diagnostic', ['level', 'code', 'message'])
+
+
+class Rule:
+    """
+    A pattern and its replacement.
+    - replacement: a literal string, or a callable(match, context) returning one
+    - group: rules sharing a group are fallbacks for each other, in rule order
+    - occurrence: 'all' rewrites every match, 'first'/'last' only one of them
+    """
+
+    OCCURRENCES = ('all', 'first', 'last')
+
+    def __init__(self, name, pattern, replacement, flags=0, group=None, occurrence='all'):
+        if occurrence not in self.OCCURRENCES:
+            raise ValueError(f"unknown occurrence {occurrence!r}")
+        self.name = name
+        self.pattern = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern, flags)
+        self.replacement = replacement
+        self.group = group if group is not None else name
+        self.occurrence = occurrence
+
+    def replace(self, match, context):
+        if callable(self.replacement):
+            return self.replacement(match, context)
+        return self.replacement
+
+
+class RewriteResult:
+    """Output of Rewriter.rewrite()."""
+
+    def __init__(self, text, counts, strategies, diagnostics):
+        self.text = text
+        self.counts = counts            # rule name -> replacements applied
+        self.strategies = strategies    # group -> name of the rule applied, or None
+        self.diagnostics = diagnostics  # list of Diagnostic
+
+    @property
+    def changed(self):
+        return sum(self.counts.values()) > 0
+
+    @property
+    def warnings(self):
+        return [diagnostic for diagnostic in self.diagnostics if diagnostic.level == 'warning']
+
+
+class Rewriter:
+    """
+    Applies a fixed set of rules in one linear scan.
+    Build it once (at module level) and reuse it for every document.
+    Rule patterns are embedded in one alternation, so they must not use
+    numbered backreferences or share group names.
+    """
+
+    def __init__(self, rules, required_groups=()):
+        self.rules = list(rules)
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("rule names must be unique")
+        # Groups that should match in every document; a miss is a warning
+        self.required_groups = set(required_groups)
+        # Each rule becomes a named alternative carrying its own flags; the
+        # outer group closes last, so match.lastgroup identifies the rule
+        self._master = re.compile('|'.join(
+            f'(?P<_r{index}>{self._scoped(rule.pattern)})' for index, rule in enumerate(self.rules)
+        ))
+
+    @staticmethod
+    def _scoped(pattern):
+        letters = ''.join(letter for flag, letter in
+                          ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'), (re.VERBOSE, 'x'))
+                          if pattern.flags & flag)
+        return f'(?{letters}:{pattern.pattern})' if letters else pattern.pattern
+
+    def scan(self, text):
+        """Return the non-overlapping (rule, match) pairs of one scan over text."""
+        found = []
+        for master_match in self._master.finditer(text):
+            rule = self.rules[int(master_match.lastgroup[2:])]
+            # Re-match with the rule's own pattern to get its group numbering
+            found.append((rule, rule.pattern.match(text, master_match.start())))
+        return found
+
+    def rewrite(self, text, context=None):
+        """Rewrite text in a single scan and return a RewriteResult."""
+        found = self.scan(text)
+
+        # Pick the winning strategy of every group: the first rule that matched
+        matched_rules = {rule.name for rule, _ in found}
+        strategies = {}
+        for rule in self.rules:
+            if rule.group not in strategies or strategies[rule.group] is None:
+                strategies[rule.group] = rule.name if rule.name in matched_rules else None
+        active = set(filter(None, strategies.values()))
+
+        # Resolve first/last occurrence rules to the single match they rewrite
+        selected = set()
+        single = {}
+        for index, (rule, _) in enumerate(found):
+            if rule.name not in active:
+                continue
+            if rule.occurrence == 'all':
+                selected.add(index)
+            elif rule.occurrence == 'last' or rule.name not in single:
+                single[rule.name] = index
+        selected.update(single.values())
+
+        parts = []
+        cursor = 0
+        counts = Counter()
+        for index, (rule, match) in enumerate(found):
+            if index not in selected:
+                continue
+            parts.append(text[cursor:match.start()])
+            parts.append(rule.replace(match, context))
+            cursor = match.end()
+            counts[rule.name] += 1
+        parts.append(text[cursor:])
+
+        diagnostics = []
+        for group, name in strategies.items():
+            if name is None:
+                level = 'warning' if group in self.required_groups else 'info'
+                diagnostics.append(Diagnostic(level, 'no-match', f"no rule of group '{group}' matched"))
+            else:
+                diagnostics.append(Diagnostic('info', 'strategy', f"group '{group}' used rule '{name}'"))
+        return RewriteResult(''.join(parts), counts, strategies, diagnostics)
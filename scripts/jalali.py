@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dependency-free Gregorian -> Jalali (Persian) date conversion.
+Implements the same 2820-year arithmetic calendar as khayyam, with the start
+of every Jalali year computed once and cached, so the build scripts no
+longer need to import khayyam just to format a date.
+
+    format_jalali(date(2026, 1, 5))  # '۱۶ دی ۱۴۰۴'
+
+Run `jalali.py --verify` to compare against khayyam (if installed) day by day,
+from 1 Farvardin 1 (622-03-22) to the end of 3000 AD.
+"""
+import functools
+import sys
+from datetime import date, timedelta
+
+# Persian month names, Farvardin first
+PERSIAN_MONTHS = (
+    'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
+    'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند',
+)
+
+# ASCII digits to Persian digits
+PERSIAN_DIGITS = str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹')
+
+# Days in a 2820-year grand cycle of the arithmetic Jalali calendar
+CYCLE_DAYS = 1029983
+
+# Offset between the cycle arithmetic's day numbers and date.toordinal()
+ORDINAL_OFFSET = 226895
+
+
+@functools.lru_cache(maxsize=None)
+def year_start(jy):
+    """date.toordinal() of 1 Farvardin of Jalali year jy."""
+    base = jy - 474
+    cycle_year = 474 + base % 2820
+    return ((cycle_year * 682 - 110) // 2816 + (cycle_year - 1) * 365
+            + base // 2820 * CYCLE_DAYS + ORDINAL_OFFSET + 1)
+
+
+def gregorian_to_jalali(day):
+    """Convert a datetime.date (or datetime) to a (year, month, day) Jalali tuple."""
+    ordinal = day.toordinal()
+    # Nowruz falls on March 20 or 21, so the Jalali year is gy - 621 or gy - 622
+    jy = day.year - 621
+    if ordinal < year_start(jy):
+        jy -= 1
+    k = ordinal - year_start(jy)
+    # The first six months have 31 days, the next five 30, Esfand 29 or 30
+    if k < 186:
+        return jy, k // 31 + 1, k % 31 + 1
+    k -= 186
+    return jy, k // 30 + 7, k % 30 + 1
+
+
+def gregorian_to_jalali_many(days):
+    """gregorian_to_jalali for each date in days, as a list."""
+    return [gregorian_to_jalali(day) for day in days]
+
+
+def format_jalali(day, persian_digits=True):
+    """
+    Format a date as "<day> <month name> <year>" in the Jalali calendar,
+    e.g. "۱۶ دی ۱۴۰۴" (the same output as khayyam's strftime('%d %B %Y')).
+    """
+    jy, jm, jd = gregorian_to_jalali(day)
+    text = f'{jd:02d} {PERSIAN_MONTHS[jm - 1]} {jy:04d}'
+    return text.translate(PERSIAN_DIGITS) if persian_digits else text
+
+
+def format_jalali_many(days, persian_digits=True):
+    """format_jalali for each date in days, as a list."""
+    return [format_jalali(day, persian_digits) for day in days]
+
+
+def verify_against_khayyam(first=date(622, 3, 22), last=date(3000, 12, 31)):
+    """
+    Compare every day between first and last with khayyam.
+    Returns the number of days checked; raises AssertionError on a mismatch.
+    """
+    from khayyam import JalaliDate
+
+    day = first
+    checked = 0
+    while day <= last:
+        expected = JalaliDate(day)
+        actual = gregorian_to_jalali(day)
+        if actual != (expected.year, expected.month, expected.day):
+            raise AssertionError(f"{day}: got {actual}, khayyam says {expected}")
+        day += timedelta(days=1)
+        checked += 1
+    return checked
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['--verify']:
+        try:
+            checked = verify_against_khayyam()
+        except ImportError:
+            print("Error: khayyam library not installed. Install it with: pip install khayyam")
+            sys.exit(1)
+        print(f"Verified {checked} day(s) against khayyam")
+        sys.exit(0)
+
+    if len(sys.argv) < 2:
+        print("Usage: jalali.py <YYYY-MM-DD> [...] | --verify")
+        print("Example: jalali.py 2026-01-05")
+        sys.exit(1)
+
+    for value in sys.argv[1:]:
+        print(format_jalali(date.fromisoformat(value)))
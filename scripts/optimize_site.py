@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Post-build asset pipeline for the generated site:
+
+1. Write resized AVIF/WebP/PNG copies of the infographics and the about
+   image and switch the pages to <picture>/srcset (responsive_images.py).
+2. Minify every HTML page, including its inline <style> and JSON <script>
+   blocks; JavaScript is copied unchanged. Only ASCII whitespace is ever
+   collapsed, so ZWNJ, bidi marks (LRM/RLM) and no-break spaces in Persian
+   text are left as they are. Whitespace next to inline elements is kept
+   (collapsed to one character), so words around links and emphasis never
+   run together. <pre>, <textarea> and <code> are copied unchanged.
+3. Content-hash the project's own assets (icon.png, about.png, logo.svg and
+   the episodes' mindmap_auto.html) into name.<hash>.ext copies and rewrite
+   the pages' references to them. The copies never change, so they can be
+   cached forever (serve.py marks such names immutable). The originals stay
+   in place for external links, such as the book's mindmap links.
+4. Write .gz/.br siblings of everything (precompress_site.py).
+
+Must run after every step that edits the site.
+
+    optimize_site.py output/site
+    optimize_site.py output/site --no-minify --jobs 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import build_profile
+from precompress_site import precompress_site
+from responsive_images import responsive_site
+
+WEBSITE_DIR = Path(__file__).resolve().parent.parent / 'assets' / 'website'
+
+# Site-relative globs of the project-owned assets that get content-hashed names
+FINGERPRINTED_ASSETS = ('icon.png', 'about.png', 'logo.svg', '*/mindmap_auto.html')
+
+# name.<16 hex digits>.ext: a fingerprinted copy (also matched by serve.py's immutable rule)
+HASHED_NAME = re.compile(r'\.[0-9a-f]{16}\.[A-Za-z0-9]+$')
+
+HTML_SUFFIXES = ('.html', '.htm')
+
+# ASCII whitespace only: U+00A0, U+200C (ZWNJ) and U+200E/U+200F must survive
+ASCII_WHITESPACE = ' \t\n\r\f'
+WHITESPACE_RUN = re.compile(r'[ \t\n\r\f]+')
+
+# Whitespace next to these is not rendered, so it can be dropped
+BLOCK_TAGS = frozenset('''
+    address article aside base blockquote body br caption col colgroup dd details dialog div dl dt
+    fieldset figcaption figure footer form h1 h2 h3 h4 h5 h6 head header hgroup hr html legend li
+    link main menu meta nav noscript ol optgroup option p pre section script style summary table
+    tbody td template textarea tfoot th thead title tr ul
+'''.split())
+
+# Elements whose content is copied (pre, textarea, code, JavaScript) or minified (style, JSON)
+RAW_TAGS = ('pre', 'textarea', 'code', 'script', 'style')
+
+# A start tag's attributes, allowing ">" inside quoted values
+TAG_ATTRIBUTES = r'''[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*'''
+
+HTML_TOKEN = re.compile(
+    r'(?P<comment><!--.*?-->)'
+    rf'|(?P<raw><(?P<raw_name>{"|".join(RAW_TAGS)})(?=[\s/>])(?P<raw_attrs>{TAG_ATTRIBUTES})>'
+    r'(?P<raw_body>.*?)</(?P=raw_name)\s*>)'
+    rf'|(?P<tag></?(?P<name>[A-Za-z][A-Za-z0-9-]*){TAG_ATTRIBUTES}>)'
+    r'|(?P<declaration><![^>]*>)',
+    re.DOTALL | re.IGNORECASE,
+)
+
+SCRIPT_TYPE = re.compile(r'''\btype\s*=\s*["']?([^"'\s>]+)''', re.IGNORECASE)
+
+JSON_TYPES = ('application/json', 'application/ld+json', 'importmap')
+
+
+# --- CSS ----------------------------------------------------------------------
+
+CSS_TOKEN = re.compile(
+    r'''(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')'''
+    r'|(?P<url>url\([^)]*\))'
+    r'|(?P<comment>/\*.*?\*/)'
+    r'|(?P<space>[ \t\n\r\f]+)',
+    re.DOTALL | re.IGNORECASE,
+)
+
+# Spaces around these never matter in CSS (unlike "+" in calc() or ":" in selectors)
+CSS_PUNCTUATION = '{};,>'
+
+
+def minify_css(css):
+    """Drop comments (except /*! */) and collapse whitespace; strings and url()s are kept."""
+    parts = []
+    space = False
+    cursor = 0
+
+    def emit(text):
+        nonlocal space
+        if space and parts and parts[-1][-1] not in CSS_PUNCTUATION and text[0] not in CSS_PUNCTUATION:
+            parts.append(' ')
+        space = False
+        if text == '}' and parts and parts[-1] == ';':
+            parts.pop()
+        parts.append(text)
+
+    def emit_plain(text):
+        # Outside strings, comments and url(): punctuation is split out so ";}" can be folded
+        for piece in re.split(r'([{};,>])', text):
+            if piece:
+                emit(piece)
+
+    for match in CSS_TOKEN.finditer(css):
+        emit_plain(css[cursor:match.start()])
+        cursor = match.end()
+        if match.group('comment') is not None and not match.group().startswith('/*!'):
+            space = True
+        elif match.group('space') is not None:
+            space = True
+        else:
+            emit(match.group())
+    emit_plain(css[cursor:])
+    return ''.join(parts).strip()
+
+
+# --- HTML ------------------------------------------------------------------------
+
+def minify_script(attrs, body):
+    """Re-serialize JSON script blocks compactly; JavaScript and other types are kept as they are."""
+    match = SCRIPT_TYPE.search(attrs)
+    script_type = match.group(1).lower() if match else ''
+    if not body.strip():
+        return ''
+    if script_type in JSON_TYPES:
+        try:
+            return json.dumps(json.loads(body), ensure_ascii=False, separators=(',', ':'))
+        except ValueError:
+            return body
+    # JavaScript is not minified: telling regex literals from division and
+    # keeping automatic semicolon insertion intact needs a real parser, and
+    # once the pages are precompressed the savings are small
+    return body
+
+
+def minify_html(html):
+    """
+    Minify a page: drop comments, collapse whitespace in text, remove it
+    next to block-level tags, and minify inline CSS and JSON.
+    """
+    # (kind, text, block) tokens; kind is 'text' or 'markup'
+    tokens = []
+    cursor = 0
+
+    def add_text(text):
+        # Text on both sides of a dropped comment is one run
+        if tokens and tokens[-1][0] == 'text':
+            text = tokens.pop()[1] + text
+        tokens.append(('text', text, False))
+
+    for match in HTML_TOKEN.finditer(html):
+        if match.start() > cursor:
+            add_text(html[cursor:match.start()])
+        cursor = match.end()
+        if match.group('comment') is not None:
+            # Keep conditional comments; drop the rest like whitespace
+            if match.group().startswith('<!--[if'):
+                tokens.append(('markup', match.group(), False))
+            continue
+        if match.group('raw') is not None:
+            name = match.group('raw_name').lower()
+            attrs = match.group('raw_attrs')
+            body = match.group('raw_body')
+            if name == 'script':
+                body = minify_script(attrs, body)
+            elif name == 'style':
+                body = minify_css(body)
+            start = match.group()[:match.start('raw_body') - match.start()]
+            end = match.group()[match.end('raw_body') - match.start():]
+            tokens.append(('markup', start + body + end, name in BLOCK_TAGS))
+        elif match.group('tag') is not None:
+            tokens.append(('markup', match.group(), match.group('name').lower() in BLOCK_TAGS))
+        else:
+            tokens.append(('markup', match.group(), True))
+    if cursor < len(html):
+        add_text(html[cursor:])
+
+    parts = []
+    for index, (kind, text, _) in enumerate(tokens):
+        if kind == 'text':
+            text = WHITESPACE_RUN.sub(lambda m: '\n' if '\n' in m.group() else ' ', text)
+            before = tokens[index - 1] if index > 0 else None
+            after = tokens[index + 1] if index + 1 < len(tokens) else None
+            # Whitespace at a block boundary is not rendered
+            if before is None or before[2]:
+                text = text.lstrip(ASCII_WHITESPACE)
+            if after is None or after[2]:
+                text = text.rstrip(ASCII_WHITESPACE)
+        parts.append(text)
+    return ''.join(parts) + ('\n' if html.endswith('\n') else '')
+
+
+def minify_file(path):
+    """Pool worker: minify one page in place. Returns (bytes before, bytes after)."""
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    minified = minify_html(html)
+    before = len(html.encode('utf-8'))
+    after = len(minified.encode('utf-8'))
+    if minified != html:
+        tmp_path = str(path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(minified)
+        os.replace(tmp_path, path)
+    build_profile.file_done('minify', path, time.perf_counter() - start,
+                            bytes_read=before, bytes_written=after if minified != html else 0)
+    return before, after
+
+
+def minify_site(pages, jobs=None):
+    """Minify pages across a process pool. Returns (bytes before, bytes after, failed)."""
+    before = after = failed = 0
+    if len(pages) <= 1 or jobs == 1:
+        results = []
+        for page in pages:
+            try:
+                results.append(minify_file(page))
+            except (OSError, UnicodeDecodeError) as e:
+                failed += 1
+                print(f"Error minifying {page}: {e}")
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(minify_file, page): page for page in pages}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except (OSError, UnicodeDecodeError) as e:
+                    failed += 1
+                    print(f"Error minifying {futures[future]}: {e}")
+    for page_before, page_after in results:
+        before += page_before
+        after += page_after
+    return before, after, failed
+
+
+# --- Fingerprinting ----------------------------------------------------------------
+
+def site_url(website_dir=WEBSITE_DIR):
+    """website.site-url of assets/website/_quarto.yml, or '' if not set."""
+    try:
+        content = (Path(website_dir) / '_quarto.yml').read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return ''
+    match = re.search(r'^[ \t]*site-url:[ \t]*(.*)$', content, re.MULTILINE)
+    if not match:
+        return ''
+    return re.sub(r'^["\']|["\']$', '', match.group(1).strip()).strip()
+
+
+def glob_escape(name):
+    return re.sub(r'([*?\[])', r'[\1]', name)
+
+
+def fingerprint(path):
+    """
+    Copy path to name.<hash>.ext next to it, removing copies of earlier
+    versions. Returns the hashed file name.
+    """
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()[:16]
+    hashed = path.with_name(f'{path.stem}.{digest}{path.suffix}')
+    for old in path.parent.glob(f'{glob_escape(path.stem)}.*{path.suffix}'):
+        if old != hashed and HASHED_NAME.search(old.name):
+            old.unlink()
+            for sibling in (old.with_name(old.name + '.gz'), old.with_name(old.name + '.br')):
+                if sibling.exists():
+                    sibling.unlink()
+    if not hashed.exists():
+        shutil.copy2(path, hashed)
+    return hashed.name
+
+
+# URL-valued attributes; srcset holds a comma-separated list of "url descriptor"
+URL_ATTRIBUTE = re.compile(
+    r'''(?P<prefix>\s(?P<attr>href|src|content|poster|srcset|data-src)\s*=\s*)(?P<quote>["'])(?P<value>.*?)(?P=quote)''',
+    re.IGNORECASE | re.DOTALL,
+)
+
+SCHEME = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+
+
+def rewrite_url(url, page_dir, assets, base_url):
+    """The url with a fingerprinted asset's name swapped in, or the url unchanged."""
+    split = min([index for index in (url.find('?'), url.find('#')) if index >= 0], default=len(url))
+    path, rest = url[:split], url[split:]
+    if not path or path.endswith('/'):
+        return url
+    if base_url and path.startswith(base_url + '/'):
+        target = path[len(base_url) + 1:]
+    elif SCHEME.match(path) or path.startswith('//'):
+        return url
+    elif path.startswith('/'):
+        target = path.lstrip('/')
+    else:
+        target = posixpath.normpath(posixpath.join(page_dir, path))
+    hashed = assets.get(target)
+    if hashed is None:
+        return url
+    return path[:len(path) - len(posixpath.basename(path))] + hashed + rest
+
+
+def rewrite_references(html, page_dir, assets, base_url):
+    """Point every URL attribute that names a fingerprinted asset at its hashed copy."""
+    def replace(match):
+        value = match.group('value')
+        if match.group('attr').lower() == 'srcset':
+            candidates = []
+            for candidate in value.split(','):
+                stripped = candidate.strip()
+                url, _, descriptor = stripped.partition(' ')
+                new = rewrite_url(url, page_dir, assets, base_url)
+                candidates.append(candidate.replace(url, new, 1) if new != url else candidate)
+            new_value = ','.join(candidates)
+        else:
+            new_value = rewrite_url(value, page_dir, assets, base_url)
+        if new_value == value:
+            return match.group()
+        return match.group('prefix') + match.group('quote') + new_value + match.group('quote')
+    return URL_ATTRIBUTE.sub(replace, html)
+
+
+def rewrite_file(path, site_dir, assets, base_url):
+    """Rewrite one page's asset references in place. Returns True if it changed."""
+    with open(path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    page_dir = posixpath.dirname(path.relative_to(site_dir).as_posix())
+    rewritten = rewrite_references(html, page_dir, assets, base_url)
+    if rewritten == html:
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(rewritten, encoding='utf-8')
+    os.replace(tmp_path, path)
+    return True
+
+
+def fingerprint_site(site_dir, pages, base_url=''):
+    """
+    Fingerprint the project assets and rewrite the pages' references.
+    Returns a tuple of (assets fingerprinted, pages rewritten).
+    """
+    site_dir = Path(site_dir)
+    base_url = base_url.rstrip('/')
+    assets = {}
+    found = sorted({path for pattern in FINGERPRINTED_ASSETS for path in site_dir.glob(pattern) if path.is_file()},
+                   # Pages among the assets are hashed after the files they reference
+                   key=lambda path: (path.suffix in HTML_SUFFIXES, path))
+    for path in found:
+        if path.suffix in HTML_SUFFIXES:
+            rewrite_file(path, site_dir, assets, base_url)
+        assets[path.relative_to(site_dir).as_posix()] = fingerprint(path)
+
+    rewritten = 0
+    for page in pages:
+        if page not in found and rewrite_file(page, site_dir, assets, base_url):
+            rewritten += 1
+    return len(assets), rewritten
+
+
+# --- Pipeline ------------------------------------------------------------------------
+
+def find_pages(site_dir):
+    """Every HTML page of the site except fingerprinted copies."""
+    return sorted(path for path in Path(site_dir).rglob('*')
+                  if path.suffix in HTML_SUFFIXES and path.is_file() and not HASHED_NAME.search(path.name))
+
+
+def optimize_site(site_dir, base_url=None, jobs=None, minify=True, fingerprint_assets=True, precompress=True,
+                  images=True):
+    """Run the pipeline over site_dir and print what each step did."""
+    if base_url is None:
+        base_url = site_url()
+    pages = find_pages(site_dir)
+    failed = 0
+    if images:
+        with build_profile.span('responsive_images', category='site'):
+            result = responsive_site(site_dir, pages, base_url, jobs)
+        if result is None:
+            # Pillow is a declared dependency, so a missing one is a broken environment
+            print("Error: Pillow is not installed, so the responsive images were NOT written and the\n"
+                  "       pages still load the full-size images. Run 'uv sync', or pass --no-images\n"
+                  "       to skip this step on purpose.", file=sys.stderr)
+            failed += 1
+        else:
+            sources, encoded, rewritten, failed = result
+            print(f"Responsive images: {sources} source(s), {encoded} encoded, rewrote {rewritten} page(s)")
+    if minify:
+        with build_profile.span('minify', category='site'):
+            before, after, minify_failed = minify_site(pages, jobs)
+        failed += minify_failed
+        saved = 100 * (before - after) / before if before else 0
+        print(f"Minified {len(pages)} page(s): {before / 1024:.0f} KB -> {after / 1024:.0f} KB (-{saved:.0f}%)")
+    if fingerprint_assets:
+        with build_profile.span('fingerprint', category='site'):
+            hashed, rewritten = fingerprint_site(site_dir, pages, base_url)
+        print(f"Fingerprinted {hashed} asset(s), rewrote references in {rewritten} page(s)")
+    if precompress:
+        with build_profile.span('precompress_site', category='site'):
+            examined, written = precompress_site(site_dir)
+        print(f"Precompressed {written} sibling(s) for {examined} compressible file(s)")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Resize images, minify, fingerprint and precompress the generated site.')
+    parser.add_argument('site_directory', help='Generated site directory (e.g. output/site)')
+    parser.add_argument('--site-url',
+                        help='Absolute site URL whose asset links are rewritten too (default: from _quarto.yml)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes for image encoding and minification (default: number of CPUs)')
+    parser.add_argument('--no-images', action='store_true', help='Skip the responsive image copies')
+    parser.add_argument('--no-minify', action='store_true', help='Skip HTML/CSS/JSON minification')
+    parser.add_argument('--no-fingerprint', action='store_true', help='Skip asset fingerprinting')
+    parser.add_argument('--no-precompress', action='store_true', help='Skip the .gz/.br siblings')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.site_directory):
+        print(f"Error: Site directory {args.site_directory} does not exist")
+        sys.exit(1)
+
+    failed = optimize_site(args.site_directory, args.site_url, args.jobs, not args.no_minify,
+                           not args.no_fingerprint, not args.no_precompress, not args.no_images)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persian text normalization shared by the search index builders and serve.py.
+Folds the Arabic/Persian variants that users type interchangeably so that
+queries and indexed text compare equal:
+- Arabic yeh/alef maksura (ي ى) -> Persian yeh (ی), Arabic kaf (ك) -> Persian keheh (ک)
+- Hamza-carrying alefs (أ إ ٱ آ) -> alef (ا), heh with yeh (ۀ) and teh marbuta (ة) -> heh (ه)
+- Persian (۰-۹) and Arabic-Indic (٠-٩) digits -> ASCII digits
+- ZWNJ and other zero-width/bidi marks, tatweel and diacritics are dropped
+- Latin text is lowercased
+"""
+import re
+
+# Persian and Arabic-Indic digits to ASCII digits
+DIGITS_TO_ASCII = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+# ASCII digits to Persian digits, for display
+ASCII_TO_PERSIAN_DIGITS = str.maketrans('0123456789', '۰۱۲۳۴۵۶۷۸۹')
+
+# Characters dropped during normalization:
+# tatweel, Arabic diacritics (fathatan..sukun, superscript alef),
+# ZWNJ, ZWJ, zero-width space, LRM/RLM, BOM
+_DROPPED = (
+    '\u0640'
+    + ''.join(chr(c) for c in range(0x064B, 0x0653))
+    + '\u0670'
+    + '\u200b\u200c\u200d\u200e\u200f\ufeff'
+)
+
+_NORMALIZE_TABLE = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    'أ': 'ا',
+    'إ': 'ا',
+    'ٱ': 'ا',
+    'آ': 'ا',
+    'ۀ': 'ه',
+    'ة': 'ه',
+    **{char: None for char in _DROPPED},
+})
+_NORMALIZE_TABLE.update(DIGITS_TO_ASCII)
+
+# Same folding, but keeping ZWNJ so compound words can still be split
+_NORMALIZE_KEEP_ZWNJ_TABLE = dict(_NORMALIZE_TABLE)
+del _NORMALIZE_KEEP_ZWNJ_TABLE[0x200C]
+
+# A token is a run of letters/digits; \w covers Persian letters as well
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# A compound token may contain ZWNJ (e.g. "ذهن‌آگاهی", "می‌خوابیم")
+COMPOUND_TOKEN_PATTERN = re.compile(r'\w+(?:\u200c\w+)*')
+
+
+def normalize(text):
+    """Normalize text for search: fold letter variants and digits, drop marks, lowercase."""
+    return text.translate(_NORMALIZE_TABLE).lower()
+
+
+def tokenize(text):
+    """Split text into normalized search tokens."""
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def index_terms(text):
+    """
+    Split text into the terms to index. Compound words written with ZWNJ are
+    indexed both joined ("ذهنآگاهی", matching queries typed with or without
+    ZWNJ) and as their parts ("ذهن", "اگاهی", matching queries typed with a space).
+    """
+    terms = []
+    for token in COMPOUND_TOKEN_PATTERN.findall(text.translate(_NORMALIZE_KEEP_ZWNJ_TABLE).lower()):
+        if '\u200c' in token:
+            parts = token.split('\u200c')
+            terms.append(''.join(parts))
+            terms.extend(parts)
+        else:
+            terms.append(token)
+    return terms
+
+
+def normalize_with_offsets(text):
+    """
+    Normalize text and also return, for every character of the result, the
+    index of the character in the original text it came from.
+    Used to map matches in normalized text back for snippet highlighting.
+    """
+    chars = []
+    offsets = []
+    for index, char in enumerate(text):
+        folded = normalize(char)
+        chars.append(folded)
+        offsets.extend([index] * len(folded))
+    return ''.join(chars), offsets
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to write precompressed .gz (and .br, if brotli is installed) siblings
+next to every compressible file in the generated site.
+serve.py prefers these siblings over compressing on the fly, and most static
+hosts can be configured to serve them directly.
+"""
+import gzip
+import os
+import sys
+import time
+from pathlib import Path
+
+import build_profile
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional - without it only .gz siblings are written
+    brotli = None
+
+# File extensions worth compressing (images, fonts and archives are already compressed)
+COMPRESSIBLE_EXTENSIONS = {
+    '.html', '.htm', '.css', '.js', '.mjs', '.json', '.xml', '.svg', '.txt', '.md',
+}
+
+# Files smaller than this are left alone; compression overhead outweighs the gain
+MIN_COMPRESS_SIZE = 256
+
+
+def write_if_smaller(data, compressed, target_path, mtime):
+    """
+    Write a compressed sibling only when it actually saves bytes.
+    The sibling gets the source mtime so the server can tell it is fresh.
+    Returns True if the sibling was written.
+    """
+    if len(compressed) >= len(data):
+        # Drop a stale sibling from a previous build
+        if target_path.exists():
+            target_path.unlink()
+        return False
+    tmp_path = target_path.with_name(target_path.name + '.tmp')
+    tmp_path.write_bytes(compressed)
+    os.utime(tmp_path, ns=(mtime, mtime))
+    os.replace(tmp_path, target_path)
+    return True
+
+
+def precompress_file(file_path):
+    """
+    Write .gz/.br siblings for a single file.
+    Skips the work if the existing siblings are already up to date.
+    Returns the number of siblings written.
+    """
+    start = time.perf_counter()
+    stat = file_path.stat()
+    if stat.st_size < MIN_COMPRESS_SIZE:
+        return 0
+
+    codings = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        codings.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+    data = None
+    written = 0
+    bytes_written = 0
+    for suffix, compress in codings:
+        target_path = file_path.with_name(file_path.name + suffix)
+        try:
+            # Same freshness rule as serve.py's sibling_is_fresh(): exact mtime match
+            if target_path.stat().st_mtime_ns == stat.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            pass
+        if data is None:
+            data = file_path.read_bytes()
+        compressed = compress(data)
+        if write_if_smaller(data, compressed, target_path, stat.st_mtime_ns):
+            written += 1
+            bytes_written += len(compressed)
+    build_profile.cache('precompress', hit=data is None)
+    if data is not None:
+        build_profile.file_done('precompress', file_path, time.perf_counter() - start,
+                                bytes_read=len(data), bytes_written=bytes_written)
+    return written
+
+
+def precompress_site(site_dir):
+    """
+    Walk the site directory and precompress every compressible file.
+    Returns a tuple of (files examined, siblings written).
+    """
+    examined = 0
+    written = 0
+    for file_path in sorted(Path(site_dir).rglob('*')):
+        if not file_path.is_file() or file_path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        examined += 1
+        written += precompress_file(file_path)
+    return examined, written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: precompress_site.py <site_directory>")
+        print("Example: precompress_site.py output/site")
+        sys.exit(1)
+
+    site_dir = sys.argv[1]
+    if not os.path.isdir(site_dir):
+        print(f"Error: Site directory {site_dir} does not exist")
+        sys.exit(1)
+
+    if brotli is None:
+        print("Note: brotli library not installed, writing .gz siblings only")
+
+    with build_profile.span('precompress_site', category='site'):
+        examined, written = precompress_site(site_dir)
+    print(f"Precompressed {written} sibling(s) for {examined} compressible file(s)")
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Responsive image derivatives for the generated site.
+
+The episode infographics and the about page image are several megabytes at
+full resolution, yet the listing on index.html shows them as ~250px wide
+thumbnails. For each of them this writes resized AVIF, WebP and PNG copies
+at the widths in WIDTHS next to the original, named
+name-<width>w.<hash>.<ext>, and rewrites the pages' markup:
+
+- <img> becomes a <picture> with AVIF and WebP <source>s and a PNG
+  fallback, each with a srcset, a sizes hint and the image's intrinsic
+  width/height (so the layout does not jump while it loads);
+- og:image and twitter:image point at a PNG of SOCIAL_WIDTH, the size
+  social previews are displayed at.
+
+Encoding is the slow part, so encodes are kept in .cache/images/<hash>/,
+keyed by the source bytes and the encoder settings: only new or changed
+images are encoded, across a process pool. Needs Pillow (declared in
+pyproject.toml; AVIF needs 11.3+ or the pillow-avif-plugin). Without it the
+site is left as it is and the step reports an error.
+
+Runs as the first step of optimize_site.py, before the pages are minified.
+
+    responsive_images.py output/site
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import build_profile
+from html_rewrite import Rewriter, Rule
+
+try:
+    from PIL import Image
+except ImportError:
+    # Reported by the callers, which leave the images as they are
+    Image = None
+else:
+    try:
+        import pillow_avif  # noqa: F401 - registers AVIF with Pillow < 11.3
+    except ImportError:
+        pass
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / '.cache' / 'images'
+
+# Site-relative globs of the images that get derivatives
+RESPONSIVE_IMAGES = ('*/infographic.png', 'about.png')
+
+# Derivative widths in pixels; images narrower than one get their own width instead
+WIDTHS = (320, 640, 960, 1200, 1920)
+
+# Width of the PNG used for og:image/twitter:image, and of the plain src fallback
+SOCIAL_WIDTH = 1200
+FALLBACK_WIDTH = 960
+
+# Pillow format name, MIME type and save options, best compression first.
+# PNG is the fallback and must stay last.
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 60, 'speed': 6}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 6}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+
+# Rendered width of each kind of image (see theme.scss and Quarto's listing CSS):
+# listing thumbnails take 30% of the ~850px body column, and everything goes
+# full width below Bootstrap's md breakpoint
+MOBILE = '(max-width: 767.98px) 100vw'
+SIZES = {
+    'thumbnail-image': f'{MOBILE}, 255px',
+    'infographic': f'{MOBILE}, 850px',
+    'about-image': f'{MOBILE}, 850px',
+}
+DEFAULT_SIZES = f'{MOBILE}, 850px'
+
+# Any change to the settings above invalidates the cached encodes
+ENCODER_VERSION = hashlib.sha256(repr((WIDTHS, FORMATS)).encode('utf-8')).hexdigest()[:16]
+
+# name-<width>w.<16 hex digits>.ext: a derivative
+DERIVATIVE_NAME = re.compile(r'-\d+w\.[0-9a-f]{16}\.[A-Za-z0-9]+$')
+
+ATTRIBUTE = re.compile(r'''([A-Za-z][A-Za-z0-9:_-]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''')
+
+SCHEME = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+
+
+def available_formats():
+    """The FORMATS this Pillow can write, in FORMATS order."""
+    if Image is None:
+        return []
+    Image.init()
+    return [name for name, (pillow_format, _, _) in FORMATS.items() if pillow_format in Image.SAVE]
+
+
+def source_key(path):
+    """Cache key of a source image: its bytes plus the encoder settings."""
+    digest = hashlib.sha256(ENCODER_VERSION.encode('ascii'))
+    digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def derivative_widths(width):
+    return sorted({min(target, width) for target in WIDTHS})
+
+
+def load_info(cache_dir):
+    try:
+        with open(cache_dir / 'info.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_info(cache_dir, info):
+    tmp_path = cache_dir / 'info.json.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_dir / 'info.json')
+
+
+# --- Encoding ------------------------------------------------------------------------
+
+def encode(source, cache_dir, fmt):
+    """
+    Pool worker: write every width of one format of source into cache_dir.
+    Returns the source's (width, height).
+    """
+    start = time.perf_counter()
+    pillow_format, _, options = FORMATS[fmt]
+    bytes_written = 0
+    with Image.open(source) as image:
+        image.load()
+        size = image.size
+        if fmt != 'png' and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+        for width in derivative_widths(size[0]):
+            height = max(1, round(size[1] * width / size[0]))
+            resized = image if width == size[0] else image.resize((width, height), Image.Resampling.LANCZOS)
+            target = cache_dir / f'{width}.{fmt}'
+            tmp_path = cache_dir / f'{width}.{fmt}.tmp'
+            resized.save(tmp_path, pillow_format, **options)
+            os.replace(tmp_path, target)
+            bytes_written += target.stat().st_size
+    build_profile.file_done('image', f'{source} ({fmt})', time.perf_counter() - start,
+                            bytes_read=build_profile.file_size(source), bytes_written=bytes_written)
+    return size
+
+
+def encode_all(sources, formats, cache_root=CACHE_DIR, jobs=None):
+    """
+    Make sure every source has its derivatives in the cache.
+    sources maps a site path to its cache key.
+    Returns (info per key, images encoded, failed).
+    """
+    infos = {}
+    tasks = []
+    seen = set()
+    for path, key in sources.items():
+        if key in seen:
+            continue  # The same image under another name
+        seen.add(key)
+        cache_dir = Path(cache_root) / key
+        info = load_info(cache_dir)
+        missing = [fmt for fmt in formats if info is None or fmt not in info['formats']]
+        build_profile.cache('image', hit=not missing)
+        if info is not None:
+            infos[key] = info
+        if missing:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tasks.extend((path, key, fmt) for fmt in missing)
+
+    # Formats written per key; a failed format is simply retried next time
+    done = {}
+    failed = 0
+    if len(tasks) <= 1 or jobs == 1:
+        for path, key, fmt in tasks:
+            try:
+                done.setdefault(key, []).append((fmt, encode(path, Path(cache_root) / key, fmt)))
+            except (OSError, ValueError) as e:
+                failed += 1
+                print(f"Error encoding {path} as {fmt}: {e}")
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(encode, path, Path(cache_root) / key, fmt): (path, key, fmt)
+                       for path, key, fmt in tasks}
+            for future in as_completed(futures):
+                path, key, fmt = futures[future]
+                try:
+                    done.setdefault(key, []).append((fmt, future.result()))
+                except (OSError, ValueError) as e:
+                    failed += 1
+                    print(f"Error encoding {path} as {fmt}: {e}")
+
+    for key, results in done.items():
+        width, height = results[0][1]
+        info = infos.get(key) or {'width': width, 'height': height, 'formats': []}
+        written = {fmt for fmt, _ in results}
+        info['formats'] = [fmt for fmt in FORMATS if fmt in info['formats'] or fmt in written]
+        info['widths'] = derivative_widths(width)
+        save_info(Path(cache_root) / key, info)
+        infos[key] = info
+    return infos, len(done), failed
+
+
+# --- Site ----------------------------------------------------------------------------
+
+def install(path, key, info, cache_root=CACHE_DIR):
+    """
+    Copy a source's derivatives next to it, removing those of earlier
+    versions. Returns {format: [(width, file name), ...]}.
+    """
+    files = {}
+    for fmt in info['formats']:
+        for width in info['widths']:
+            name = f'{path.stem}-{width}w.{key}.{fmt}'
+            target = path.with_name(name)
+            if not target.exists():
+                shutil.copyfile(Path(cache_root) / key / f'{width}.{fmt}', target)
+            files.setdefault(fmt, []).append((width, name))
+    current = {name for entries in files.values() for _, name in entries}
+    for old in path.parent.glob(f'{glob.escape(path.stem)}-*w.*.*'):
+        if old.name not in current and DERIVATIVE_NAME.search(old.name):
+            old.unlink()
+    return files
+
+
+def resolve(url, page_dir, base_url):
+    """Site-relative path of a URL, or None for external and directory URLs."""
+    path = re.split(r'[?#]', url, maxsplit=1)[0]
+    if not path or path.endswith('/'):
+        return None
+    if base_url and path.startswith(base_url + '/'):
+        return path[len(base_url) + 1:]
+    if SCHEME.match(path) or path.startswith('//'):
+        return None
+    if path.startswith('/'):
+        return path.lstrip('/')
+    return posixpath.normpath(posixpath.join(page_dir, path))
+
+
+def attributes(tag):
+    return {match.group(1).lower(): next(value for value in match.groups()[1:] if value is not None)
+            for match in ATTRIBUTE.finditer(tag)}
+
+
+def relative_url(url, name):
+    """url with its file name replaced by name."""
+    return url[:url.rfind('/') + 1] + name
+
+
+def picture(match, context):
+    """<img> of a known image -> <picture> with AVIF/WebP sources and a PNG fallback."""
+    tag = match.group()
+    attrs = attributes(tag)
+    if 'srcset' in attrs or 'src' not in attrs:
+        return tag
+    image = context['images'].get(resolve(attrs['src'], context['page_dir'], context['base_url']))
+    if image is None:
+        return tag
+    files, info = image
+    classes = attrs.get('class', '').split()
+    sizes = next((SIZES[name] for name in classes if name in SIZES), DEFAULT_SIZES)
+
+    def srcset(fmt):
+        return ', '.join(f'{relative_url(attrs["src"], name)} {width}w' for width, name in files[fmt])
+
+    fallback = 'png' if 'png' in files else list(files)[-1]
+    src = max((entry for entry in files[fallback] if entry[0] <= FALLBACK_WIDTH),
+              default=files[fallback][0])[1]
+    # The <img> keeps its other attributes, with the fallback as src
+    img = ATTRIBUTE.sub(lambda m: f'src="{relative_url(attrs["src"], src)}"'
+                        if m.group(1).lower() == 'src' else m.group(), tag)
+    extra = f' srcset="{srcset(fallback)}" sizes="{sizes}"'
+    if 'width' not in attrs and 'height' not in attrs:
+        extra += f' width="{info["width"]}" height="{info["height"]}"'
+    img = re.sub(r'\s*/?>$', lambda end: extra + end.group(), img)
+    sources = ''.join(f'<source type="{FORMATS[fmt][1]}" srcset="{srcset(fmt)}" sizes="{sizes}">'
+                      for fmt in files if fmt != fallback)
+    return f'<picture>{sources}{img}</picture>'
+
+
+def social_image(match, context):
+    """og:image/twitter:image of a known image -> its SOCIAL_WIDTH PNG."""
+    tag = match.group()
+    attrs = attributes(tag)
+    target = resolve(attrs.get('content', ''), context['page_dir'], context['base_url'])
+    image = context['images'].get(target)
+    if image is None or 'png' not in image[0]:
+        context['social'] = None
+        return tag
+    files, info = image
+    width, name = max((entry for entry in files['png'] if entry[0] <= SOCIAL_WIDTH), default=files['png'][0])
+    # The width/height tags that follow describe this image
+    context['social'] = (width, round(info['height'] * width / info['width']))
+    content = relative_url(attrs['content'], name)
+    return re.sub(r'''content\s*=\s*(["']).*?\1''', lambda _: f'content="{content}"', tag, count=1)
+
+
+def social_size(match, context):
+    """og:image:width/height (and twitter:image-*) of a rewritten social image."""
+    tag = match.group()
+    if not context.get('social'):
+        return tag
+    value = context['social'][0 if match.group('dimension') == 'width' else 1]
+    return re.sub(r'''content\s*=\s*(["']).*?\1''', lambda _: f'content="{value}"', tag, count=1)
+
+
+META = r'''<meta\s[^>]*(?:property|name)\s*=\s*["']{}["'][^>]*>'''
+
+REWRITER = Rewriter([
+    Rule('social_size', META.format(r'(?:og:image:|twitter:image-)(?P<dimension>width|height)'),
+         social_size, re.IGNORECASE),
+    Rule('social_image', META.format(r'(?:og|twitter):image'), social_image, re.IGNORECASE),
+    Rule('picture', r'<img\s[^>]*>', picture, re.IGNORECASE),
+])
+
+
+def rewrite_page(path, site_dir, images, base_url):
+    """Rewrite one page's image markup in place. Returns True if it changed."""
+    with open(path, 'r', encoding='utf-8') as f:
+        html = f.read()
+    context = {'images': images, 'base_url': base_url, 'social': None,
+               'page_dir': posixpath.dirname(path.relative_to(site_dir).as_posix())}
+    rewritten = REWRITER.rewrite(html, context).text
+    if rewritten == html:
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(rewritten, encoding='utf-8')
+    os.replace(tmp_path, path)
+    return True
+
+
+def responsive_site(site_dir, pages, base_url='', jobs=None, cache_root=CACHE_DIR):
+    """
+    Derive, install and reference the responsive images of the site.
+    Returns (sources, encoded, pages rewritten, failed), or None without Pillow.
+    """
+    formats = available_formats()
+    if not formats:
+        return None
+    site_dir = Path(site_dir)
+    base_url = base_url.rstrip('/')
+    sources = {path: source_key(path)
+               for pattern in RESPONSIVE_IMAGES for path in sorted(site_dir.glob(pattern)) if path.is_file()}
+    infos, encoded, failed = encode_all(sources, formats, cache_root, jobs)
+
+    images = {}
+    for path, key in sources.items():
+        if key in infos:
+            images[path.relative_to(site_dir).as_posix()] = (install(path, key, infos[key], cache_root),
+                                                             infos[key])
+    rewritten = sum(rewrite_page(page, site_dir, images, base_url) for page in pages)
+    return len(sources), encoded, rewritten, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Write resized AVIF/WebP/PNG copies of the site images and use them in the pages.')
+    parser.add_argument('site_directory', help='Generated site directory (e.g. output/site)')
+    parser.add_argument('--site-url', default='',
+                        help='Absolute site URL, for og:image links (default: from _quarto.yml)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes for encoding (default: number of CPUs)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.site_directory):
+        print(f"Error: Site directory {args.site_directory} does not exist")
+        sys.exit(1)
+
+    from optimize_site import find_pages, site_url
+    with build_profile.span('responsive_images', category='site'):
+        result = responsive_site(args.site_directory, find_pages(args.site_directory),
+                                 args.site_url or site_url(), args.jobs)
+    if result is None:
+        print("Error: Pillow is not installed, images left as they are (run 'uv sync')", file=sys.stderr)
+        sys.exit(1)
+    sources, encoded, rewritten, failed = result
+    print(f"Responsive images: {sources} source(s), {encoded} encoded, rewrote {rewritten} page(s)")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script to split Quarto's search.json into a small manifest plus lazily
+loaded, content-hashed shards for static deployments.
+
+Output (under <site_dir>/search/):
+- manifest.json: which term shard covers which normalized prefix, and which
+  document shard holds which range of document ids
+- terms-<n>.<hash>.json: postings for the terms sharing a normalized prefix
+- docs-<n>.<hash>.json: href/title/section of the documents of one episode,
+  with only the first EXCERPT_LENGTH characters of their text for snippets
+
+assets/search/sharded-search.js (copied next to the manifest) fetches only
+the term shards a query touches, plus the document shards of the top hits.
+Shard names carry a content hash, so serve.py and static hosts can cache
+them immutably; only the small manifest needs revalidation.
+
+Quarto's search box would still download the whole search.json on the first
+query, so site_libs/quarto-search/quarto-search.js is patched to ask the
+sharded client instead (falling back to search.json if it cannot load).
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+
+import build_profile
+from build_search_index import build_index
+
+# Bump when the shard layout changes so clients can reject stale manifests
+SHARD_FORMAT_VERSION = 2
+
+# Term shards larger than this are split further by the next character
+SHARD_TARGET_BYTES = 32 * 1024
+
+# Never split term shards beyond this many prefix characters
+MAX_PREFIX_LENGTH = 4
+
+# Characters of each document's text kept in the doc shards for snippets;
+# a transcript's full text would make its shard hundreds of KB
+EXCERPT_LENGTH = 600
+
+# BM25 parameters; term frequencies are length-normalized at build time so
+# the client only needs document frequencies (the posting list lengths)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SEARCH_DIRNAME = 'search'
+CLIENT_SCRIPT = Path(__file__).resolve().parent.parent / 'assets' / 'search' / 'sharded-search.js'
+
+QUARTO_SEARCH_SCRIPT = Path('site_libs') / 'quarto-search' / 'quarto-search.js'
+
+# Quarto's Fuse.js search over the full search.json, in getItems()
+QUARTO_FUSE_SEARCH = re.compile(
+    r'return\s+readSearchData\(\)\.then\(function\s*\(fuse\)\s*\{\s*'
+    r'return\s+fuseSearch\(query,\s*fuse,\s*fuseSearchOptions\);\s*\}\);')
+
+QUARTO_SEARCH_MARKER = '// Sharded search (scripts/shard_search_index.py)'
+
+# Loads the client on the first query; Quarto's own search is the fallback
+QUARTO_SEARCH_GLUE = QUARTO_SEARCH_MARKER + '''
+let shardedClient = undefined;
+function shardedSearch(query, limit, fuseSearchOptions) {
+  if (shardedClient === undefined) {
+    shardedClient = new Promise(function (resolve, reject) {
+      const script = window.document.createElement("script");
+      script.src = offsetURL("''' + SEARCH_DIRNAME + '''/''' + CLIENT_SCRIPT.name + '''");
+      script.onload = function () { resolve(window.ChistaSearch); };
+      script.onerror = reject;
+      window.document.head.appendChild(script);
+    });
+  }
+  return shardedClient
+    .then(function (client) {
+      return client.quartoItems(query, limit, kQueryArg);
+    })
+    .catch(function () {
+      return readSearchData().then(function (fuse) {
+        return fuseSearch(query, fuse, fuseSearchOptions);
+      });
+    });
+}
+'''
+
+
+def episode_key(href):
+    """Group documents by episode directory; root pages share one group."""
+    path = href.split('#', 1)[0]
+    return path.split('/', 1)[0] if '/' in path else ''
+
+
+def serialize(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def split_terms(terms, prefix_length=1):
+    """
+    Group terms into shards by normalized prefix.
+    Returns a dict mapping prefix -> {term: postings}. A group that is still
+    too large is split by the next character; terms too short for the longer
+    prefix stay in the shorter prefix's shard.
+    """
+    groups = {}
+    for term, postings in terms.items():
+        groups.setdefault(term[:prefix_length], {})[term] = postings
+
+    shards = {}
+    for prefix, group in groups.items():
+        if len(serialize(group)) <= SHARD_TARGET_BYTES or prefix_length >= MAX_PREFIX_LENGTH:
+            shards[prefix] = group
+            continue
+        short_terms = {term: postings for term, postings in group.items()
+                       if len(term) <= prefix_length}
+        longer_terms = {term: postings for term, postings in group.items()
+                        if len(term) > prefix_length}
+        if short_terms:
+            shards[prefix] = short_terms
+        shards.update(split_terms(longer_terms, prefix_length + 1))
+    return shards
+
+
+def normalize_postings(index):
+    """
+    Replace raw term weights with BM25 length-normalized term frequencies:
+    tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average length))
+    """
+    lengths = [doc['length'] for doc in index['docs']]
+    average_length = (sum(lengths) / len(lengths)) if lengths else 1.0
+    terms = {}
+    for term, postings in index['terms'].items():
+        normalized = []
+        for i in range(0, len(postings), 2):
+            doc_id, tf = postings[i], postings[i + 1]
+            norm = 1 - BM25_B + BM25_B * lengths[doc_id] / average_length
+            normalized.extend((doc_id, round(tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm), 3)))
+        terms[term] = normalized
+    return terms
+
+
+def write_hashed(directory, stem, data):
+    """Write a content-hashed JSON file and return its name."""
+    payload = serialize(data)
+    digest = hashlib.sha256(payload).hexdigest()[:16]
+    name = f'{stem}.{digest}.json'
+    path = directory / name
+    if not path.exists():
+        path.write_bytes(payload)
+    return name
+
+
+def patch_quarto_search(site_dir):
+    """
+    Point Quarto's search box at the sharded client.
+    Returns True if quarto-search.js uses it (patched now or before), False
+    if the script was not recognized, and None if the site has no search box.
+    """
+    path = Path(site_dir) / QUARTO_SEARCH_SCRIPT
+    if not path.exists():
+        return None
+    script = path.read_text(encoding='utf-8')
+    if QUARTO_SEARCH_MARKER in script:
+        return True
+    patched, count = QUARTO_FUSE_SEARCH.subn(
+        'return shardedSearch(query, limit, fuseSearchOptions);', script, count=1)
+    if not count:
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(patched.rstrip('\n') + '\n\n' + QUARTO_SEARCH_GLUE, encoding='utf-8')
+    os.replace(tmp_path, path)
+    return True
+
+
+def shard_site_index(site_dir):
+    """
+    Build the sharded index for <site_dir>/search.json.
+    Returns a tuple of (term shards, document shards), or None if there is no search.json.
+    """
+    search_json = Path(site_dir) / 'search.json'
+    if not search_json.exists():
+        return None
+    with open(search_json, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    # Keep each episode's documents contiguous so a doc shard is an id range
+    entries = sorted(entries, key=lambda entry: episode_key(entry.get('href', '')))
+    index = build_index(entries)
+    terms = normalize_postings(index)
+
+    output_dir = Path(site_dir) / SEARCH_DIRNAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = set()
+
+    term_shards = []
+    for number, (prefix, group) in enumerate(sorted(split_terms(terms).items())):
+        name = write_hashed(output_dir, f'terms-{number}', {'terms': group})
+        term_shards.append([prefix, name])
+        written.add(name)
+
+    doc_shards = []
+    start = 0
+    docs = index['docs']
+    while start < len(docs):
+        key = episode_key(docs[start]['href'])
+        end = start
+        while end < len(docs) and episode_key(docs[end]['href']) == key:
+            end += 1
+        shard_docs = [{'href': doc['href'], 'title': doc['title'], 'section': doc['section'],
+                       'crumbs': doc['crumbs'], 'excerpt': doc['text'][:EXCERPT_LENGTH]}
+                      for doc in docs[start:end]]
+        name = write_hashed(output_dir, f'docs-{len(doc_shards)}', {'docs': shard_docs})
+        doc_shards.append([start, end - start, name])
+        written.add(name)
+        start = end
+
+    manifest = {
+        'version': SHARD_FORMAT_VERSION,
+        'doc_count': len(docs),
+        'terms': term_shards,
+        'docs': doc_shards,
+    }
+    manifest_path = output_dir / 'manifest.json'
+    tmp_path = output_dir / 'manifest.json.tmp'
+    tmp_path.write_bytes(serialize(manifest))
+    os.replace(tmp_path, manifest_path)
+    written.add('manifest.json')
+
+    if CLIENT_SCRIPT.exists():
+        shutil.copyfile(CLIENT_SCRIPT, output_dir / CLIENT_SCRIPT.name)
+        written.add(CLIENT_SCRIPT.name)
+        if patch_quarto_search(site_dir) is False:
+            print(f"Warning: {QUARTO_SEARCH_SCRIPT} not recognized, "
+                  "the search box still downloads search.json")
+
+    # Drop shards (and their compressed siblings) left over from earlier builds
+    for path in output_dir.iterdir():
+        base_name = path.name
+        for suffix in ('.gz', '.br'):
+            if base_name.endswith(suffix):
+                base_name = base_name[:-len(suffix)]
+        if base_name not in written:
+            path.unlink()
+
+    return len(term_shards), len(doc_shards)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: shard_search_index.py <site_directory>")
+        print("Example: shard_search_index.py output/site")
+        sys.exit(1)
+
+    site_dir = sys.argv[1]
+    if not os.path.isdir(site_dir):
+        print(f"Error: Site directory {site_dir} does not exist")
+        sys.exit(1)
+
+    with build_profile.span('shard_search_index', category='site'):
+        result = shard_site_index(site_dir)
+    if result is None:
+        print(f"Warning: No search.json found in {site_dir}")
+        sys.exit(0)
+
+    term_count, doc_count = result
+    print(f"Wrote sharded search index: {term_count} term shard(s), {doc_count} document shard(s)")
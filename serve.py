@@ -1,11 +1,59 @@
 #!/usr/bin/env python3
 """
 Custom HTTP server that gracefully handles broken pipe errors.
+
+Two serving engines are available:
+- threading (default): socketserver thread per connection, HTTP/1.0
+- asyncio: single event loop, HTTP/1.1 keep-alive with pipelining, bounded
+  concurrent connections and idle timeouts
+
+Either engine can run as a prefork pool (--workers N): N worker processes
+each listen on the same port with SO_REUSEPORT, so the kernel spreads
+connections across cores, and a supervisor restarts workers that die.
 """
+import argparse
+import array
+import asyncio
+import atexit
+import bisect
+import ctypes
+import email.utils
+import errno
+import functools
+import gzip
+import html
+import http.client
 import http.server
+import io
+import json
+import math
+import mimetypes
+import os
+import posixpath
+import re
+import select
+import shutil
+import signal
+import socket
 import socketserver
 import sys
+import tempfile
 import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter, OrderedDict
+from http import HTTPStatus
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional - without it we only negotiate gzip on the fly
+    brotli = None
+
+# Shared helpers (Persian search normalization) live next to the build scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from persian_text import normalize, normalize_with_offsets, tokenize  # noqa: E402
 
 # Store original exception handlers
 _original_excepthook = sys.excepthook
@@ -40,15 +88,1498 @@ if hasattr(threading, 'excepthook'):
     
     threading.excepthook = quiet_thread_excepthook
 
+# MIME types worth compressing (images, fonts and archives are already compressed)
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+# Files smaller than this are sent as-is; compression overhead outweighs the gain
+MIN_COMPRESS_SIZE = 256
+
+# Files larger than this are only served compressed if a build-time sibling exists
+MAX_ONTHEFLY_SIZE = 4 * 1024 * 1024
+
+# Total size of compressed bodies kept in memory by the on-the-fly cache
+COMPRESSED_CACHE_BYTES = 32 * 1024 * 1024
+
+# Supported content codings in order of preference, with the sibling file suffix
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+# Cache-Control policies matched against the URL path, first match wins.
+# Content-hashed files (e.g. bootstrap-0f23184077e95ba8b89ffdd8fc83af6a.min.css)
+# never change under the same name, so browsers may keep them for a year.
+# Pages and data files must be revalidated, which is cheap thanks to ETags.
+CACHE_POLICIES = [
+    (re.compile(r'[-.][0-9a-f]{16,}(\.min)?\.[A-Za-z0-9]+$'), 'public, max-age=31536000, immutable'),
+    (re.compile(r'(/|\.html?|\.json|\.xml)$'), 'public, max-age=0, must-revalidate'),
+]
+
+# Cache-Control for everything else (images, unhashed scripts, PDFs, ...)
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+
+def cache_control_for(url_path):
+    """Return the Cache-Control header value for a URL path."""
+    for pattern, value in CACHE_POLICIES:
+        if pattern.search(url_path):
+            return value
+    return DEFAULT_CACHE_CONTROL
+
+
+def sibling_is_fresh(sibling_stat, source_stat):
+    """
+    A .br/.gz sibling belongs to the current source only if it carries the
+    source's exact mtime, which precompress_site.py stamps on it. A sibling
+    that was touched or copied later is not trusted (the same rule the build
+    uses to decide whether to rewrite it).
+    """
+    return sibling_stat.st_mtime_ns == source_stat.st_mtime_ns
+
+
+def make_etag(fs, coding=None):
+    """
+    Build a strong ETag from a file's mtime and size.
+    Each content coding is a different representation, so it gets its own tag.
+    """
+    tag = f'{fs.st_mtime_ns:x}-{fs.st_size:x}'
+    if coding:
+        tag += f'-{coding}'
+    return f'"{tag}"'
+
+
+def etag_matches(header, etag):
+    """
+    Check an If-None-Match header against an ETag using weak comparison,
+    as required for If-None-Match (a W/ prefix is ignored).
+    """
+    if header.strip() == '*':
+        return True
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 16
+
+
+def parse_range_header(header, size):
+    """
+    Parse a "bytes=" Range header against a file of the given size.
+    Returns a list of (start, end) inclusive byte positions, an empty list if
+    no range is satisfiable (416), or None if the header should be ignored.
+    Handles forms like: "bytes=0-499", "bytes=500-", "bytes=-500", "bytes=0-0,-1"
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+    items = spec.split(',')
+    if len(items) > MAX_RANGES:
+        return None
+    
+    ranges = []
+    for item in items:
+        first, dash, last = item.strip().partition('-')
+        if not dash:
+            return None
+        first, last = first.strip(), last.strip()
+        try:
+            if not first:
+                # Suffix range: the final N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else start
+                if end < start:
+                    return None
+                end = size - 1 if not last else min(end, size - 1)
+        except ValueError:
+            return None
+        if start < 0 or start >= size:
+            continue
+        ranges.append((start, end))
+    return ranges
+
+
+class FileBody:
+    """
+    A response body made of literal byte chunks and (offset, length) slices
+    of an open file, sent in order. File slices go out through
+    socket.sendfile(), which uses os.sendfile() where the OS supports it.
+    """
+    
+    def __init__(self, file, segments):
+        self.file = file
+        self.segments = segments
+    
+    @property
+    def length(self):
+        return sum(len(seg) if isinstance(seg, bytes) else seg[1] for seg in self.segments)
+    
+    def send_to(self, sock, outputfile):
+        for seg in self.segments:
+            if isinstance(seg, bytes):
+                outputfile.write(seg)
+            else:
+                offset, count = seg
+                if count:
+                    sock.sendfile(self.file, offset, count)
+    
+    async def send_async(self, writer):
+        """Write the body to an asyncio StreamWriter, using loop.sendfile() for file slices."""
+        loop = asyncio.get_running_loop()
+        for seg in self.segments:
+            if isinstance(seg, bytes):
+                writer.write(seg)
+            else:
+                offset, count = seg
+                if count:
+                    # Everything buffered so far must hit the socket before sendfile
+                    await writer.drain()
+                    await loop.sendfile(writer.transport, self.file, offset, count)
+        await writer.drain()
+    
+    def close(self):
+        self.file.close()
+
+
+def multipart_segments(ranges, size, ctype, boundary):
+    """Build the FileBody segments of a multipart/byteranges response."""
+    segments = []
+    for index, (start, end) in enumerate(ranges):
+        # Every part after the first is preceded by the CRLF that ends the previous one
+        separator = "" if index == 0 else "\r\n"
+        part_header = (
+            f"{separator}--{boundary}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        )
+        segments.append(part_header.encode('latin-1'))
+        segments.append((start, end - start + 1))
+    segments.append(f"\r\n--{boundary}--\r\n".encode('latin-1'))
+    return segments
+
+
+def is_compressible(ctype):
+    """Check whether responses of the given MIME type should be compressed."""
+    return ctype.startswith('text/') or ctype in COMPRESSIBLE_TYPES
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into a dict mapping coding to q-value.
+    Handles forms like: "gzip, deflate, br", "br;q=1.0, gzip;q=0.8, *;q=0"
+    """
+    accepted = {}
+    if not header:
+        return accepted
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+@functools.lru_cache(maxsize=256)
+def acceptable_encodings(header):
+    """
+    Return the content codings from ENCODINGS the client accepts, best first.
+    A coding is acceptable if it is listed with q > 0, or matched by "*" with q > 0.
+    Browsers send a handful of distinct headers, so results are memoized.
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    ranked = []
+    for order, (coding, suffix) in enumerate(ENCODINGS):
+        q = accepted.get(coding, wildcard)
+        if q > 0:
+            ranked.append((-q, order, coding, suffix))
+    ranked.sort()
+    return tuple((coding, suffix) for _, _, coding, suffix in ranked)
+
+
+def compress_bytes(data, coding):
+    """Compress data with the given content coding for on-the-fly serving."""
+    if coding == 'br':
+        # Quality 5 is a good speed/ratio trade-off for dynamic compression
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+class CompressedAssetCache:
+    """
+    Thread-safe LRU cache of compressed file bodies.
+    Entries are keyed by (path, mtime, size, coding), so an edited file
+    naturally misses the cache and its stale entry ages out.
+    """
+
+    def __init__(self, max_bytes=COMPRESSED_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = body
+            self.current_bytes += len(body)
+            # Evict least recently used entries until we are under budget
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+
+compressed_cache = CompressedAssetCache()
+
+
+class StaticResponse:
+    """
+    A resolved response: status, header list and body.
+    The body is a FileBody, bytes, or None for bodiless responses.
+    """
+    
+    def __init__(self, status, headers=None, body=None):
+        self.status = status
+        self.headers = headers if headers is not None else []
+        self.body = body
+    
+    @classmethod
+    def error(cls, status, message=None):
+        """Build a small HTML error page in the same format as http.server."""
+        status = HTTPStatus(status)
+        content = http.server.DEFAULT_ERROR_MESSAGE % {
+            'code': status.value,
+            'message': message or status.phrase,
+            'explain': status.description,
+        }
+        body = content.encode('utf-8', 'replace')
+        headers = [
+            ("Content-Type", http.server.DEFAULT_ERROR_CONTENT_TYPE),
+            ("Content-Length", str(len(body))),
+        ]
+        return cls(status, headers, body)
+    
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+class StaticSite:
+    """
+    Resolves request paths under a site directory to StaticResponse objects.
+    This is where content negotiation, conditional requests and ranges live,
+    so the threading and asyncio engines serve the site identically.
+    """
+    
+    def __init__(self, directory):
+        self.directory = os.fspath(directory)
+        self.extensions_map = http.server.SimpleHTTPRequestHandler.extensions_map
+    
+    def translate_path(self, path):
+        """Translate a URL path to a filesystem path, as SimpleHTTPRequestHandler does."""
+        path = path.split('?', 1)[0]
+        path = path.split('#', 1)[0]
+        trailing_slash = path.rstrip().endswith('/')
+        try:
+            path = urllib.parse.unquote(path, errors='surrogatepass')
+        except UnicodeDecodeError:
+            path = urllib.parse.unquote(path)
+        path = posixpath.normpath(path)
+        words = filter(None, path.split('/'))
+        path = self.directory
+        for word in words:
+            if os.path.dirname(word) or word in (os.curdir, os.pardir):
+                # Ignore components that are not a simple file/directory name
+                continue
+            path = os.path.join(path, word)
+        if trailing_slash:
+            path += '/'
+        return path
+    
+    def guess_type(self, path):
+        """Guess the MIME type of a file, as SimpleHTTPRequestHandler does."""
+        base, ext = posixpath.splitext(path)
+        if ext in self.extensions_map:
+            return self.extensions_map[ext]
+        ext = ext.lower()
+        if ext in self.extensions_map:
+            return self.extensions_map[ext]
+        guess, _ = mimetypes.guess_type(path)
+        if guess:
+            return guess
+        return 'application/octet-stream'
+    
+    def resolve(self, target, headers):
+        """
+        Resolve a request target to a StaticResponse.
+        Compressible files are served from a precompressed .br/.gz sibling when
+        one exists, otherwise compressed on the fly through compressed_cache.
+        Conditional requests that match the current ETag/mtime get a bodiless 304.
+        Returns None for a directory without an index page, so the caller can
+        decide whether to list it.
+        """
+        url_path = urllib.parse.urlsplit(target).path
+        path = self.translate_path(target)
+        if os.path.isdir(path):
+            if not url_path.endswith('/'):
+                # Redirect browser - doing basically what apache does
+                parts = urllib.parse.urlsplit(target)
+                location = urllib.parse.urlunsplit(
+                    (parts[0], parts[1], parts[2] + '/', parts[3], parts[4]))
+                return StaticResponse(HTTPStatus.MOVED_PERMANENTLY,
+                                      [("Location", location), ("Content-Length", "0")])
+            for index in ('index.html', 'index.htm'):
+                index_path = os.path.join(path, index)
+                if os.path.isfile(index_path):
+                    path = index_path
+                    break
+            else:
+                return None
+        elif path.endswith('/'):
+            return StaticResponse.error(HTTPStatus.NOT_FOUND, "File not found")
+        
+        ctype = self.guess_type(path)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return StaticResponse.error(HTTPStatus.NOT_FOUND, "File not found")
+        
+        try:
+            fs = os.fstat(f.fileno())
+            compressible = is_compressible(ctype)
+            range_header = headers.get('Range')
+            coding, body = None, f
+            # Ranges always address the identity representation, so a Range
+            # request (media seeking, resumed downloads) is never compressed
+            if compressible and range_header is None and fs.st_size >= MIN_COMPRESS_SIZE:
+                coding, body = self.negotiate_encoding(path, f, fs, headers)
+            
+            etag = make_etag(fs, coding)
+            last_modified = email.utils.formatdate(fs.st_mtime, usegmt=True)
+            validators = [
+                ("ETag", etag),
+                ("Cache-Control", cache_control_for(url_path)),
+                ("Last-Modified", last_modified),
+            ]
+            if compressible:
+                # Caches must key on Accept-Encoding even when we sent identity
+                validators.append(("Vary", "Accept-Encoding"))
+            
+            if is_not_modified(headers, etag, fs):
+                if body is not f and hasattr(body, 'close'):
+                    body.close()
+                f.close()
+                return StaticResponse(HTTPStatus.NOT_MODIFIED, validators)
+            
+            ranges = None
+            if range_header is not None and if_range_matches(headers, etag, fs):
+                ranges = parse_range_header(range_header, fs.st_size)
+            if ranges == []:
+                f.close()
+                return StaticResponse(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, [
+                    ("Content-Range", f"bytes */{fs.st_size}"),
+                    ("Content-Length", "0"),
+                ])
+            
+            status = HTTPStatus.OK
+            content_range = None
+            if body is f:
+                if ranges:
+                    status = HTTPStatus.PARTIAL_CONTENT
+                    if len(ranges) == 1:
+                        start, end = ranges[0]
+                        content_range = f"bytes {start}-{end}/{fs.st_size}"
+                        body = FileBody(f, [(start, end - start + 1)])
+                    else:
+                        boundary = uuid.uuid4().hex
+                        body = FileBody(f, multipart_segments(ranges, fs.st_size, ctype, boundary))
+                        ctype = f"multipart/byteranges; boundary={boundary}"
+                else:
+                    body = FileBody(f, [(0, fs.st_size)])
+                length = body.length
+            elif isinstance(body, bytes):
+                length = len(body)
+                f.close()
+            else:
+                # Precompressed sibling file
+                length = os.fstat(body.fileno()).st_size
+                body = FileBody(body, [(0, length)])
+                f.close()
+            
+            response_headers = [
+                ("Content-Type", ctype),
+                ("Content-Length", str(length)),
+            ]
+            if content_range:
+                response_headers.append(("Content-Range", content_range))
+            response_headers.append(("Accept-Ranges", "bytes"))
+            if coding:
+                response_headers.append(("Content-Encoding", coding))
+            return StaticResponse(status, response_headers + validators, body)
+        except:
+            f.close()
+            raise
+    
+    def negotiate_encoding(self, path, f, fs, headers):
+        """
+        Pick the best content coding for a compressible file.
+        Returns (coding, body) where body is an open sibling file, compressed
+        bytes, or the original file object f when identity is used.
+        """
+        for coding, suffix in acceptable_encodings(headers.get('Accept-Encoding')):
+            # Prefer a build-time sibling made from the current source
+            try:
+                sibling = open(path + suffix, 'rb')
+            except OSError:
+                sibling = None
+            if sibling is not None:
+                if sibling_is_fresh(os.fstat(sibling.fileno()), fs):
+                    return coding, sibling
+                sibling.close()
+            
+            if coding == 'br' and brotli is None:
+                continue
+            if fs.st_size > MAX_ONTHEFLY_SIZE:
+                continue
+            
+            key = (path, fs.st_mtime_ns, fs.st_size, coding)
+            body = compressed_cache.get(key)
+            if body is None:
+                body = compress_bytes(f.read(), coding)
+                f.seek(0)
+                compressed_cache.put(key, body)
+            return coding, body
+        return None, f
+
+
+def parse_http_date(value):
+    """Parse an HTTP date header into a POSIX timestamp, or None if invalid."""
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, IndexError, OverflowError, ValueError):
+        return None
+    if parsed is None or parsed.tzinfo is None:
+        return None
+    return parsed.timestamp()
+
+
+def is_not_modified(headers, etag, fs):
+    """
+    Evaluate If-None-Match / If-Modified-Since against the file.
+    If-Modified-Since is only consulted when If-None-Match is absent.
+    """
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since is None:
+        return False
+    since = parse_http_date(if_modified_since)
+    # HTTP dates have one-second resolution
+    return since is not None and int(fs.st_mtime) <= since
+
+
+def if_range_matches(headers, etag, fs):
+    """
+    Evaluate If-Range: ranges are only honoured if the validator still
+    matches, otherwise the client gets the full, current file.
+    """
+    if_range = headers.get('If-Range')
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # If-Range requires strong comparison
+        return if_range == etag
+    since = parse_http_date(if_range)
+    return since is not None and int(fs.st_mtime) == int(since)
+
+
+# Files larger than this are not preloaded and keep being served from disk
+PRELOAD_MAX_FILE_SIZE = 16 * 1024 * 1024
+
+
+def normalize_url_path(target):
+    """
+    Normalize a request target to the snapshot key for it, applying the same
+    rules as StaticSite.translate_path ("/a/./b/../c?x" -> "/a/c").
+    """
+    path = target.split('?', 1)[0].split('#', 1)[0]
+    trailing_slash = path.rstrip().endswith('/')
+    try:
+        path = urllib.parse.unquote(path, errors='surrogatepass')
+    except UnicodeDecodeError:
+        path = urllib.parse.unquote(path)
+    words = [word for word in posixpath.normpath(path).split('/')
+             if word and word not in (os.curdir, os.pardir)]
+    key = '/' + '/'.join(words)
+    if trailing_slash and words:
+        key += '/'
+    return key
+
+
+class SnapshotEntry:
+    """
+    A preloaded file: its bytes, each compressed variant and the response
+    headers for every representation, all computed once at load time.
+    """
+    
+    __slots__ = ('stat', 'ctype', 'bodies', 'headers', 'validators', 'etags', 'compressible')
+    
+    def __init__(self, path, url_path, site):
+        with open(path, 'rb') as f:
+            data = f.read()
+            self.stat = os.fstat(f.fileno())
+        self.ctype = site.guess_type(path)
+        self.compressible = is_compressible(self.ctype)
+        self.bodies = {None: data}
+        if self.compressible and len(data) >= MIN_COMPRESS_SIZE:
+            for coding, suffix in ENCODINGS:
+                compressed = self.load_sibling(path + suffix)
+                if compressed is None:
+                    if coding == 'br' and brotli is None:
+                        continue
+                    compressed = compress_bytes(data, coding)
+                if len(compressed) < len(data):
+                    self.bodies[coding] = compressed
+        
+        cache_control = cache_control_for(url_path)
+        last_modified = email.utils.formatdate(self.stat.st_mtime, usegmt=True)
+        self.headers = {}
+        self.validators = {}
+        self.etags = {}
+        for coding, body in self.bodies.items():
+            etag = make_etag(self.stat, coding)
+            validators = [
+                ("ETag", etag),
+                ("Cache-Control", cache_control),
+                ("Last-Modified", last_modified),
+            ]
+            if self.compressible:
+                validators.append(("Vary", "Accept-Encoding"))
+            headers = [
+                ("Content-Type", self.ctype),
+                ("Content-Length", str(len(body))),
+                ("Accept-Ranges", "bytes"),
+            ]
+            if coding:
+                headers.append(("Content-Encoding", coding))
+            self.etags[coding] = etag
+            self.validators[coding] = validators
+            self.headers[coding] = headers + validators
+    
+    def load_sibling(self, sibling_path):
+        """Read a build-time .br/.gz sibling if it was made from the current file."""
+        try:
+            with open(sibling_path, 'rb') as f:
+                if sibling_is_fresh(os.fstat(f.fileno()), self.stat):
+                    return f.read()
+        except OSError:
+            pass
+        return None
+
+
+class SiteSnapshot:
+    """
+    An immutable in-memory copy of a site directory, keyed by URL path.
+    Directories with an index page are keyed with a trailing slash.
+    """
+    
+    def __init__(self, site):
+        self.entries = {}
+        self.total_bytes = 0
+        sibling_suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        for dirpath, dirnames, filenames in os.walk(site.directory):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, site.directory)
+            url_dir = '/' if rel_dir == os.curdir else '/' + rel_dir.replace(os.sep, '/') + '/'
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if filename.endswith(sibling_suffixes) and os.path.splitext(filename)[0] in filenames:
+                    # Precompressed sibling, loaded as a variant of its source file
+                    continue
+                try:
+                    if os.path.getsize(path) > PRELOAD_MAX_FILE_SIZE:
+                        continue
+                    entry = SnapshotEntry(path, url_dir + filename, site)
+                except OSError:
+                    # File vanished mid-walk (e.g. during a rebuild); the watcher reloads again
+                    continue
+                self.entries[url_dir + filename] = entry
+                self.total_bytes += sum(len(body) for body in entry.bodies.values())
+            for index in ('index.html', 'index.htm'):
+                if url_dir + index in self.entries:
+                    self.entries[url_dir] = self.entries[url_dir + index]
+                    break
+
+
+class SnapshotSite(StaticSite):
+    """
+    A StaticSite that answers from a SiteSnapshot held in memory, so the hot
+    path does no stat/open/read. Requests the snapshot cannot answer (large
+    files, directory listings, files added since the last load) fall back
+    to the disk-backed StaticSite. reload() swaps in a fresh snapshot with a
+    single reference assignment, so in-flight requests are never affected.
+    """
+    
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.snapshot = SiteSnapshot(self)
+    
+    def reload(self):
+        self.snapshot = SiteSnapshot(self)
+        return self.snapshot
+    
+    def resolve(self, target, headers):
+        snapshot = self.snapshot
+        key = normalize_url_path(target)
+        entry = snapshot.entries.get(key)
+        if entry is None:
+            if not key.endswith('/') and key + '/' in snapshot.entries:
+                # Redirect browser - doing basically what apache does
+                parts = urllib.parse.urlsplit(target)
+                location = urllib.parse.urlunsplit(
+                    (parts[0], parts[1], parts[2] + '/', parts[3], parts[4]))
+                return StaticResponse(HTTPStatus.MOVED_PERMANENTLY,
+                                      [("Location", location), ("Content-Length", "0")])
+            return super().resolve(target, headers)
+        
+        range_header = headers.get('Range')
+        coding = None
+        if len(entry.bodies) > 1 and range_header is None:
+            for candidate, _ in acceptable_encodings(headers.get('Accept-Encoding')):
+                if candidate in entry.bodies:
+                    coding = candidate
+                    break
+        
+        if is_not_modified(headers, entry.etags[coding], entry.stat):
+            return StaticResponse(HTTPStatus.NOT_MODIFIED, entry.validators[coding])
+        
+        if range_header is not None and if_range_matches(headers, entry.etags[None], entry.stat):
+            return self.resolve_range(entry, range_header)
+        return StaticResponse(HTTPStatus.OK, entry.headers[coding], entry.bodies[coding])
+    
+    def resolve_range(self, entry, range_header):
+        """Answer a Range request from the identity body held in memory."""
+        data = entry.bodies[None]
+        size = len(data)
+        ranges = parse_range_header(range_header, size)
+        if ranges is None:
+            return StaticResponse(HTTPStatus.OK, entry.headers[None], data)
+        if not ranges:
+            return StaticResponse(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, [
+                ("Content-Range", f"bytes */{size}"),
+                ("Content-Length", "0"),
+            ])
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            body = data[start:end + 1]
+            ctype = entry.ctype
+            content_range = [("Content-Range", f"bytes {start}-{end}/{size}")]
+        else:
+            boundary = uuid.uuid4().hex
+            segments = multipart_segments(ranges, size, entry.ctype, boundary)
+            body = b''.join(seg if isinstance(seg, bytes) else data[seg[0]:seg[0] + seg[1]]
+                            for seg in segments)
+            ctype = f"multipart/byteranges; boundary={boundary}"
+            content_range = []
+        headers = [("Content-Type", ctype), ("Content-Length", str(len(body)))]
+        headers += content_range
+        headers.append(("Accept-Ranges", "bytes"))
+        return StaticResponse(HTTPStatus.PARTIAL_CONTENT, headers + entry.validators[None], body)
+
+
+class InotifyWatch:
+    """
+    Minimal ctypes binding to Linux inotify, watching a directory tree.
+    wait() blocks until something under the tree changes or the timeout ends.
+    """
+    
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    # IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    WATCH_MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200 | 0x400 | 0x800
+    
+    def __init__(self, directory):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for dirpath, _, _ in os.walk(directory):
+            self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.WATCH_MASK)
+    
+    def wait(self, timeout):
+        """Return True if any change event arrived within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        # Drain pending events; we only care that something changed
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+    
+    def close(self):
+        os.close(self.fd)
+
+
+def tree_signature(directory):
+    """Cheap fingerprint of a directory tree: every file's path, size and mtime."""
+    signature = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            try:
+                st = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            signature.append((dirpath, filename, st.st_size, st.st_mtime_ns))
+    return signature
+
+
+class SnapshotWatcher(threading.Thread):
+    """
+    Background thread that reloads a SnapshotSite when its directory changes.
+    Uses inotify where available, otherwise polls mtimes every interval.
+    A reload happens only once the tree has been quiet for settle_time seconds,
+    so a rebuild in progress (rm -rf + mv in build_site.sh) is not snapshotted.
+    """
+    
+    def __init__(self, site, interval=1.0, settle_time=1.0):
+        super().__init__(name="snapshot-watcher", daemon=True)
+        self.site = site
+        self.interval = interval
+        self.settle_time = settle_time
+    
+    def run(self):
+        try:
+            watch = InotifyWatch(self.site.directory)
+        except (OSError, AttributeError):
+            watch = None
+        if watch is not None:
+            self.run_inotify(watch)
+        else:
+            self.run_polling()
+    
+    def run_inotify(self, watch):
+        while True:
+            if not watch.wait(None):
+                continue
+            # Wait for the burst of events from a rebuild to settle
+            while watch.wait(self.settle_time):
+                pass
+            # Directories may have been replaced, so watch the new tree; the
+            # new watch is set up first so changes made during reload are seen
+            watch.close()
+            watch = InotifyWatch(self.site.directory)
+            self.reload()
+    
+    def run_polling(self):
+        signature = tree_signature(self.site.directory)
+        while True:
+            time.sleep(self.interval)
+            current = tree_signature(self.site.directory)
+            if current == signature:
+                continue
+            # Wait until two consecutive scans agree before reloading
+            while True:
+                time.sleep(self.settle_time)
+                settled = tree_signature(self.site.directory)
+                if settled == current:
+                    break
+                current = settled
+            signature = current
+            self.reload()
+    
+    def reload(self):
+        snapshot = self.site.reload()
+        print(f"Reloaded site snapshot: {len(snapshot.entries)} entries, "
+              f"{snapshot.total_bytes / (1024 * 1024):.1f} MB", file=sys.stderr)
+
+
+def make_site(args):
+    """Create the StaticSite for the server, preloaded and watched if requested."""
+    if not args.preload:
+        return StaticSite(args.directory)
+    site = SnapshotSite(args.directory)
+    SnapshotWatcher(site, interval=args.watch_interval).start()
+    return site
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram of latencies in microseconds.
+    Each power-of-two range is split into 16 linear sub-buckets, giving about
+    6% relative precision from 1us to hours with a fixed 1024-slot table.
+    """
+    
+    SUB_BUCKET_BITS = 4
+    
+    def __init__(self):
+        self.counts = [0] * (64 << self.SUB_BUCKET_BITS)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+    
+    @classmethod
+    def bucket_index(cls, value):
+        linear_limit = 2 << cls.SUB_BUCKET_BITS
+        if value < linear_limit:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
+    
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        if index < (2 << cls.SUB_BUCKET_BITS):
+            return index
+        shift = (index >> cls.SUB_BUCKET_BITS) - 1
+        return ((index - (shift << cls.SUB_BUCKET_BITS) + 1) << shift) - 1
+    
+    def record(self, micros):
+        micros = max(0, int(micros))
+        self.counts[self.bucket_index(micros)] += 1
+        self.total += 1
+        self.sum += micros
+        if micros > self.max:
+            self.max = micros
+    
+    def merge(self, other):
+        """Add the samples of another histogram (same bucket layout) to this one."""
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, p):
+        """Return the latency (in microseconds) below which p percent of samples fall."""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.bucket_upper_bound(index), self.max)
+        return self.max
+
+
+def escape_label(value):
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ServerMetrics:
+    """
+    Thread-safe request metrics: per-route and per-status counts, bytes
+    served, a latency histogram and the number of client disconnects that
+    were silently suppressed.
+    
+    In prefork mode each worker counts its own requests and publishes a
+    snapshot to a directory shared with the other workers (see share()).
+    Whichever worker answers /__stats or /__metrics merges all snapshots,
+    so the endpoints describe the whole server, not one worker.
+    """
+    
+    # Distinct routes tracked individually; the rest are counted as "(other)"
+    MAX_ROUTES = 500
+    
+    QUANTILES = (50, 90, 95, 99, 99.9)
+    
+    # Seconds between snapshots published by each prefork worker
+    PUBLISH_INTERVAL = 1.0
+    
+    def __init__(self):
+        self.endpoints_enabled = True
+        self.started = time.time()
+        self.requests = 0
+        self.bytes_out = 0
+        self.disconnects = 0
+        self.statuses = Counter()
+        self.routes = {}  # route -> [requests, bytes]
+        self.latency = LatencyHistogram()
+        self.pids = [os.getpid()]
+        self.share_dir = None
+        self._lock = threading.Lock()
+    
+    def record(self, route, status, nbytes, seconds):
+        with self._lock:
+            self.requests += 1
+            self.bytes_out += nbytes
+            self.statuses[status] += 1
+            counters = self.routes.get(route)
+            if counters is None:
+                if len(self.routes) >= self.MAX_ROUTES:
+                    route = '(other)'
+                counters = self.routes.setdefault(route, [0, 0])
+            counters[0] += 1
+            counters[1] += nbytes
+            self.latency.record(seconds * 1e6)
+    
+    def record_disconnect(self):
+        with self._lock:
+            self.disconnects += 1
+    
+    def share(self, directory):
+        """
+        Publish this process's snapshot to directory every PUBLISH_INTERVAL
+        seconds and merge every snapshot found there when the endpoints are
+        scraped. Called in each prefork worker after the fork.
+        """
+        self.share_dir = directory
+        self.pids = [os.getpid()]
+        thread = threading.Thread(target=self._publish_loop, name='metrics-publisher', daemon=True)
+        thread.start()
+    
+    def _publish_loop(self):
+        while True:
+            time.sleep(self.PUBLISH_INTERVAL)
+            try:
+                self.publish()
+            except OSError:
+                # The supervisor removed the directory on shutdown
+                return
+    
+    def snapshot(self):
+        """The raw counters as a JSON-serializable dict, for merging across processes."""
+        with self._lock:
+            latency = self.latency
+            return {
+                'pid': os.getpid(),
+                'started': self.started,
+                'requests': self.requests,
+                'bytes_out': self.bytes_out,
+                'client_disconnects': self.disconnects,
+                'status': {str(code): count for code, count in self.statuses.items()},
+                'routes': {route: list(counters) for route, counters in self.routes.items()},
+                # Sparse, since most of the 1024 buckets are empty
+                'latency': {
+                    'counts': {str(index): count for index, count in enumerate(latency.counts) if count},
+                    'total': latency.total,
+                    'sum': latency.sum,
+                    'max': latency.max,
+                },
+            }
+    
+    def publish(self):
+        """Atomically write this process's snapshot to the shared directory."""
+        if self.share_dir is None:
+            return
+        path = os.path.join(self.share_dir, f'{os.getpid()}.json')
+        tmp_path = os.path.join(self.share_dir, f'.{os.getpid()}.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def merged(cls, snapshots):
+        """A ServerMetrics holding the sum of several processes' snapshots."""
+        total = cls()
+        total.pids = []
+        for snapshot in snapshots:
+            total.pids.append(snapshot['pid'])
+            total.started = min(total.started, snapshot['started'])
+            total.requests += snapshot['requests']
+            total.bytes_out += snapshot['bytes_out']
+            total.disconnects += snapshot['client_disconnects']
+            total.statuses.update({int(code): count for code, count in snapshot['status'].items()})
+            for route, (requests, nbytes) in snapshot['routes'].items():
+                if route not in total.routes and len(total.routes) >= cls.MAX_ROUTES:
+                    route = '(other)'
+                counters = total.routes.setdefault(route, [0, 0])
+                counters[0] += requests
+                counters[1] += nbytes
+            latency = LatencyHistogram()
+            for index, count in snapshot['latency']['counts'].items():
+                latency.counts[int(index)] = count
+            latency.total = snapshot['latency']['total']
+            latency.sum = snapshot['latency']['sum']
+            latency.max = snapshot['latency']['max']
+            total.latency.merge(latency)
+        total.pids.sort()
+        return total
+    
+    def combined(self):
+        """
+        The metrics to report: this process's own, or in prefork mode the
+        merge of every worker's latest snapshot (including workers that have
+        since been restarted, so the totals never go backwards). The other
+        workers' numbers are at most PUBLISH_INTERVAL seconds old.
+        """
+        if self.share_dir is None:
+            return self
+        self.publish()
+        snapshots = []
+        for name in os.listdir(self.share_dir):
+            if not name.endswith('.json') or name.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(self.share_dir, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return self.merged(snapshots)
+    
+    def as_dict(self):
+        with self._lock:
+            latency = self.latency
+            return {
+                'pid': os.getpid(),
+                'workers': self.pids,
+                'uptime_seconds': round(time.time() - self.started, 3),
+                'requests': self.requests,
+                'bytes_out': self.bytes_out,
+                'client_disconnects': self.disconnects,
+                'status': {str(code): count for code, count in sorted(self.statuses.items())},
+                'routes': {route: {'requests': c[0], 'bytes_out': c[1]}
+                           for route, c in sorted(self.routes.items())},
+                'latency_ms': {
+                    'count': latency.total,
+                    'mean': round(latency.sum / latency.total / 1000, 3) if latency.total else 0,
+                    'max': round(latency.max / 1000, 3),
+                    **{f'p{q:g}': round(latency.percentile(q) / 1000, 3) for q in self.QUANTILES},
+                },
+            }
+    
+    def as_prometheus(self):
+        stats = self.as_dict()
+        lines = [
+            '# HELP nevisa_http_requests_total HTTP requests served, by status code.',
+            '# TYPE nevisa_http_requests_total counter',
+        ]
+        for code, count in stats['status'].items():
+            lines.append(f'nevisa_http_requests_total{{status="{code}"}} {count}')
+        lines += [
+            '# HELP nevisa_http_route_requests_total HTTP requests served, by URL path.',
+            '# TYPE nevisa_http_route_requests_total counter',
+        ]
+        for route, counters in stats['routes'].items():
+            lines.append(f'nevisa_http_route_requests_total{{route="{escape_label(route)}"}} '
+                         f'{counters["requests"]}')
+        lines += [
+            '# HELP nevisa_http_response_bytes_total Response bytes sent (headers excluded).',
+            '# TYPE nevisa_http_response_bytes_total counter',
+            f'nevisa_http_response_bytes_total {stats["bytes_out"]}',
+            '# HELP nevisa_http_client_disconnects_total Client disconnects suppressed while serving.',
+            '# TYPE nevisa_http_client_disconnects_total counter',
+            f'nevisa_http_client_disconnects_total {stats["client_disconnects"]}',
+            '# HELP nevisa_http_request_duration_seconds Request latency.',
+            '# TYPE nevisa_http_request_duration_seconds summary',
+        ]
+        with self._lock:
+            for q in self.QUANTILES:
+                value = self.latency.percentile(q) / 1e6
+                lines.append(f'nevisa_http_request_duration_seconds{{quantile="{q / 100:g}"}} {value:.6f}')
+            lines.append(f'nevisa_http_request_duration_seconds_sum {self.latency.sum / 1e6:.6f}')
+            lines.append(f'nevisa_http_request_duration_seconds_count {self.latency.total}')
+        return '\n'.join(lines) + '\n'
+    
+    def resolve(self, target):
+        """Answer the /__stats and /__metrics endpoints, or return None."""
+        if not self.endpoints_enabled:
+            return None
+        path = urllib.parse.urlsplit(target).path
+        if path == '/__stats':
+            body = json.dumps(self.combined().as_dict(), ensure_ascii=False, indent=2).encode('utf-8')
+            ctype = 'application/json'
+        elif path == '/__metrics':
+            body = self.combined().as_prometheus().encode('utf-8')
+            ctype = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            return None
+        return StaticResponse(HTTPStatus.OK, [
+            ("Content-Type", ctype),
+            ("Content-Length", str(len(body))),
+            ("Cache-Control", "no-store"),
+        ], body)
+
+
+class AccessLog:
+    """
+    Buffered access log in "common" (the http.server format) or "json" lines.
+    Lines are batched and flushed every FLUSH_LINES lines or FLUSH_INTERVAL
+    seconds, and the timestamp string is reused within the same second.
+    """
+    
+    FLUSH_LINES = 64
+    FLUSH_INTERVAL = 1.0
+    
+    def __init__(self, format='common', stream=None):
+        self.format = format
+        self.stream = stream
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._stamp_second = None
+        self._stamp = ''
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    def log(self, client_host, requestline, method, target, status, nbytes, seconds):
+        if self.format == 'off':
+            return
+        now = time.time()
+        if self.format == 'json':
+            line = json.dumps({
+                'ts': round(now, 3),
+                'client': client_host,
+                'method': method,
+                'path': target,
+                'status': status,
+                'bytes': nbytes,
+                'duration_ms': round(seconds * 1000, 3),
+            }, ensure_ascii=False) + '\n'
+        else:
+            second = int(now)
+            if second != self._stamp_second:
+                self._stamp_second = second
+                self._stamp = time.strftime("%d/%b/%Y %H:%M:%S", time.localtime(second))
+            line = f'{client_host} - - [{self._stamp}] "{requestline}" {status} {nbytes}\n'
+        with self._lock:
+            self._pending.append(line)
+            if (len(self._pending) < self.FLUSH_LINES
+                    and time.monotonic() - self._last_flush < self.FLUSH_INTERVAL):
+                return
+            self._flush_locked()
+    
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        stream = self.stream or sys.stderr
+        try:
+            stream.write(''.join(self._pending))
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+        self._pending.clear()
+
+
+class SearchIndex:
+    """
+    In-memory inverted index built by scripts/build_search_index.py.
+    Queries are normalized like the index, ranked with BM25 (all query terms
+    must match, the last one as a prefix so results appear while typing) and
+    returned with an HTML snippet around the first match.
+    """
+    
+    INDEX_VERSION = 1
+    
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+    
+    # Prefix expansions considered for the last query term
+    MAX_PREFIX_TERMS = 64
+    
+    # Characters of context shown on each side of the first match
+    SNIPPET_CONTEXT = 80
+    
+    # Original characters per checkpoint of a document's normalized text
+    SNIPPET_CHUNK = 256
+    
+    # Extra characters past the snippet end, so a match that starts inside it is whole
+    SNIPPET_MARGIN = 64
+    
+    def __init__(self, data):
+        if data.get('version') != self.INDEX_VERSION:
+            raise ValueError(f"unsupported search index version {data.get('version')!r}")
+        self.docs = data['docs']
+        self.terms = data['terms']
+        self.vocabulary = sorted(self.terms)
+        lengths = [doc['length'] for doc in self.docs]
+        self.average_length = (sum(lengths) / len(lengths)) if lengths else 1.0
+        # Normalized text of every document, with the normalized position at
+        # which each SNIPPET_CHUNK of the original starts, so a snippet only
+        # maps a small window back to the original instead of the whole text
+        self.normalized = [self.checkpoint(doc['text']) for doc in self.docs]
+    
+    @classmethod
+    def checkpoint(cls, text):
+        """(normalized text, normalized start of every SNIPPET_CHUNK of text)."""
+        chunks = [normalize(text[i:i + cls.SNIPPET_CHUNK]) for i in range(0, len(text), cls.SNIPPET_CHUNK)]
+        starts = array.array('I', [0])
+        for chunk in chunks[:-1]:
+            starts.append(starts[-1] + len(chunk))
+        return ''.join(chunks), starts
+    
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+    
+    def expand(self, term, prefix):
+        """Return the indexed terms matching a query term."""
+        if not prefix:
+            return [term] if term in self.terms else []
+        start = bisect.bisect_left(self.vocabulary, term)
+        matches = []
+        for candidate in self.vocabulary[start:start + self.MAX_PREFIX_TERMS]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+    
+    def search(self, query, limit=10):
+        """Return (total matches, ranked results) for a query string."""
+        query_terms = tokenize(query)
+        if not query_terms:
+            return 0, []
+        
+        doc_count = len(self.docs)
+        scores = None
+        matched_terms = []
+        for position, term in enumerate(query_terms):
+            is_last = position == len(query_terms) - 1
+            term_scores = {}
+            for candidate in self.expand(term, prefix=is_last):
+                postings = self.terms[candidate]
+                df = len(postings) // 2
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for i in range(0, len(postings), 2):
+                    doc_id, tf = postings[i], postings[i + 1]
+                    norm = 1 - self.B + self.B * self.docs[doc_id]['length'] / self.average_length
+                    score = idf * tf * (self.K1 + 1) / (tf + self.K1 * norm)
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+                matched_terms.append(candidate)
+            if scores is None:
+                scores = term_scores
+            else:
+                # Every query term must match
+                scores = {doc_id: score + term_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return 0, []
+        
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        results = []
+        for doc_id, score in ranked[:limit]:
+            doc = self.docs[doc_id]
+            results.append({
+                'href': doc['href'],
+                'title': doc['title'],
+                'section': doc['section'],
+                'crumbs': doc['crumbs'],
+                'score': round(score, 4),
+                'snippet': self.snippet(doc_id, matched_terms),
+            })
+        return len(scores), results
+    
+    def snippet(self, doc_id, terms):
+        """HTML-escaped excerpt around the first match, with matches in <mark>."""
+        text = self.docs[doc_id]['text']
+        normalized, starts = self.normalized[doc_id]
+        pattern = terms_pattern(tuple(sorted(set(terms))))
+        match = pattern.search(normalized)
+        if match is None:
+            return html.escape(text[:2 * self.SNIPPET_CONTEXT])
+        
+        # Map only a window around the chunk holding the first match back to the original
+        chunk = bisect.bisect_right(starts, match.start()) - 1
+        chunk_start = chunk * self.SNIPPET_CHUNK
+        window_start = max(0, chunk_start - self.SNIPPET_CONTEXT)
+        window_end = chunk_start + self.SNIPPET_CHUNK + self.SNIPPET_CONTEXT + self.SNIPPET_MARGIN
+        window, offsets = normalize_with_offsets(text[window_start:window_end])
+        first_in_window = match.start() - starts[chunk] + len(normalize(text[window_start:chunk_start]))
+        spans = [span.span() for span in pattern.finditer(window) if span.start() >= first_in_window]
+        
+        first = window_start + offsets[first_in_window]
+        start = max(0, first - self.SNIPPET_CONTEXT)
+        end = min(len(text), first + self.SNIPPET_CONTEXT)
+        parts = ['…' if start > 0 else '']
+        cursor = start
+        for span_start, span_end in spans:
+            original_start = window_start + offsets[span_start]
+            original_end = window_start + offsets[span_end - 1] + 1
+            if original_start < cursor or original_start >= end:
+                continue
+            parts.append(html.escape(text[cursor:original_start]))
+            parts.append('<mark>' + html.escape(text[original_start:original_end]) + '</mark>')
+            cursor = original_end
+        parts.append(html.escape(text[cursor:max(cursor, end)]))
+        parts.append('…' if end < len(text) else '')
+        return ''.join(parts).strip()
+
+
+@functools.lru_cache(maxsize=256)
+def terms_pattern(terms):
+    """
+    One compiled pattern matching any of the terms at a word start. Shorter
+    terms come first, so a prefix expansion highlights what was typed.
+    """
+    alternatives = '|'.join(re.escape(term) for term in sorted(terms, key=len))
+    return re.compile(r'(?<!\w)(?:' + alternatives + ')')
+
+
+class SearchEndpoint:
+    """
+    Answers /api/search?q=&limit= from the site's search-index.json.
+    The index is loaded on first use and reloaded when the file changes.
+    """
+    
+    PATH = '/api/search'
+    INDEX_FILENAME = 'search-index.json'
+    DEFAULT_LIMIT = 10
+    MAX_LIMIT = 50
+    
+    def __init__(self):
+        self._indexes = {}  # directory -> (mtime_ns, SearchIndex)
+        self._lock = threading.Lock()
+    
+    def get_index(self, directory):
+        path = os.path.join(directory, self.INDEX_FILENAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._indexes.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            cached = self._indexes.get(directory)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, SearchIndex.load(path))
+                self._indexes[directory] = cached
+        return cached[1]
+    
+    def resolve(self, site, target):
+        parts = urllib.parse.urlsplit(target)
+        if parts.path != self.PATH:
+            return None
+        params = urllib.parse.parse_qs(parts.query)
+        query = params.get('q', [''])[0]
+        try:
+            limit = int(params.get('limit', [self.DEFAULT_LIMIT])[0])
+        except ValueError:
+            limit = self.DEFAULT_LIMIT
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        
+        try:
+            index = self.get_index(site.directory)
+        except (OSError, ValueError, KeyError) as e:
+            return StaticResponse.error(HTTPStatus.SERVICE_UNAVAILABLE, f"Search index unavailable: {e}")
+        if index is None:
+            return StaticResponse.error(HTTPStatus.NOT_FOUND, "Search index not built")
+        
+        total, results = index.search(query, limit)
+        body = json.dumps({'query': query, 'total': total, 'results': results},
+                          ensure_ascii=False).encode('utf-8')
+        return StaticResponse(HTTPStatus.OK, [
+            ("Content-Type", "application/json; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+            ("Cache-Control", "public, max-age=60"),
+        ], body)
+
+
+metrics = ServerMetrics()
+access_log = AccessLog()
+search_endpoint = SearchEndpoint()
+
+
+def record_request(client_host, requestline, method, target, status, nbytes, seconds):
+    """Account a finished request in the metrics and the access log."""
+    route = normalize_url_path(target) if target else '(invalid)'
+    metrics.record(route, status, nbytes, seconds)
+    access_log.log(client_host, requestline, method, target, status, nbytes, seconds)
+
+
+def resolve_request(site, target, headers):
+    """Resolve a request, giving the metrics and search endpoints priority over site files."""
+    response = metrics.resolve(target)
+    if response is None:
+        response = search_endpoint.resolve(site, target)
+    if response is None:
+        response = site.resolve(target, headers)
+    return response
+
+
 class QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    """HTTP request handler that suppresses broken pipe errors."""
+    """
+    HTTP request handler that suppresses broken pipe errors and serves
+    files through a StaticSite (compression, caching headers, ranges).
+    """
+    
+    def send_head(self):
+        """
+        Resolve the request through the server's StaticSite and send the
+        response headers. Directory listings are left to SimpleHTTPRequestHandler.
+        """
+        site = getattr(self.server, 'site', None)
+        if site is None:
+            site = StaticSite(self.directory)
+        response = resolve_request(site, self.path, self.headers)
+        if response is None:
+            return super().send_head()
+        
+        try:
+            self.send_response(response.status)
+            for name, value in response.headers:
+                self.send_header(name, value)
+            self.end_headers()
+        except:
+            response.close()
+            raise
+        if isinstance(response.body, bytes):
+            return io.BytesIO(response.body)
+        return response.body
     
-    def log_message(self, format, *args):
-        """Override to suppress broken pipe errors."""
-        # Check if this is a broken pipe error
-        if 'Broken pipe' in str(args):
-            return  # Silently ignore broken pipe errors
-        super().log_message(format, *args)
+    def send_response(self, code, message=None):
+        """Remember the status code for metrics and the access log."""
+        self._status = int(code)
+        super().send_response(code, message)
+    
+    def send_header(self, keyword, value):
+        """Remember Content-Length for metrics and the access log."""
+        if keyword.lower() == 'content-length':
+            self._length = int(value)
+        super().send_header(keyword, value)
+    
+    def log_request(self, code='-', size='-'):
+        """Access lines are written by handle_one_request, once the body is sent."""
+        pass
     
     def finish(self):
         """Override finish to catch and ignore broken pipe errors."""
@@ -56,28 +1587,47 @@ class QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             super().finish()
         except (BrokenPipeError, OSError):
             # Client disconnected, ignore silently
-            pass
+            metrics.record_disconnect()
     
     def handle_one_request(self):
-        """Override to catch broken pipe errors during request handling."""
+        """
+        Override to catch broken pipe errors during request handling and to
+        record each request's status, size and latency.
+        """
+        started = time.perf_counter()
+        self._status = None
+        self._length = 0
         try:
             super().handle_one_request()
         except (BrokenPipeError, OSError):
             # Client disconnected, ignore silently
-            pass
+            metrics.record_disconnect()
+        finally:
+            if self._status is not None:
+                nbytes = 0 if self.command == 'HEAD' else self._length
+                record_request(self.client_address[0], self.requestline, self.command,
+                               getattr(self, 'path', None), self._status, nbytes,
+                               time.perf_counter() - started)
     
     def copyfile(self, source, outputfile):
-        """Override copyfile to catch broken pipe errors when sending files."""
+        """
+        Override copyfile to send file bodies with zero-copy sendfile and
+        to catch broken pipe errors when sending files.
+        """
         try:
-            super().copyfile(source, outputfile)
+            if isinstance(source, FileBody):
+                source.send_to(self.connection, outputfile)
+            else:
+                super().copyfile(source, outputfile)
         except (BrokenPipeError, OSError):
             # Client disconnected while sending file, ignore silently
-            pass
+            metrics.record_disconnect()
 
 class QuietThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """Threading TCP server that suppresses broken pipe errors."""
     
     allow_reuse_address = True  # Allow reusing the address/port
+    request_queue_size = 128  # Listen backlog; the socketserver default of 5 drops bursts
     
     def finish_request(self, request, client_address):
         """Override to catch and suppress broken pipe errors."""
@@ -95,24 +1645,460 @@ class QuietThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServe
             # Client disconnected, ignore silently
             pass
 
+# Largest request head (request line + headers) the asyncio engine accepts
+MAX_REQUEST_HEAD = 64 * 1024
+
+# Errors that just mean the client went away; never worth logging
+CLIENT_DISCONNECT_ERRORS = (
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    asyncio.IncompleteReadError,
+)
+
+
+class AsyncHTTPServer:
+    """
+    asyncio serving engine for a StaticSite.
+    Speaks HTTP/1.1 with persistent connections: requests on a connection are
+    parsed one at a time from the stream buffer, so pipelined requests are
+    answered in order. Requests are resolved on the default thread pool (the
+    StaticSite is thread-safe, as the threading engine relies on), so the
+    event loop only parses requests and writes responses. Once
+    max_connections are open, further connections get an immediate 503 and
+    are closed, and idle connections are closed after idle_timeout seconds.
+    """
+    
+    server_version = "QuietAsyncHTTP/" + http.server.__version__
+    sys_version = "Python/" + sys.version.split()[0]
+    
+    def __init__(self, site, max_connections=256, idle_timeout=15.0):
+        self.site = site
+        self.idle_timeout = idle_timeout
+        self.max_connections = max_connections
+        self._active = 0
+    
+    async def start(self, host, port, reuse_port=False):
+        """Bind and start listening; returns the asyncio Server."""
+        return await asyncio.start_server(
+            self.handle_connection, host or None, port, limit=MAX_REQUEST_HEAD,
+            reuse_port=reuse_port or None)
+    
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until it closes or goes idle."""
+        peer = writer.get_extra_info('peername')
+        client_host = peer[0] if peer else '-'
+        # Over the limit: answer right away instead of leaving the socket stalled
+        overloaded = self._active >= self.max_connections
+        self._active += 1
+        try:
+            if overloaded:
+                await asyncio.wait_for(self.send_overloaded(writer, client_host), self.idle_timeout)
+            else:
+                keep_alive = True
+                while keep_alive:
+                    keep_alive = await self.handle_one_request(reader, writer, client_host)
+        except CLIENT_DISCONNECT_ERRORS:
+            # Client disconnected, ignore silently
+            metrics.record_disconnect()
+        except asyncio.TimeoutError:
+            # Idle keep-alive connection, close it
+            pass
+        finally:
+            self._active -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, *CLIENT_DISCONNECT_ERRORS):
+                pass
+    
+    async def send_overloaded(self, writer, client_host):
+        """503 for a connection over max_connections, without reading its request."""
+        response = StaticResponse.error(HTTPStatus.SERVICE_UNAVAILABLE, "Too many connections")
+        response.headers.append(("Retry-After", "1"))
+        await self.send_response(writer, client_host, '-', response, keep_alive=False,
+                                 started=time.perf_counter())
+    
+    async def handle_one_request(self, reader, writer, client_host):
+        """
+        Read, resolve and answer a single request.
+        Returns True if the connection should be kept open for another request.
+        """
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                await self.send_error(writer, client_host, '-', HTTPStatus.BAD_REQUEST)
+            return False
+        except asyncio.LimitOverrunError:
+            await self.send_error(writer, client_host, '-',
+                                  HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            return False
+        started = time.perf_counter()
+        
+        request_line, _, header_block = head.partition(b'\r\n')
+        requestline = request_line.decode('iso-8859-1').rstrip('\r\n')
+        words = requestline.split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            await self.send_error(writer, client_host, requestline, HTTPStatus.BAD_REQUEST,
+                                  started=started)
+            return False
+        method, target, version = words
+        try:
+            headers = http.client.parse_headers(io.BytesIO(header_block))
+        except http.client.HTTPException:
+            await self.send_error(writer, client_host, requestline, HTTPStatus.BAD_REQUEST,
+                                  started=started, method=method, target=target)
+            return False
+        
+        connection = headers.get('Connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+        
+        # Request bodies are not used, but must be consumed to find the next request
+        if headers.get('Transfer-Encoding'):
+            await self.send_error(writer, client_host, requestline, HTTPStatus.NOT_IMPLEMENTED,
+                                  started=started, method=method, target=target)
+            return False
+        try:
+            content_length = int(headers.get('Content-Length', 0))
+        except ValueError:
+            await self.send_error(writer, client_host, requestline, HTTPStatus.BAD_REQUEST,
+                                  started=started, method=method, target=target)
+            return False
+        if content_length:
+            await asyncio.wait_for(reader.readexactly(content_length), self.idle_timeout)
+        
+        if method not in ('GET', 'HEAD'):
+            await self.send_error(writer, client_host, requestline, HTTPStatus.NOT_IMPLEMENTED,
+                                  keep_alive=keep_alive, started=started,
+                                  method=method, target=target)
+            return keep_alive
+        
+        # Resolving opens, stats and reads files, may compress them on the fly
+        # and may load or query the search index, so it runs on a worker thread
+        # to keep one slow request from stalling every other connection
+        response = await asyncio.to_thread(resolve_request, self.site, target, headers)
+        if response is None:
+            # Directory without an index page; listings are threading-engine only
+            response = StaticResponse.error(HTTPStatus.NOT_FOUND, "File not found")
+        try:
+            await self.send_response(writer, client_host, requestline, response,
+                                     keep_alive, send_body=(method != 'HEAD'),
+                                     started=started, method=method, target=target)
+        finally:
+            response.close()
+        return keep_alive
+    
+    async def send_response(self, writer, client_host, requestline, response,
+                            keep_alive, send_body=True, started=None, method=None, target=None):
+        """
+        Write the status line, headers and (unless HEAD) the body, then
+        record the request in the metrics and the access log.
+        """
+        status = HTTPStatus(response.status)
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Server: {self.server_version} {self.sys_version}",
+            f"Date: {email.utils.formatdate(usegmt=True)}",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in response.headers)
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'strict'))
+        
+        body = response.body
+        if send_body and body is not None:
+            if isinstance(body, FileBody):
+                await body.send_async(writer)
+            else:
+                writer.write(body)
+        await writer.drain()
+        
+        nbytes = 0
+        if send_body:
+            nbytes = int(dict(response.headers).get("Content-Length", 0))
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        record_request(client_host, requestline, method, target, status.value, nbytes, elapsed)
+    
+    async def send_error(self, writer, client_host, requestline, status, keep_alive=False,
+                         started=None, method=None, target=None):
+        await self.send_response(writer, client_host, requestline,
+                                 StaticResponse.error(status), keep_alive,
+                                 started=started, method=method, target=target)
+
+
+def serve_threading(args, port, worker=False):
+    """
+    Serve with QuietThreadingTCPServer until interrupted.
+    Prefork workers bind with SO_REUSEPORT and leave announcements to the supervisor.
+    """
+    # The handler's own directory is used for listings, so it must be --directory too
+    handler = functools.partial(QuietHTTPRequestHandler, directory=args.directory)
+    httpd = QuietThreadingTCPServer((args.bind, port), handler, bind_and_activate=False)
+    httpd.allow_reuse_port = worker
+    try:
+        httpd.server_bind()
+        httpd.server_activate()
+    except:
+        httpd.server_close()
+        raise
+    httpd.site = make_site(args)
+    if not worker:
+        print(f"Serving HTTP on :: port {port} (http://[::]:{port}/) ...")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        if not worker:
+            print("\nShutting down server...")
+        httpd.shutdown()
+        httpd.server_close()
+        sys.exit(0)
+
+
+def serve_asyncio(args, port, worker=False):
+    """
+    Serve with AsyncHTTPServer until interrupted.
+    Prefork workers bind with SO_REUSEPORT and leave announcements to the supervisor.
+    """
+    async def run():
+        engine = AsyncHTTPServer(make_site(args),
+                                 max_connections=args.max_connections,
+                                 idle_timeout=args.idle_timeout)
+        server = await engine.start(args.bind, port, reuse_port=worker)
+        if not worker:
+            print(f"Serving HTTP/1.1 (asyncio) on :: port {port} (http://[::]:{port}/) ...")
+        async with server:
+            await server.serve_forever()
+    
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        if not worker:
+            print("\nShutting down server...")
+        sys.exit(0)
+
+
+def raise_keyboard_interrupt(signum, frame):
+    """Signal handler that turns SIGTERM into the same clean exit as Ctrl-C."""
+    raise KeyboardInterrupt
+
+
+class PreforkSupervisor:
+    """
+    Runs a serving engine in N forked worker processes sharing one port.
+    Each worker opens its own SO_REUSEPORT listening socket, so the kernel
+    balances new connections across them and each worker has its own GIL.
+    Workers that die are restarted (with a back-off if they die right after
+    starting); SIGTERM/SIGINT stop all workers gracefully.
+    """
+    
+    # Seconds a worker must stay up for its exit not to count as a crash loop
+    MIN_WORKER_UPTIME = 1.0
+    
+    # Seconds to wait for workers to finish in-flight requests on shutdown
+    SHUTDOWN_TIMEOUT = 10.0
+    
+    def __init__(self, serve, args, port, workers):
+        self.serve = serve
+        self.args = args
+        self.port = port
+        self.num_workers = workers
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+        self.reservation = None
+        self.metrics_dir = None
+    
+    def reserve_port(self):
+        """
+        Claim the port for the worker group.
+        A plain bind first detects a port held by any other server; the
+        reservation socket is then bound with SO_REUSEPORT but never listens,
+        so it keeps the port without receiving any connections itself.
+        """
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            probe.bind((self.args.bind, self.port))
+        finally:
+            probe.close()
+        
+        reservation = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            reservation.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            reservation.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            reservation.bind((self.args.bind, self.port))
+        except:
+            reservation.close()
+            raise
+        self.reservation = reservation
+    
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker()  # never returns
+        self.workers[pid] = time.monotonic()
+    
+    def run_worker(self):
+        """Child process body: serve until signalled, then exit without returning."""
+        code = 1
+        try:
+            self.reservation.close()
+            signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+            signal.signal(signal.SIGINT, raise_keyboard_interrupt)
+            if self.metrics_dir is not None:
+                metrics.share(self.metrics_dir)
+            self.serve(self.args, self.port, worker=True)
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except KeyboardInterrupt:
+            code = 0
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            # A second stop signal must not interrupt the flushing below
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            # os._exit skips atexit, so flush buffered access log lines and
+            # the final metrics snapshot by hand
+            try:
+                metrics.publish()
+            except OSError:
+                pass
+            access_log.flush()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    
+    def handle_stop_signal(self, signum, frame):
+        if not self.stopping:
+            self.stopping = True
+            print("\nShutting down workers...")
+            self.signal_workers(signal.SIGTERM)
+    
+    def signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+    
+    def reap(self):
+        """Collect exited workers; returns a list of (pid, uptime, exit code)."""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is not None:
+                exited.append((pid, time.monotonic() - started, os.waitstatus_to_exitcode(status)))
+        return exited
+    
+    def run(self):
+        self.reserve_port()
+        if metrics.endpoints_enabled:
+            # Workers publish their metrics here so any of them can report the total
+            self.metrics_dir = tempfile.mkdtemp(prefix='nevisa-metrics-')
+        signal.signal(signal.SIGTERM, self.handle_stop_signal)
+        signal.signal(signal.SIGINT, self.handle_stop_signal)
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        print(f"Serving HTTP on :: port {self.port} (http://[::]:{self.port}/) "
+              f"with {self.num_workers} {self.args.engine} workers ...")
+        
+        stop_deadline = None
+        while self.workers:
+            for pid, uptime, code in self.reap():
+                if self.stopping:
+                    continue
+                print(f"Worker {pid} exited with code {code}; restarting", file=sys.stderr)
+                if uptime < self.MIN_WORKER_UPTIME:
+                    # Avoid a hot fork loop when workers crash on startup
+                    time.sleep(self.MIN_WORKER_UPTIME)
+                self.spawn_worker()
+            
+            if self.stopping:
+                if stop_deadline is None:
+                    stop_deadline = time.monotonic() + self.SHUTDOWN_TIMEOUT
+                elif time.monotonic() > stop_deadline:
+                    self.signal_workers(signal.SIGKILL)
+            time.sleep(0.1)
+        
+        self.reservation.close()
+        if self.metrics_dir is not None:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        sys.exit(0)
+
+
+def serve_prefork(args, port):
+    """Serve with a pool of args.workers forked processes sharing the port."""
+    PreforkSupervisor(ENGINES[args.engine], args, port, args.workers).run()
+
+
+ENGINES = {
+    'threading': serve_threading,
+    'asyncio': serve_asyncio,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the generated website locally.")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='threading',
+                        help="serving engine (default: threading)")
+    parser.add_argument('--port', type=int, default=8000,
+                        help="first port to try; the next 9 are tried if it is busy (default: 8000)")
+    parser.add_argument('--bind', default='',
+                        help="address to bind to (default: all interfaces)")
+    parser.add_argument('--directory', default=os.getcwd(),
+                        help="directory to serve (default: current directory)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes sharing the port via SO_REUSEPORT; "
+                             "/__stats and /__metrics report all workers combined (default: 1)")
+    parser.add_argument('--preload', action='store_true',
+                        help="serve from an in-memory snapshot of the site, reloaded when files change")
+    parser.add_argument('--watch-interval', type=float, default=1.0,
+                        help="--preload without inotify: seconds between change scans (default: 1)")
+    parser.add_argument('--access-log', choices=['common', 'json', 'off'], default='common',
+                        help="access log format written to stderr (default: common)")
+    parser.add_argument('--no-stats', action='store_true',
+                        help="disable the /__stats (JSON) and /__metrics (Prometheus) endpoints")
+    parser.add_argument('--max-connections', type=int, default=256,
+                        help="asyncio engine: maximum concurrent connections (default: 256)")
+    parser.add_argument('--idle-timeout', type=float, default=15.0,
+                        help="asyncio engine: seconds before an idle connection is closed (default: 15)")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and not (hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT')):
+        parser.error("--workers requires a platform with fork() and SO_REUSEPORT")
+    return args
+
+
 if __name__ == '__main__':
-    PORT = 8000
+    args = parse_args()
+    access_log.format = args.access_log
+    metrics.endpoints_enabled = not args.no_stats
+    serve = ENGINES[args.engine] if args.workers == 1 else serve_prefork
+    # Let SIGTERM shut the server down as cleanly as Ctrl-C
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+    PORT = args.port
     
-    # Try to find an available port starting from 8000
+    # Try to find an available port starting from the requested one
     port = PORT
     while port < PORT + 10:
         try:
-            httpd = QuietThreadingTCPServer(("", port), QuietHTTPRequestHandler)
-            print(f"Serving HTTP on :: port {port} (http://[::]:{port}/) ...")
-            try:
-                httpd.serve_forever()
-            except KeyboardInterrupt:
-                print("\nShutting down server...")
-                httpd.shutdown()
-                sys.exit(0)
+            serve(args, port)
             break
         except OSError as e:
-            if e.errno == 48:  # Address already in use
+            if e.errno == errno.EADDRINUSE:  # Address already in use
                 if port == PORT:
                     print(f"Port {port} is already in use. Trying next available port...", file=sys.stderr)
                 port += 1
@@ -122,4 +2108,3 @@ if __name__ == '__main__':
     else:
         print(f"Error: Could not find an available port in range {PORT}-{PORT + 9}", file=sys.stderr)
         sys.exit(1)
-
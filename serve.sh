@@ -1,3 +1,4 @@
 SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
 cd "$SCRIPT_DIR/output/site"
-python3 "$SCRIPT_DIR/serve.py"
+# Extra arguments are passed to serve.py, e.g. ./serve.sh --engine asyncio
+python3 "$SCRIPT_DIR/serve.py" "$@"
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the asyncio serving engine of serve.py.
+
+Run with: python3 -m unittest discover tests
+"""
+import asyncio
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serve  # noqa: E402
+
+# Seconds the slow request blocks its thread; the fast one must finish well before
+SLOW_SECONDS = 1.0
+
+
+class SlowSite(serve.StaticSite):
+    """StaticSite whose /slow.html blocks like a large on-the-fly compression."""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.slow_started = threading.Event()
+
+    def resolve(self, target, headers):
+        if target.startswith('/slow'):
+            self.slow_started.set()
+            time.sleep(SLOW_SECONDS)
+        return super().resolve(target, headers)
+
+
+def fetch(port, path):
+    """GET path over a new connection; returns (status, seconds taken)."""
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', path, headers={'Connection': 'close'})
+        response = connection.getresponse()
+        response.read()
+    finally:
+        connection.close()
+    return response.status, time.perf_counter() - started
+
+
+class AsyncEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for name in ('slow.html', 'fast.html'):
+            with open(os.path.join(self.tmp.name, name), 'w', encoding='utf-8') as f:
+                f.write('<html><body>' + 'سلام ' * 2000 + '</body></html>')
+        self.site = SlowSite(self.tmp.name)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(setattr, serve.access_log, 'format', serve.access_log.format)
+        serve.access_log.format = 'off'
+
+    def serve_in_thread(self):
+        """Run an AsyncHTTPServer on its own event loop thread; returns its port."""
+        loop = asyncio.new_event_loop()
+        engine = serve.AsyncHTTPServer(self.site)
+        server = loop.run_until_complete(engine.start('127.0.0.1', 0))
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def shutdown():
+            server.close()
+            # The clients have closed their connections; let the handlers see it
+            connections = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if connections:
+                await asyncio.wait(connections, timeout=5)
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.addCleanup(stop)
+        return server.sockets[0].getsockname()[1]
+
+    def test_slow_request_does_not_block_other_connections(self):
+        port = self.serve_in_thread()
+        slow = {}
+        slow_thread = threading.Thread(target=lambda: slow.update(result=fetch(port, '/slow.html')))
+        slow_thread.start()
+        # Only send the second request once the first one is blocking
+        self.assertTrue(self.site.slow_started.wait(5))
+        fast_status, fast_seconds = fetch(port, '/fast.html')
+        slow_thread.join()
+        slow_status, slow_seconds = slow['result']
+
+        self.assertEqual(slow_status, 200)
+        self.assertEqual(fast_status, 200)
+        self.assertGreaterEqual(slow_seconds, SLOW_SECONDS)
+        self.assertLess(fast_seconds, SLOW_SECONDS / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the request metrics of serve.py, in particular combining the
+snapshots of prefork workers.
+
+Run with: python3 -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serve  # noqa: E402
+
+
+class MetricsMergeTest(unittest.TestCase):
+
+    def test_merged_snapshots_sum_counters_and_latency(self):
+        first, second = serve.ServerMetrics(), serve.ServerMetrics()
+        for _ in range(90):
+            first.record('/index.html', 200, 100, 0.001)
+        for _ in range(10):
+            second.record('/index.html', 200, 100, 0.5)
+        second.record('/missing', 404, 0, 0.001)
+        second.record_disconnect()
+        snapshots = [first.snapshot(), second.snapshot()]
+        snapshots[1]['pid'] += 1
+
+        stats = serve.ServerMetrics.merged(snapshots).as_dict()
+        self.assertEqual(len(stats['workers']), 2)
+        self.assertEqual(stats['requests'], 101)
+        self.assertEqual(stats['bytes_out'], 10000)
+        self.assertEqual(stats['client_disconnects'], 1)
+        self.assertEqual(stats['status'], {'200': 100, '404': 1})
+        self.assertEqual(stats['routes']['/index.html'], {'requests': 100, 'bytes_out': 10000})
+        self.assertEqual(stats['latency_ms']['count'], 101)
+        # The slow tenth of the requests all came from the second worker
+        self.assertLess(stats['latency_ms']['p50'], 2)
+        self.assertGreater(stats['latency_ms']['p95'], 400)
+
+    def test_combined_reads_every_published_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other = serve.ServerMetrics()
+            other.record('/a', 200, 5, 0.01)
+            other.share_dir = directory
+            other.publish()
+            # The reporting worker has a different pid
+            os.replace(os.path.join(directory, f'{os.getpid()}.json'), os.path.join(directory, '1.json'))
+
+            local = serve.ServerMetrics()
+            local.share_dir = directory
+            local.record('/b', 200, 7, 0.01)
+            stats = local.combined().as_dict()
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['bytes_out'], 12)
+        self.assertEqual(sorted(stats['routes']), ['/a', '/b'])
+
+
+if __name__ == '__main__':
+    unittest.main()